@@ -0,0 +1,8 @@
+"""
+Build helpers for the blog posts.
+
+The posts under ``posts/*/index.py`` are jupytext percent scripts that Quarto
+normally executes one after another through Jupyter.  This package executes
+them directly (on the Agg backend) so that the build can be parallelized and
+instrumented.  Run ``python -m _blogbuild --help`` from the repository root.
+"""
@@ -0,0 +1,562 @@
+import argparse
+import sys
+from pathlib import Path
+
+from .posts import find_posts
+
+
+def cmd_render(args):
+    from .build import build
+
+    posts = find_posts(args.posts)
+    results = build(posts, jobs=args.jobs, dpi=args.dpi,
+                    use_cache=not args.no_cache, incremental=args.incremental,
+                    warm=not args.cold, lazy_imports=args.lazy_imports,
+                    trace_memory=args.trace_memory, draft=args.draft,
+                    profile=args.profile)
+    ok = sum(r["status"] == "ok" for r in results)
+    within = True
+    if args.budgets != "off" and not args.draft:
+        from .budgets import gate
+        within = gate(results, mode=args.budgets)
+    return 0 if ok == len(posts) and within else 1
+
+
+def cmd_budgets(args):
+    from .budgets import (HEADROOM, check, format_overrun, last_metrics,
+                          load_budgets, update_budgets)
+
+    names = [post.name for post in find_posts(args.posts)] if args.posts \
+        else None
+    metrics = last_metrics(names)
+    if args.update:
+        updated = update_budgets(metrics, headroom=args.headroom or HEADROOM)
+        print(f"updated the budgets of {len(updated)} of {len(metrics)} posts "
+              "(the others had errors or cached cells)")
+        return 0
+    budgets = load_budgets()
+    overruns = []
+    for post in metrics:
+        if post["name"] in budgets:
+            overruns += check(post, budgets[post["name"]])
+    for overrun in overruns:
+        print(format_overrun(overrun))
+    print(f"{len(overruns)} overruns in {len(metrics)} posts", file=sys.stderr)
+    return 1 if overruns else 0
+
+
+def cmd_importtime(args):
+    from .importtime import format_report, profile_post, write_report
+
+    for post in find_posts(args.posts):
+        report = profile_post(post, lazy=args.lazy)
+        write_report(report)
+        print(format_report(report, top=args.top))
+    return 0
+
+
+def cmd_bench(args):
+    from . import bench
+
+    baseline_file = args.baseline or bench.BASELINE_FILE
+    results = bench.run(find_posts(args.posts), repeat=args.repeat,
+                        dpis=args.dpi or bench.DPIS,
+                        formats=args.format or bench.FORMATS)
+    bench.save(results, bench.LATEST_FILE)
+    if args.save_baseline:
+        baseline = bench.load(baseline_file)
+        baseline.update(results)
+        bench.save(baseline, baseline_file)
+        print(f"saved the baseline to {baseline_file}")
+        return 0
+    regressions = bench.compare(results, bench.load(baseline_file),
+                                tolerance=args.tolerance)
+    for name, key, before, after in regressions:
+        if after is None:
+            print(f"REGRESSION {name} {key}: now fails")
+            continue
+        print(f"REGRESSION {name} {key}: {before * 1e3:.1f}ms -> "
+              f"{after * 1e3:.1f}ms ({after / before - 1:+.0%})")
+    return 1 if regressions else 0
+
+
+def cmd_index(args):
+    import json
+
+    from .listing import PostIndex
+
+    index = PostIndex()
+    changed = index.update()
+    if args.categories:
+        result = index.categories(drafts=args.drafts)
+    else:
+        result = index.listing(drafts=args.drafts, category=args.category)
+    if args.json:
+        print(json.dumps(result, indent=1))
+    elif args.categories:
+        for category, names in result.items():
+            print(f"{category} ({len(names)}): {', '.join(names)}")
+    else:
+        for name, meta in result:
+            flags = " [draft]" if meta["draft"] or meta["ignored"] else ""
+            print(f"{meta['isodate'] or '':10}  {name}: "
+                  f"{meta.get('title', '')}{flags}")
+    print(f"re-read {len(changed)} of {len(index.entries)} headers",
+          file=sys.stderr)
+    return 0
+
+
+def cmd_optimize_images(args):
+    from .images import optimize
+
+    optimize(args.paths or None, quantize=args.quantize, jobs=args.jobs)
+    return 0
+
+
+def cmd_export(args):
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .build import pool_context
+    from .displaylist import FORMATS, export_post
+
+    budget = None
+    if args.auto_rasterize or args.max_vertices or args.max_draws:
+        from .rasterize import MAX_DRAWS, MAX_VERTICES
+
+        budget = (args.max_vertices or MAX_VERTICES,
+                  args.max_draws or MAX_DRAWS)
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=pool_context(),
+                             max_tasks_per_child=1) as pool:
+        futures = [pool.submit(export_post, str(post.path),
+                               tuple(args.format or FORMATS), args.dpi,
+                               budget=budget)
+                   for post in find_posts(args.posts)]
+        for future in futures:
+            name, timings, rasterized = future.result()
+            print(f"{name}: " + ", ".join(f"{k} {v * 1e3:.0f}ms"
+                                          for k, v in timings.items()))
+            for kind, vertices, draws in rasterized:
+                print(f"  rasterized {kind} ({vertices} vertices, "
+                      f"{draws} draw calls)")
+    return 0
+
+
+def cmd_thumbnails(args):
+    from .thumbnails import THUMBNAIL_DPI, WIDTH, make_thumbnails
+
+    # The posts that set an image keep it.
+    posts = [post for post in find_posts(args.posts)
+             if "image" not in post.header()]
+    made = make_thumbnails(posts, jobs=args.jobs,
+                           dpi=args.dpi or THUMBNAIL_DPI,
+                           width=args.width or WIDTH)
+    return 0 if len(made) == len(posts) else 1
+
+
+def cmd_drawcalls(args):
+    import json
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .build import pool_context
+    from .drawcalls import account_post, format_rows
+
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=pool_context(),
+                             max_tasks_per_child=1) as pool:
+        futures = [pool.submit(account_post, str(post.path), args.dpi)
+                   for post in find_posts(args.posts)]
+        for future in futures:
+            name, rows = future.result()
+            if args.json:
+                print(json.dumps({"post": name, "rows": rows}))
+            else:
+                print(f"{name}:\n{format_rows(rows, top=args.top)}\n")
+    return 0
+
+
+def cmd_regress(args):
+    from .build import build, read_result
+    from .regress import (MAX_BAD_FRACTION, MIN_SSIM, TOLERANCE,
+                          check_results, update_golden)
+
+    posts = find_posts(args.posts)
+    if args.no_render:
+        results = [r for r in map(read_result, (p.name for p in posts))
+                   if r is not None]
+    else:
+        results = build(posts, jobs=args.jobs, dpi=args.dpi,
+                        use_cache=args.cache, freeze_dir=None, metrics=False)
+    if args.update:
+        n, refused = update_golden(results)
+        print(f"stored {n} golden images of "
+              f"{len(results) - len(refused)} posts")
+        rendered = {r["name"] for r in results}
+        refused += [p.name for p in posts if p.name not in rendered]
+        if refused:
+            print(f"not updated, as their render failed: {', '.join(refused)}")
+        return 1 if refused else 0
+    problems = check_results(
+        results, [p.name for p in posts], jobs=args.jobs,
+        tolerance=TOLERANCE if args.tolerance is None else args.tolerance,
+        max_bad=(MAX_BAD_FRACTION if args.max_bad is None
+                 else args.max_bad),
+        min_ssim=MIN_SSIM if args.min_ssim is None else args.min_ssim)
+    return 1 if problems else 0
+
+
+def cmd_prune_blobs(args):
+    from .blobs import prune
+
+    removed, size = prune(grace=args.grace)
+    print(f"removed {removed} unreferenced blobs ({size / 1e6:.1f} MB)")
+    return 0
+
+
+def cmd_precompress(args):
+    from .config import SITE_DIR
+    from .precompress import precompress
+
+    precompress(args.site or SITE_DIR, jobs=args.jobs)
+    return 0
+
+
+def cmd_publish(args):
+    from .config import SITE_DIR
+    from .publish import publish
+
+    changed, removed = publish(args.dest, site_dir=args.site or SITE_DIR,
+                               delete=not args.keep_removed,
+                               dry_run=args.dry_run or args.list)
+    if args.list:
+        for rel in changed:
+            print(rel)
+    elif args.dry_run:
+        for rel in changed:
+            print(f"copy {rel}")
+        for rel in removed:
+            print(f"remove {rel}")
+    return 0
+
+
+def cmd_animate(args):
+    from .animation import write_animation
+
+    write_animation(args.frames, args.nframes, args.output, fps=args.fps,
+                    dpi=args.dpi, loop=args.loop, jobs=args.jobs,
+                    buffer_size=args.buffer_size, warm=not args.cold)
+    return 0
+
+
+def cmd_queue(args):
+    from . import jobqueue
+
+    queue = jobqueue.open_queue(args.queue or jobqueue.QUEUE_FILE)
+    if args.action == "submit":
+        jobqueue.submit(queue, find_posts(args.posts), dpi=args.dpi,
+                        use_cache=not args.no_cache)
+    elif args.action == "work":
+        kwargs = dict(lease=args.lease, cache_dir=args.cache_dir,
+                      warm=not args.cold, exit_when_empty=not args.forever)
+        if args.jobs > 1:
+            jobqueue.work_locally(queue, args.jobs, **kwargs)
+        else:
+            jobqueue.work(queue, **kwargs)
+    elif args.action == "collect":
+        results = jobqueue.collect(queue)
+        return 0 if all(r["status"] == "ok" for r in results) else 1
+    print(", ".join(f"{n} {state}"
+                    for state, n in sorted(queue.counts().items())))
+    return 0
+
+
+def cmd_watch(args):
+    from .watch import watch
+
+    if args.posts:
+        find_posts(args.posts)  # fail early on unknown names
+    watch(args.posts, preview_dpi=args.preview_dpi, dpi=args.dpi,
+          use_cache=not args.no_cache, polling=args.poll)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m _blogbuild")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("render", help="execute posts in parallel")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the rendered figures (default: rcParams)")
+    p.add_argument("--no-cache", action="store_true",
+                   help="execute every cell instead of using the cell cache")
+    p.add_argument("--incremental", action="store_true",
+                   help="checkpoint the state between cells and only execute "
+                   "the cells affected by the changes since the last build")
+    p.add_argument("--cold", action="store_true",
+                   help="spawn fresh workers instead of forking them from a "
+                   "fork server with the posts' modules preloaded")
+    p.add_argument("--lazy-imports", action="store_true",
+                   help="make the imports of the mpl-* packages lazy (only "
+                   "useful with --cold, as the fork server imports them)")
+    p.add_argument("--trace-memory", action="store_true",
+                   help="record the peak memory allocated by each cell "
+                   "(slower)")
+    p.add_argument("--draft", action="store_true",
+                   help="render quickly at a low dpi, with vector stand-ins "
+                   "for the image effects, to check the layout")
+    p.add_argument("--profile", action="store_true",
+                   help="sample the stack while the cells run and write "
+                   "flame graphs to _build/profiles (collapsed stacks; "
+                   "cached cells are not run, see --no-cache)")
+    p.add_argument("--budgets", choices=["warn", "fail", "off"],
+                   default="warn",
+                   help="what to do about the posts over their budgets in "
+                   "budgets.json (default: warn)")
+    p.set_defaults(func=cmd_render)
+
+    p = subparsers.add_parser(
+        "budgets", help="check the last build against the budgets of the "
+        "posts")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--update", action="store_true",
+                   help="set the budgets from the last build instead")
+    p.add_argument("--headroom", type=float, default=None,
+                   help="factor applied to the measurements with --update "
+                   "(default: 1.5)")
+    p.set_defaults(func=cmd_budgets)
+
+    p = subparsers.add_parser(
+        "importtime", help="report the import time of each cell")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--lazy", action="store_true",
+                   help="make the imports of the mpl-* packages lazy")
+    p.add_argument("--top", type=int, default=3,
+                   help="number of modules to show per cell")
+    p.set_defaults(func=cmd_importtime)
+
+    p = subparsers.add_parser(
+        "bench", help="benchmark the headline figure of each post")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--repeat", type=int, default=7,
+                   help="number of timed repetitions of each measurement")
+    p.add_argument("--dpi", type=float, action="append",
+                   help="dpi to measure at (repeatable; default: 100 and 200)")
+    p.add_argument("--format", action="append",
+                   help="savefig format (repeatable; default: png, svg, pdf)")
+    p.add_argument("--baseline", type=Path, default=None,
+                   help="baseline file (default: _build/benchmarks/baseline.json)")
+    p.add_argument("--save-baseline", action="store_true",
+                   help="store the results as the new baseline")
+    p.add_argument("--tolerance", type=float, default=0.1,
+                   help="allowed slowdown relative to the baseline")
+    p.set_defaults(func=cmd_bench)
+
+    p = subparsers.add_parser(
+        "index", help="list the posts from the metadata in their headers")
+    p.add_argument("--drafts", action="store_true",
+                   help="include the drafts and the ignored posts")
+    p.add_argument("--category", default=None,
+                   help="only list the posts of this category")
+    p.add_argument("--categories", action="store_true",
+                   help="list the categories and their posts instead")
+    p.add_argument("--json", action="store_true",
+                   help="print the result as JSON")
+    p.set_defaults(func=cmd_index)
+
+    p = subparsers.add_parser(
+        "optimize-images",
+        help="recompress the PNGs and GIFs of the rendered site")
+    p.add_argument("paths", nargs="*", type=Path,
+                   help="PNG and GIF files (default: all those under _site)")
+    p.add_argument("--quantize", action="store_true",
+                   help="also quantize images with more than 256 colors to "
+                   "a palette (lossy)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.set_defaults(func=cmd_optimize_images)
+
+    p = subparsers.add_parser(
+        "export", help="write the headline figure of posts in several "
+        "formats from a single draw")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--format", action="append",
+                   help="format (repeatable; default: png, svg, pdf)")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the figures (default: rcParams)")
+    p.add_argument("--auto-rasterize", action="store_true",
+                   help="rasterize the artists over the budget in the "
+                   "vector formats")
+    p.add_argument("--max-vertices", type=int, default=None,
+                   help="vertex budget of an artist (implies "
+                   "--auto-rasterize; default: 5000)")
+    p.add_argument("--max-draws", type=int, default=None,
+                   help="draw call budget of an artist, path effects "
+                   "included (implies --auto-rasterize; default: 50)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser(
+        "thumbnails", help="render thumbnails of the headline figures for "
+        "the listing")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the rendered figures (default: 40)")
+    p.add_argument("--width", type=int, default=None,
+                   help="maximum width of the thumbnails, in pixels "
+                   "(default: 400)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.set_defaults(func=cmd_thumbnails)
+
+    p = subparsers.add_parser(
+        "drawcalls", help="count the draw calls of the headline figure of "
+        "posts, per artist and path effect chain")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the figures (default: rcParams)")
+    p.add_argument("--top", type=int, default=20,
+                   help="number of rows to print (default: %(default)s)")
+    p.add_argument("--json", action="store_true",
+                   help="print all the rows of each post as a JSON line")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.set_defaults(func=cmd_drawcalls)
+
+    p = subparsers.add_parser(
+        "regress", help="render the posts and compare their images with "
+        "golden copies")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--update", action="store_true",
+                   help="store the images as the new golden copies")
+    p.add_argument("--cache", action="store_true",
+                   help="serve the cells from the cell cache when possible")
+    p.add_argument("--no-render", action="store_true",
+                   help="compare the images of the last build")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the rendered figures (default: rcParams)")
+    p.add_argument("--tolerance", type=int, default=None,
+                   help="difference of a channel (out of 255) above which "
+                   "a pixel differs (default: 8)")
+    p.add_argument("--max-bad", type=float, default=None,
+                   help="fraction of differing pixels above which an image "
+                   "fails (default: 0.001)")
+    p.add_argument("--min-ssim", type=float, default=None,
+                   help="structural similarity below which an image fails "
+                   "(default: 0.98)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.set_defaults(func=cmd_regress)
+
+    p = subparsers.add_parser(
+        "prune-blobs",
+        help="remove the stored images that no cell output refers to")
+    p.add_argument("--grace", type=float, default=3600,
+                   help="keep the blobs written less than this many seconds "
+                   "ago (default: 3600)")
+    p.set_defaults(func=cmd_prune_blobs)
+
+    p = subparsers.add_parser(
+        "precompress", help="write .gz and .br siblings of the text files of "
+        "the site")
+    p.add_argument("--site", type=Path, default=None,
+                   help="rendered site (default: _site)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.set_defaults(func=cmd_precompress)
+
+    p = subparsers.add_parser(
+        "publish", help="copy the files of the site that changed since the "
+        "last publication")
+    p.add_argument("dest", type=Path, help="directory to publish to")
+    p.add_argument("--site", type=Path, default=None,
+                   help="rendered site (default: _site)")
+    p.add_argument("--keep-removed", action="store_true",
+                   help="do not delete the files removed from the site")
+    p.add_argument("-n", "--dry-run", action="store_true",
+                   help="only print the files to copy and remove")
+    p.add_argument("--list", action="store_true",
+                   help="only print the paths of the new and changed files")
+    p.set_defaults(func=cmd_publish)
+
+    p = subparsers.add_parser(
+        "animate", help="render an animation in parallel")
+    p.add_argument("frames",
+                   help="frame function, as <module or path.py>:<function>, "
+                   "called with the frame number")
+    p.add_argument("nframes", type=int, help="number of frames")
+    p.add_argument("output", type=Path,
+                   help="output file (.gif, .png/.apng or .mp4)")
+    p.add_argument("--fps", type=float, default=10,
+                   help="frames per second")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the frames (default: the figure's)")
+    p.add_argument("--loop", type=int, default=0,
+                   help="number of loops of GIF/APNG output (0: forever)")
+    p.add_argument("-j", "--jobs", type=int, default=None,
+                   help="number of worker processes (default: cpu count)")
+    p.add_argument("--buffer-size", type=int, default=None,
+                   help="maximum number of frames in flight or waiting to "
+                   "be written (default: twice the number of workers)")
+    p.add_argument("--cold", action="store_true",
+                   help="spawn fresh workers instead of forking them from "
+                   "the fork server")
+    p.set_defaults(func=cmd_animate)
+
+    p = subparsers.add_parser(
+        "queue", help="build through a job queue shared by several workers")
+    p.add_argument("action", choices=["submit", "work", "collect", "status"])
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories to submit "
+                   "(default: all)")
+    p.add_argument("--queue", type=Path, default=None,
+                   help="queue: a .sqlite/.db file or a directory "
+                   "(default: _build/queue.sqlite)")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the rendered figures (default: rcParams)")
+    p.add_argument("--no-cache", action="store_true",
+                   help="execute every cell instead of using the cell cache")
+    p.add_argument("-j", "--jobs", type=int, default=1,
+                   help="number of local workers")
+    p.add_argument("--lease", type=float, default=600,
+                   help="seconds after which the job of a silent worker is "
+                   "handed to another one")
+    p.add_argument("--cache-dir", type=Path, default=None,
+                   help="cell cache the workers read and write (default: "
+                   "_build/cache/cells)")
+    p.add_argument("--cold", action="store_true",
+                   help="spawn fresh workers instead of forking them from "
+                   "the fork server")
+    p.add_argument("--forever", action="store_true",
+                   help="keep waiting for jobs when the queue is empty")
+    p.set_defaults(func=cmd_queue)
+
+    p = subparsers.add_parser(
+        "watch", help="re-render posts when they are edited")
+    p.add_argument("posts", nargs="*",
+                   help="names of the post directories (default: all)")
+    p.add_argument("--preview-dpi", type=float, default=40,
+                   help="dpi of the preview rendered first")
+    p.add_argument("--dpi", type=float, default=None,
+                   help="dpi of the full render (default: rcParams)")
+    p.add_argument("--no-cache", action="store_true",
+                   help="do not use the cell cache for the full render")
+    p.add_argument("--poll", action="store_true",
+                   help="poll the post directories instead of using inotify")
+    p.set_defaults(func=cmd_watch)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
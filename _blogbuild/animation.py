@@ -0,0 +1,322 @@
+"""
+Rendering animations in parallel, with a bounded memory footprint.
+
+An animation is given as a frame function, ``"path/to/module.py:function"``
+(or ``"module:function"``), called with the frame number in the worker
+processes; it returns the figure to draw (or an RGBA array).  A frame
+function may keep its figure around between calls, but each worker gets a
+different subset of the frames.
+
+The workers draw the frames and return them raw, with their digest.  The
+parent receives them out of order, keeps at most *buffer_size* frames in
+flight or waiting in a reorder buffer, and goes through them in order.  A
+frame identical to the previous one is neither encoded nor written; the
+previous frame is shown longer instead (MP4 has a constant frame rate, so
+the previous frame is repeated).  The other frames are encoded in the pool
+as well (a single-frame GIF or PNG; MP4 frames are sent raw to ffmpeg), at
+most *buffer_size* at a time, and streamed in order to the writer.
+"""
+
+import collections
+import hashlib
+import importlib
+import importlib.util
+import io
+import os
+import struct
+import subprocess
+import zlib
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                wait)
+from pathlib import Path
+
+FORMATS = ("gif", "png", "apng", "mp4")
+
+_frame_functions = {}
+
+
+def load_frame_function(spec):
+    """
+    Return the function named by *spec*, ``"<module or path>:<function>"``.
+    """
+    if spec in _frame_functions:
+        return _frame_functions[spec]
+    module_name, _, function = spec.rpartition(":")
+    if module_name.endswith(".py"):
+        path = Path(module_name).resolve()
+        loader_spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(loader_spec)
+        # The module may read data files next to it.
+        cwd = os.getcwd()
+        os.chdir(path.parent)
+        try:
+            loader_spec.loader.exec_module(module)
+        finally:
+            os.chdir(cwd)
+    else:
+        module = importlib.import_module(module_name)
+    _frame_functions[spec] = func = getattr(module, function)
+    return func
+
+
+def _rgba(frame, dpi):
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    if isinstance(frame, Figure):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        # A figure made with Figure() has a canvas that cannot draw.
+        if not isinstance(frame.canvas, FigureCanvasAgg):
+            FigureCanvasAgg(frame)
+        if dpi is not None:
+            frame.set_dpi(dpi)
+        frame.canvas.draw()
+        return np.array(frame.canvas.buffer_rgba())
+    return np.ascontiguousarray(frame, dtype=np.uint8)
+
+
+def _encode(rgba, fmt):
+    from PIL import Image
+
+    if fmt == "mp4":
+        return rgba.tobytes()
+    buf = io.BytesIO()
+    if fmt == "gif":
+        Image.fromarray(rgba).convert("RGB").quantize(256).save(buf, "GIF")
+    else:
+        Image.fromarray(rgba, "RGBA").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def render_frame(spec, i, dpi=None):
+    """
+    Draw frame *i* of the animation *spec* and return ``(i, size, digest,
+    RGBA array)``.
+    """
+    from .fonts import use_snapshot
+    from .runner import use_agg
+
+    use_snapshot()
+    use_agg()
+    rgba = _rgba(load_frame_function(spec)(i), dpi)
+    digest = hashlib.sha256(rgba.tobytes()).hexdigest()
+    return i, (rgba.shape[1], rgba.shape[0]), digest, rgba
+
+
+def _chunks(png):
+    pos = 8
+    while pos < len(png):
+        length, kind = struct.unpack(">I4s", png[pos:pos + 8])
+        yield kind, png[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data +
+            struct.pack(">I", zlib.crc32(kind + data)))
+
+
+class APNGWriter:
+    """
+    Write an animated PNG frame by frame, from single-frame PNGs.
+    """
+
+    def __init__(self, path, size, loop=0):
+        self.file = open(path, "wb")
+        self.size = size
+        self.loop = loop
+        self.frames = 0
+        self.sequence = 0
+        self._actl = None
+
+    def add(self, png, duration):
+        chunks = list(_chunks(png))
+        if self.frames == 0:
+            self.file.write(b"\x89PNG\r\n\x1a\n")
+            self.file.write(_chunk(b"IHDR", chunks[0][1]))
+            # The number of frames is patched in when closing.
+            self._actl = self.file.tell()
+            self.file.write(_chunk(b"acTL", struct.pack(">II", 0, self.loop)))
+        self.file.write(_chunk(b"fcTL", struct.pack(
+            ">IIIIIHHBB", self.sequence, *self.size, 0, 0,
+            min(round(duration), 0xffff), 1000, 0, 0)))
+        self.sequence += 1
+        for kind, data in chunks:
+            if kind != b"IDAT":
+                continue
+            if self.frames == 0:
+                self.file.write(_chunk(b"IDAT", data))
+            else:
+                self.file.write(_chunk(
+                    b"fdAT", struct.pack(">I", self.sequence) + data))
+                self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        self.file.write(_chunk(b"IEND", b""))
+        if self._actl is not None:
+            self.file.seek(self._actl)
+            self.file.write(_chunk(b"acTL",
+                                   struct.pack(">II", self.frames, self.loop)))
+        self.file.close()
+
+
+class GIFWriter:
+    """
+    Write an animated GIF frame by frame, from single-frame GIFs, each frame
+    keeping its own palette.
+    """
+
+    def __init__(self, path, size, loop=0):
+        self.file = open(path, "wb")
+        self.file.write(b"GIF89a" + struct.pack("<HHBBB", *size, 0, 0, 0))
+        self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" +
+                        struct.pack("<H", loop) + b"\x00")
+
+    @staticmethod
+    def _split(gif):
+        # Return the global color table and the image block of a GIF.
+        packed = gif[10]
+        pos = 13
+        table = b""
+        if packed & 0x80:
+            table = gif[pos:pos + 3 * 2 ** ((packed & 7) + 1)]
+            pos += len(table)
+        while gif[pos] == 0x21:  # extension blocks
+            pos += 2
+            while gif[pos]:
+                pos += gif[pos] + 1
+            pos += 1
+        return packed & 7, table, gif[pos:-1]  # without the trailer
+
+    def add(self, gif, duration):
+        size_bits, table, image = self._split(gif)
+        # Graphic control extension: leave the frame in place, delay in cs.
+        delay = min(round(duration / 10), 0xffff)
+        self.file.write(b"\x21\xf9\x04\x04" + struct.pack("<H", delay) +
+                        b"\x00\x00")
+        # The global color table becomes the local one of the frame.
+        packed = (image[9] & 0x40) | 0x80 | size_bits
+        self.file.write(image[:9] + bytes([packed]) + table + image[10:])
+
+    def close(self):
+        self.file.write(b"\x3b")
+        self.file.close()
+
+
+class FFMpegWriter:
+    """
+    Pipe raw RGBA frames to ffmpeg at a constant frame rate.
+    """
+
+    def __init__(self, path, size, fps):
+        import matplotlib
+
+        self.interval = 1000 / fps
+        self.process = subprocess.Popen(
+            [matplotlib.rcParams["animation.ffmpeg_path"], "-y", "-loglevel",
+             "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+             "-s", f"{size[0]}x{size[1]}", "-r", f"{fps:g}", "-i", "-",
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+             str(path)],
+            stdin=subprocess.PIPE)
+
+    def add(self, rgba, duration):
+        for _ in range(max(1, round(duration / self.interval))):
+            self.process.stdin.write(rgba)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait():
+            raise RuntimeError(f"ffmpeg failed with exit code "
+                               f"{self.process.returncode}")
+
+
+def _write(writer, frame, duration):
+    # *frame* is encoded, or being encoded in the pool.
+    if isinstance(frame, Future):
+        frame = frame.result()
+    writer.add(frame, duration)
+
+
+def _writer(fmt, path, size, fps, loop):
+    if fmt == "gif":
+        return GIFWriter(path, size, loop)
+    if fmt in ("png", "apng"):
+        return APNGWriter(path, size, loop)
+    return FFMpegWriter(path, size, fps)
+
+
+def write_animation(spec, nframes, path, fps=10, dpi=None, loop=0,
+                    jobs=None, buffer_size=None, warm=True, log=print):
+    """
+    Render the *nframes* frames of the animation *spec* (see the module
+    docstring) in a process pool and write them to *path*, whose suffix
+    selects the format.  Return the number of frames written (identical
+    consecutive frames count once).
+    """
+    from .build import pool_context
+
+    path = Path(path)
+    fmt = path.suffix.lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported animation format: {path.suffix!r}")
+    jobs = jobs or os.cpu_count()
+    buffer_size = max(buffer_size or 2 * jobs, 1)
+    interval = 1000 / fps
+    writer = None
+    previous = None  # digest of the last frame
+    # [encoded frame (or its future), duration], in order; the last frame may
+    # still be shown longer.
+    encoded = collections.deque()
+    written = 0
+    reorder = {}
+    try:
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 mp_context=pool_context(warm)) as pool:
+            submitted = 0
+            running = set()
+            for i in range(nframes):
+                # Only submit frames that fit in the reorder buffer.
+                while submitted < min(nframes, i + buffer_size):
+                    running.add(pool.submit(render_frame, spec, submitted,
+                                            dpi))
+                    submitted += 1
+                while i not in reorder:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        j, size, digest, rgba = future.result()
+                        reorder[j] = size, digest, rgba
+                size, digest, rgba = reorder.pop(i)
+                if writer is None:
+                    first_size = size
+                    writer = _writer(fmt, path, size, fps, loop)
+                elif size != first_size:
+                    raise ValueError(f"frame {i} is {size[0]}x{size[1]}, "
+                                     f"frame 0 is {first_size[0]}x"
+                                     f"{first_size[1]}")
+                if digest == previous:
+                    encoded[-1][1] += interval
+                    continue
+                previous = digest
+                if fmt == "mp4":
+                    encoded.append([_encode(rgba, fmt), interval])
+                else:
+                    encoded.append([pool.submit(_encode, rgba, fmt),
+                                    interval])
+                while len(encoded) > 1 and (
+                        len(encoded) > buffer_size
+                        or not isinstance(encoded[0][0], Future)
+                        or encoded[0][0].done()):
+                    _write(writer, *encoded.popleft())
+                    written += 1
+            while encoded:
+                _write(writer, *encoded.popleft())
+                written += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    log(f"{path}: {written} frames written ({nframes - written} identical "
+        f"frames merged)")
+    return written
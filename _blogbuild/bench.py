@@ -0,0 +1,187 @@
+"""
+Benchmarks of the headline figure of each post.
+
+The headline figure is built by the first ``#| code-fold: true`` cell of a
+post or, if there is none, by the first cell that leaves a figure open (the
+cells before it are executed too).  For each post, the figure is built
+once in a fresh worker, then ``fig.canvas.draw()``, ``savefig``
+to each format, and writing all the formats from a single draw (``export``,
+see `.displaylist`) are timed at each dpi, repeating each measurement and
+keeping robust statistics.  The medians are compared to a baseline, so that
+a library upgrade that slows a figure down is caught before publishing.
+
+Posts are benchmarked one at a time, so that they do not compete for the
+CPU.
+"""
+
+import gc
+import io
+import json
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .config import BUILD_DIR
+
+BENCH_DIR = BUILD_DIR / "benchmarks"
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+LATEST_FILE = BENCH_DIR / "latest.json"
+
+FORMATS = ("png", "svg", "pdf")
+DPIS = (100, 200)
+
+
+def headline_cells(post):
+    """
+    Return the cells to execute for the headline figure of *post*: its first
+    ``#| code-fold: true`` cell or, if there is none, all its code cells,
+    which are executed until one leaves a figure open.
+    """
+    cells = post.code_cells()
+    for cell in cells:
+        if cell.options.get("code-fold") is True:
+            return [cell]
+    return cells
+
+
+def build_headline(post):
+    """
+    Execute the headline cells of *post* and return the figure they build.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib._pylab_helpers import Gcf
+
+    from .runner import PostRunner, _compile_cell
+
+    runner = PostRunner(post)
+    with runner._inline_pyplot():
+        # Keep the figures open: no inline display here.
+        plt.show = lambda *args, **kwargs: None
+        for cell in headline_cells(post):
+            body, last = _compile_cell(cell, str(post.path))
+            exec(body, runner.namespace)
+            if last is not None:
+                eval(last, runner.namespace)
+            managers = Gcf.get_all_fig_managers()
+            if managers:
+                return managers[-1].canvas.figure
+    raise RuntimeError(f"{post.name}: the headline cells made no figure")
+
+
+def _time(func, repeat):
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        func()  # warm up
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    return {"min": min(times), "median": statistics.median(times),
+            "mean": statistics.fmean(times),
+            "stdev": statistics.stdev(times) if len(times) > 1 else 0.,
+            "repeat": repeat}
+
+
+def bench_post(path, repeat=7, dpis=DPIS, formats=FORMATS):
+    """
+    Return the timings of the headline figure of the post at *path*, keyed
+    by ``"<operation>@<dpi>"``.
+    """
+    from .displaylist import export
+    from .fonts import use_snapshot
+    from .posts import Post
+    from .runner import use_agg
+
+    use_snapshot()
+    use_agg()
+    post = Post(path)
+    fig = build_headline(post)
+    timings = {}
+
+    def measure(key, func):
+        # A figure may fail in one backend only; keep the other timings.
+        try:
+            timings[key] = _time(func, repeat)
+        except Exception as e:
+            timings[key] = {"error": repr(e)}
+
+    for dpi in dpis:
+        def draw():
+            fig.set_dpi(dpi)
+            fig.canvas.draw()
+        measure(f"draw@{dpi:g}", draw)
+        for fmt in formats:
+            def save():
+                fig.savefig(io.BytesIO(), format=fmt, dpi=dpi)
+            measure(f"{fmt}@{dpi:g}", save)
+        # All the formats from a single draw (see `.displaylist`).
+        measure(f"export@{dpi:g}", lambda: export(fig, None, formats, dpi=dpi,
+                                                  bbox_inches=None))
+    return post.name, timings
+
+
+def run(posts, repeat=7, dpis=DPIS, formats=FORMATS, warm=True, log=print):
+    """
+    Benchmark *posts*, one worker process each, and return the timings keyed
+    by post name.
+    """
+    from .build import pool_context
+
+    results = {}
+    for post in posts:
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=pool_context(warm)) as pool:
+            future = pool.submit(bench_post, str(post.path), repeat,
+                                 tuple(dpis), tuple(formats))
+            try:
+                name, timings = future.result()
+            except Exception as e:
+                log(f"{post.name}: failed: {e!r}")
+                continue
+        results[name] = timings
+        log(f"{name}: " + ", ".join(
+            f"{k} {v['median'] * 1e3:.0f}ms" if "median" in v else f"{k} error"
+            for k, v in timings.items()))
+    return results
+
+
+def load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save(results, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Return the ``(post, key, baseline_median, median)`` of the measurements
+    whose median is slower than the baseline by more than *tolerance* (a
+    fraction) and by more than the spread of the two measurements.  The
+    median is None for measurements that now fail.
+    """
+    regressions = []
+    for name, timings in results.items():
+        for key, t in timings.items():
+            base = baseline.get(name, {}).get(key)
+            if base is None or "median" not in base:
+                continue
+            if "median" not in t:
+                regressions.append((name, key, base["median"], None))
+                continue
+            noise = max(t["stdev"], base["stdev"])
+            if t["median"] > base["median"] * (1 + tolerance) and \
+                    t["median"] - base["median"] > noise:
+                regressions.append((name, key, base["median"], t["median"]))
+    return regressions
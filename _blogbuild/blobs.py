@@ -0,0 +1,189 @@
+"""
+Content-addressed store for the images of the cell outputs.
+
+In the nbformat layout, the images displayed by a cell are base64 strings in
+the JSON of its outputs.  Stored that way, every ``cells.json`` and cached
+cell result carries its own copy of each figure, although the headline
+figure of a post and the last step of its tutorial are usually the same
+picture.
+
+Instead, the images are written once to
+``_build/blobs/<digest[:2]>/<digest><ext>``, named by the sha256 of their
+bytes, and the stored outputs only keep ``{"blob": <digest>}`` in their
+place.  Identical figures of different cells and posts share a file.  The
+outputs are converted at the storage boundaries (`.build.write_result` and
+`.build.read_result`, `.cache.CellCache`); in memory they are always in the
+nbformat layout, so that the cache keys do not depend on where an output
+was read from.  The figures that Quarto reads from ``_freeze`` (see
+`.freeze`) are hard links to the blobs (copies where the file system has
+no hard links).
+
+``prune-blobs`` removes the blobs that no stored output refers to; the
+links in ``_freeze`` keep their content.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import shutil
+import time
+
+from .config import BLOB_DIR, CACHE_DIR, OUTPUT_DIR
+
+# Externalized mime types, with the suffix of their files.  The text ones
+# are stored as UTF-8, the others are base64 in the outputs.
+MIME_SUFFIXES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "application/pdf": ".pdf",
+    "image/svg+xml": ".svg",
+}
+TEXT_MIMES = {"image/svg+xml"}
+
+_REFERENCE = re.compile(r'"blob": "([0-9a-f]{64})"')
+
+
+class BlobStore:
+    """
+    Blobs stored as ``<directory>/<digest[:2]>/<digest><suffix>``.
+    """
+
+    def __init__(self, directory=BLOB_DIR):
+        self.directory = directory
+
+    def _path(self, digest, mime):
+        return self.directory / digest[:2] / f"{digest}{MIME_SUFFIXES[mime]}"
+
+    def put(self, data, mime):
+        """
+        Store *data* (bytes) and return its digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, mime)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            tmp.replace(path)
+        return digest
+
+    def link(self, data, mime, target):
+        """
+        Store *data* and make *target* a hard link to its blob (a copy where
+        links are not supported), and return its digest.
+        """
+        digest = self.put(data, mime)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        try:
+            os.link(self._path(digest, mime), tmp)
+        except OSError:
+            shutil.copyfile(self._path(digest, mime), tmp)
+        os.replace(tmp, target)
+        return digest
+
+    def get(self, digest, mime):
+        """
+        Return the bytes of the blob *digest*; raise FileNotFoundError if it
+        is not in the store.
+        """
+        with open(self._path(digest, mime), "rb") as f:
+            return f.read()
+
+    def files(self):
+        return [path for path in self.directory.glob("??/*")
+                if path.suffix in MIME_SUFFIXES.values()]
+
+
+def _map_data(outputs, convert):
+    converted = []
+    for output in outputs:
+        data = output.get("data")
+        if data is None or not data.keys() & MIME_SUFFIXES.keys():
+            converted.append(output)
+            continue
+        data = {mime: convert(mime, value) if mime in MIME_SUFFIXES else value
+                for mime, value in data.items()}
+        converted.append(dict(output, data=data))
+    return converted
+
+
+def externalize(outputs, store):
+    """
+    Return *outputs* with their images moved to *store*.
+    """
+    def convert(mime, value):
+        if isinstance(value, dict):  # already a reference
+            return value
+        data = (value.encode() if mime in TEXT_MIMES
+                else base64.b64decode(value))
+        return {"blob": store.put(data, mime)}
+
+    return _map_data(outputs, convert)
+
+
+def internalize(outputs, store):
+    """
+    Return *outputs* with the images referred to in *store* put back in
+    place; raise FileNotFoundError if one is missing.
+    """
+    def convert(mime, value):
+        if not isinstance(value, dict):
+            return value
+        data = store.get(value["blob"], mime)
+        return (data.decode() if mime in TEXT_MIMES
+                else base64.b64encode(data).decode("ascii"))
+
+    return _map_data(outputs, convert)
+
+
+def _map_cells(result, function, store):
+    return dict(result, cells=[dict(c, outputs=function(c["outputs"], store))
+                               for c in result["cells"]])
+
+
+def externalize_result(result, store):
+    return _map_cells(result, externalize, store)
+
+
+def internalize_result(result, store):
+    return _map_cells(result, internalize, store)
+
+
+def referenced(directories=(OUTPUT_DIR, CACHE_DIR)):
+    """
+    Return the digests of the blobs referred to by the JSON files in
+    *directories*.
+    """
+    digests = set()
+    for directory in directories:
+        for path in directory.rglob("*.json"):
+            try:
+                digests.update(_REFERENCE.findall(path.read_text()))
+            except FileNotFoundError:
+                pass
+    return digests
+
+
+def prune(store=None, directories=(OUTPUT_DIR, CACHE_DIR), grace=3600):
+    """
+    Remove the blobs of *store* that no output stored in *directories*
+    refers to, unless they were written less than *grace* seconds ago (by a
+    build whose outputs are not written yet).  Return the number of blobs
+    and bytes removed.
+    """
+    store = store or BlobStore()
+    keep = referenced(directories)
+    removed = size = 0
+    deadline = time.time() - grace
+    for path in store.files():
+        st = path.stat()
+        if path.stem in keep or st.st_mtime > deadline:
+            continue
+        path.unlink(missing_ok=True)
+        removed += 1
+        size += st.st_size
+    return removed, size
+
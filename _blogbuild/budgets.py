@@ -0,0 +1,181 @@
+"""
+Performance budgets of the posts.
+
+``budgets.json``, at the root of the repository, is committed with the
+posts.  It gives, for each post, the maximum
+
+- ``cpu_seconds``: CPU time of the worker and of the subprocesses it
+  waited for, summed over the cells,
+- ``memory_mb``: peak resident set size of the worker,
+- ``output_kb``: size of the cell outputs (images decoded),
+
+any of which may be left out.  The budgets hold CPU time rather than wall
+time, which depends on how many workers share the machine.  `check`
+compares the metrics of a build (see `.metrics`) with them, and names the
+cell responsible for each overrun: the cell that took the most CPU time,
+the cell during which the peak went over the budget, or the cell with the
+largest outputs.  ``render`` warns about the overruns, or
+fails with ``--budgets fail``; ``budgets`` checks the metrics of the last
+full render (drafts and previews write none), and ``budgets --update``
+writes them, with some headroom, as the new budgets.
+
+Cells served from the cache were not executed: their outputs count, but
+not the time and memory recorded when they were, so that a build from the
+cache is checked for what it executed.  Render with ``--no-cache`` to
+measure every cell; the posts with cached cells are left out by
+``--update``.  The budgets in the repository were measured that way, with
+``render --no-cache -j1``.
+"""
+
+import json
+import math
+import os
+
+from .config import BUDGETS_FILE, OUTPUT_DIR
+
+# Budget keys, with the unit they are written in.
+UNITS = {"cpu_seconds": 1., "memory_mb": 1e6, "output_kb": 1e3}
+
+HEADROOM = 1.5
+
+
+def _peak(cell):
+    return cell.get("rss_peak") or cell.get("rss") or 0
+
+
+def _cpu(cell):
+    return cell.get("cpu", 0.) + cell.get("cpu_children", 0.)
+
+
+def _executed(cells):
+    return [c for c in cells if not c.get("cached", False)]
+
+
+def measure(metrics):
+    """
+    Return the budget values of the post *metrics* (see
+    `.metrics.post_metrics`).
+    """
+    cells = metrics["cells"]
+    executed = _executed(cells)
+    return {
+        "cpu_seconds": sum(map(_cpu, executed)),
+        "memory_mb": (max(map(_peak, executed), default=0)
+                      / UNITS["memory_mb"]),
+        "output_kb": (sum(c.get("output_bytes", 0) for c in cells)
+                      / UNITS["output_kb"]),
+    }
+
+
+def _responsible(cells, key, limit):
+    if key == "output_kb" and cells:
+        return max(cells, key=lambda c: c.get("output_bytes", 0))
+    cells = _executed(cells)
+    if not cells:
+        return None
+    if key == "cpu_seconds":
+        return max(cells, key=_cpu)
+    for cell in cells:
+        if _peak(cell) / UNITS[key] > limit:
+            return cell
+    return cells[-1]
+
+
+def check(metrics, budget):
+    """
+    Return the overruns of the post *metrics* over its *budget*, as dicts
+    with the post name, the key, the value, the limit and the index and line
+    number of the cell responsible.
+    """
+    values = measure(metrics)
+    overruns = []
+    for key, limit in budget.items():
+        if key not in values or values[key] <= limit:
+            continue
+        cell = _responsible(metrics["cells"], key, limit) or {}
+        overruns.append({"post": metrics["name"], "key": key,
+                         "value": values[key], "limit": limit,
+                         "cell": cell.get("index"),
+                         "lineno": cell.get("lineno")})
+    return overruns
+
+
+def format_overrun(overrun):
+    text = (f"{overrun['post']}: {overrun['key']} {overrun['value']:.1f} over "
+            f"the budget of {overrun['limit']:g}")
+    if overrun["cell"] is not None:
+        text += f" (cell {overrun['cell']}, line {overrun['lineno']})"
+    return text
+
+
+def load_budgets(path=BUDGETS_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_budgets(budgets, path=BUDGETS_FILE):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(budgets, f, indent=1, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def gate(results, mode="warn", path=BUDGETS_FILE, log=print):
+    """
+    Check the post *results* of a build against the budgets in *path*, log
+    the overruns and return whether the build passes: with *mode* ``"fail"``,
+    it does not if any post is over budget.
+    """
+    from .metrics import post_metrics
+
+    budgets = load_budgets(path)
+    overruns = []
+    for result in results:
+        if result["name"] in budgets:
+            overruns += check(post_metrics(result),
+                              budgets[result["name"]])
+    prefix = "error" if mode == "fail" else "warning"
+    for overrun in overruns:
+        log(f"{prefix}: {format_overrun(overrun)}")
+    return mode != "fail" or not overruns
+
+
+def last_metrics(names=None, output_dir=OUTPUT_DIR):
+    """
+    Return the metrics of the last build of the posts *names* (default: all
+    the built posts).
+    """
+    if names is None:
+        names = sorted(p.parent.name for p in output_dir.glob("*/metrics.json"))
+    metrics = []
+    for name in names:
+        try:
+            with open(output_dir / name / "metrics.json") as f:
+                metrics.append(json.load(f))
+        except FileNotFoundError:
+            continue
+    return metrics
+
+
+def update_budgets(metrics, headroom=HEADROOM, path=BUDGETS_FILE):
+    """
+    Set the budgets of the posts of *metrics* that were fully executed
+    without errors to their measured values times *headroom*, rounded up,
+    and return the names of these posts.
+    """
+    budgets = load_budgets(path)
+    updated = []
+    for post in metrics:
+        if (post["status"] != "ok"
+                or any(c.get("cached", False) for c in post["cells"])):
+            continue
+        budgets[post["name"]] = {
+            key: math.ceil(value * headroom * 10) / 10
+            for key, value in measure(post).items()}
+        updated.append(post["name"])
+    save_budgets(budgets, path)
+    return updated
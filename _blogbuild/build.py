@@ -0,0 +1,183 @@
+"""
+Executing posts in parallel, one worker process per post.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .blobs import BlobStore, externalize_result, internalize_result
+from .config import FREEZE_DIR, OUTPUT_DIR
+from .fonts import share_snapshot
+from .freeze import write_freeze
+from .metrics import write_metrics
+from .schedule import load_runtimes, longest_first, update_runtimes
+
+
+def _run_in_worker(path, dpi, use_cache, incremental, lazy_imports,
+                   trace_memory, cache_dir=None, draft=False, profile=False):
+    from .cache import CellCache
+    from .checkpoint import PickleCheckpoints
+    from .fonts import use_snapshot
+    from .posts import Post
+    from .runner import reset_matplotlib, run_post
+
+    use_snapshot()
+    # Workers forked from the warm fork server start from the state the
+    # preload left; make sure that is all they start from.
+    preload = sys.modules.get(f"{__package__}.preload")
+    if preload is not None:
+        reset_matplotlib(preload.RC_PARAMS)
+    if lazy_imports:
+        from .lazy import install
+        install()
+    if draft:
+        from .draft import install
+        install()
+    post = Post(path)
+    cache = None
+    if use_cache and cache_dir:
+        # Workers on other hosts read the images from the shared directory.
+        cache = CellCache(Path(cache_dir), BlobStore(Path(cache_dir) / "blobs"))
+    elif use_cache:
+        cache = CellCache()
+    checkpoints = previous = None
+    if incremental:
+        checkpoints = PickleCheckpoints(post)
+        # Draft outputs only stand in for draft outputs, and conversely.
+        previous = read_result(post.name) or {}
+        if previous.get("draft", False) == draft:
+            previous = previous.get("cells")
+        else:
+            previous = None
+    result = run_post(post, dpi=dpi, cache=cache, checkpoints=checkpoints,
+                      previous=previous, trace_memory=trace_memory,
+                      profile=profile)
+    if draft:
+        result["draft"] = True
+    return result
+
+
+def read_result(name, output_dir=OUTPUT_DIR, blobs=None):
+    """
+    Return the result of the previous build of the post *name*, if any (and
+    if its images are still in *blobs*).
+    """
+    try:
+        with open(output_dir / name / "cells.json") as f:
+            return internalize_result(json.load(f), blobs or BlobStore())
+    except FileNotFoundError:
+        return None
+
+
+def write_result(result, output_dir=OUTPUT_DIR, blobs=None,
+                 freeze_dir=FREEZE_DIR, metrics=True):
+    """
+    Write the result of a post to ``<output_dir>/<post>/cells.json``, with
+    its images in *blobs* (see `.blobs`).  The results of a full render are
+    also written, with *metrics*, as the resource usage of its cells to
+    ``metrics.json`` next to it (see `.metrics`), and to *freeze_dir*
+    (unless None), where Quarto reads them (see `.freeze`).
+    """
+    directory = output_dir / result["name"]
+    directory.mkdir(parents=True, exist_ok=True)
+    blobs = blobs or BlobStore()
+    stored = externalize_result(result, blobs)
+    tmp = directory / f"cells.json.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(stored, f, indent=1)
+    tmp.replace(directory / "cells.json")
+    if metrics:
+        write_metrics(result, output_dir)
+    if freeze_dir is not None:
+        write_freeze(result, freeze_dir, blobs=blobs)
+    return directory
+
+
+def pool_context(warm=True):
+    """
+    Return the multiprocessing context for the workers.
+
+    With *warm*, workers are forked from a fork server that has imported the
+    modules used by the posts and loaded the font cache (see `.preload`), so
+    that they start without paying for these imports again.  Otherwise (or
+    where fork servers are not available), workers are spawned afresh.
+    Either way, they load the font list from a shared snapshot (see
+    `.fonts`).
+    """
+    share_snapshot()
+    if warm and "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([f"{__package__}.preload"])
+        return context
+    # "fork" cannot be combined with max_tasks_per_child.
+    return multiprocessing.get_context("spawn")
+
+
+def build(posts, jobs=None, dpi=None, use_cache=True, incremental=False,
+          warm=True, lazy_imports=False, trace_memory=False, draft=False,
+          profile=False, freeze_dir=FREEZE_DIR, metrics=True, log=print):
+    """
+    Execute *posts* in a process pool, slowest first, and return their results.
+
+    Each worker executes a single post and exits, so that no matplotlib state
+    leaks from one post into another.  With *use_cache*, cells are served from
+    the cell cache when possible (see `.cache`).  With *incremental*, only
+    the cells affected by the changes since the previous build are executed,
+    from a pickled checkpoint (see `.incremental`).  See `pool_context` for
+    *warm* and `.lazy` for *lazy_imports*.  With *trace_memory*, the peak
+    memory allocated by each cell is traced (see `.metrics`).
+
+    With *draft*, the image effects are replaced by cheap vector stand-ins
+    and figures are rendered at `.draft.DRAFT_DPI` (unless *dpi* is given),
+    to check the layout quickly (see `.draft`).  Draft builds neither use nor
+    fill the cell cache.
+
+    With *profile*, the stack of the workers is sampled while the cells run,
+    and a flame graph of each post is written (see `.profiler`).
+
+    See `write_result` for *freeze_dir* and *metrics*: test renders, at
+    another dpi say, must not replace the results that the site publishes.
+    """
+    jobs = jobs or os.cpu_count()
+    if draft:
+        from .draft import DRAFT_DPI
+        dpi = dpi or DRAFT_DPI
+        use_cache = False
+    ordered = longest_first(posts, load_runtimes())
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=pool_context(warm),
+                             max_tasks_per_child=1) as pool:
+        futures = {pool.submit(_run_in_worker, str(post.path), dpi,
+                               use_cache, incremental, lazy_imports,
+                               trace_memory, draft=draft,
+                               profile=profile): post
+                   for post in ordered}
+        for future in as_completed(futures):
+            post = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                log(f"{post.name}: worker failed: {e!r}")
+                continue
+            stacks = result.pop("profile", None)
+            if stacks is not None:
+                from .profiler import write_collapsed
+                path = write_collapsed(result["name"], stacks)
+                log(f"{result['name']}: {sum(stacks.values())} stack samples "
+                    f"written to {path}")
+            write_result(result, freeze_dir=freeze_dir, metrics=metrics)
+            results.append(result)
+            n_cached = sum(c.get("cached", False) for c in result["cells"])
+            log(f"{result['name']}: {result['status']} "
+                f"({result['elapsed']:.1f}s, {n_cached}/{len(result['cells'])} "
+                f"cells cached)")
+    update_runtimes(results)
+    log(f"built {len(results)}/{len(posts)} posts in "
+        f"{time.perf_counter() - start:.1f}s with {jobs} workers")
+    return results
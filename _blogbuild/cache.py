@@ -0,0 +1,174 @@
+"""
+Content-addressed cache of cell results.
+
+Quarto's ``freeze`` works per post: any edit to a post re-executes all of its
+cells.  Here each code cell gets a key that hashes
+
+- the cell source and its ``#|`` options (markdown cells do not count),
+- the key and the outputs of the previous cell, so that a key covers all the
+  code and outputs before it,
+- the files of the post directory that the cell refers to by name (svg,
+  toml, helper modules, ...),
+- the Python version and the installed versions of matplotlib, numpy and the
+  mpl-* libraries,
+- the dpi of the render, when given (``render --dpi``, the previews of
+  ``watch``), so that renders at different dpi do not serve each other's
+  figures.
+
+A cell whose key is found in the cache is served from disk.  The images of
+the cached outputs are kept in a `.blobs.BlobStore`.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import re
+from functools import lru_cache
+from importlib import metadata
+
+from .blobs import BlobStore, externalize, internalize
+from .config import CACHE_DIR
+
+# Object addresses in reprs differ from run to run.
+_ADDRESS = re.compile(r"0x[0-9a-fA-F]+")
+
+# Distributions (besides the mpl-* ones) whose version is part of the key.
+TRACKED_DISTRIBUTIONS = {"matplotlib", "numpy", "pillow", "seaborn", "pandas"}
+
+
+def _normalize(name):
+    return name.lower().replace("_", "-")
+
+
+@lru_cache(maxsize=None)
+def environment_digest():
+    versions = {}
+    for dist in metadata.distributions():
+        name = _normalize(dist.metadata["Name"] or "")
+        if name in TRACKED_DISTRIBUTIONS or name.startswith("mpl"):
+            versions[name] = dist.version
+    versions["python"] = platform.python_version()
+    return hashlib.sha256(
+        json.dumps(versions, sort_keys=True).encode()).hexdigest()
+
+
+def asset_files(post):
+    """
+    Return the files of the post directory other than the post itself.
+    """
+    return sorted(p for p in post.directory.rglob("*")
+                  if p.is_file() and p != post.path
+                  and "__pycache__" not in p.parts)
+
+
+def referenced_assets(cell, assets):
+    """
+    Return the files in *assets* whose name (or module name, for Python
+    files) appears in the source of *cell*.
+    """
+    return [p for p in assets
+            if p.name in cell.source
+            or (p.suffix == ".py" and p.stem in cell.source)]
+
+
+@lru_cache(maxsize=256)
+def _file_digest(path, mtime_ns, size):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    st = path.stat()
+    return _file_digest(path, st.st_mtime_ns, st.st_size)
+
+
+def outputs_digest(outputs):
+    text = _ADDRESS.sub("0x", json.dumps(outputs, sort_keys=True))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def cell_key(cell, previous_key, previous_outputs, assets):
+    h = hashlib.sha256()
+    for part in [environment_digest(),
+                 previous_key or "",
+                 outputs_digest(previous_outputs or []),
+                 json.dumps(cell.options, sort_keys=True, default=str),
+                 cell.source]:
+        h.update(part.encode())
+        h.update(b"\0")
+    for path in referenced_assets(cell, assets):
+        h.update(f"{path.name}:{file_digest(path)}\0".encode())
+    return h.hexdigest()
+
+
+class CellCache:
+    """
+    Cell results stored as ``<directory>/<key[:2]>/<key>.json``, with their
+    images in *blobs* (default: a `.blobs.BlobStore` in its default
+    directory).
+    """
+
+    def __init__(self, directory=CACHE_DIR, blobs=None):
+        self.directory = directory
+        self.blobs = blobs or BlobStore()
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                result = json.load(f)
+            return dict(result,
+                        outputs=internalize(result["outputs"], self.blobs))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, result):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        result = dict(result,
+                      outputs=externalize(result["outputs"], self.blobs))
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        tmp.replace(path)
+
+
+class CellKeys:
+    """
+    The chain of keys of the successive code cells of *post*, rendered at
+    *dpi*.  Call `next` for each cell, then `record` with its outputs.
+    """
+
+    def __init__(self, post, dpi=None):
+        self.assets = asset_files(post)
+        self.key = None if dpi is None else f"dpi={dpi:g}"
+        self.outputs = None
+
+    def next(self, cell):
+        self.key = cell_key(cell, self.key, self.outputs, self.assets)
+        return self.key
+
+    def record(self, outputs):
+        self.outputs = outputs
+
+
+def cached_prefix(post, cells, cache, dpi=None):
+    """
+    Return the cached results of the leading cells of *cells* whose keys are
+    found in *cache*.
+    """
+    keys = CellKeys(post, dpi)
+    results = []
+    for cell in cells:
+        result = cache.get(keys.next(cell))
+        if result is None:
+            break
+        keys.record(result["outputs"])
+        results.append(result)
+    return results
@@ -0,0 +1,242 @@
+"""
+Checkpoints of the interpreter state between cells.
+
+A checkpoint is identified by the prefix key of the cell it was taken after
+(see `.incremental.prefix_keys`), so that it is only ever reused when all the
+cells up to it are unchanged.
+
+`PickleCheckpoints` persists the namespace (and rcParams) to disk, which works
+across builds as long as the objects can be pickled; cloudpickle is used if
+installed, as it also handles functions and lambdas defined in the posts.
+
+`ForkSnapshots` keeps a forked copy of the process after each cell instead.
+It needs a long-lived process to hold the snapshots, but restores any state,
+picklable or not.  A snapshot listens on a unix socket; `resume` sends it new
+work, which it executes in a fresh fork of itself.
+"""
+
+import os
+import pickle
+import select
+import socket
+import sys
+import tempfile
+import types
+from multiprocessing.connection import Client, Connection
+from pathlib import Path
+
+from .config import CHECKPOINT_DIR
+from .deps import live_names
+
+try:
+    import cloudpickle
+except ImportError:
+    cloudpickle = None
+
+
+def _dumps(obj):
+    return (cloudpickle or pickle).dumps(obj)
+
+
+def capture(namespace, cells=None, index=None):
+    """
+    Return the pickled state of *namespace*.  Modules are stored by name.
+
+    If the namespace cannot be pickled as a whole, retry with only the names
+    needed by the cells after *index*; return None if that fails too.
+    """
+    import matplotlib
+
+    modules = {k: v.__name__ for k, v in namespace.items()
+               if isinstance(v, types.ModuleType)}
+    values = {k: v for k, v in namespace.items()
+              if k not in modules and k != "__builtins__"}
+    candidates = [values]
+    if cells is not None:
+        live = live_names(cells, values, index)
+        candidates.append({k: v for k, v in values.items()
+                           if k in live or k.startswith("__")})
+    for candidate in candidates:
+        try:
+            return _dumps({"modules": modules, "values": candidate,
+                           "rcParams": dict(matplotlib.rcParams)})
+        except Exception:
+            continue
+    return None
+
+
+def restore(data, namespace):
+    """
+    Update *namespace* (and rcParams) from the state returned by `capture`.
+    """
+    import importlib
+    import warnings
+    import matplotlib
+
+    state = pickle.loads(data)
+    for name, module in state["modules"].items():
+        namespace[name] = importlib.import_module(module)
+    namespace.update(state["values"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        matplotlib.rcParams.update(state["rcParams"])
+
+
+class PickleCheckpoints:
+    """
+    Pickled checkpoints stored as ``<directory>/<post>/<key>.pkl``.
+    """
+
+    def __init__(self, post, directory=CHECKPOINT_DIR):
+        self.directory = directory / post.name
+
+    def _path(self, key):
+        return self.directory / f"{key}.pkl"
+
+    def __contains__(self, key):
+        return self._path(key).exists()
+
+    def save(self, key, namespace, cells, index):
+        data = capture(namespace, cells, index)
+        if data is None:
+            return False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(self._path(key))
+        return True
+
+    def load(self, key, namespace):
+        restore(self._path(key).read_bytes(), namespace)
+
+    def prune(self, keys):
+        """
+        Remove the checkpoints whose key is not in *keys*.
+        """
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob("*.pkl"):
+            if path.stem not in keys:
+                path.unlink()
+
+
+class ForkSnapshots:
+    """
+    Snapshots of the running process, forked after each cell.
+
+    Snapshots outlive the process that took them (a snapshot resumed by
+    `resume` takes snapshots of its own), and are found through their socket
+    in *directory*.  They exit when `close` is called or when *owner* (the
+    pid of the long-lived process) is gone.
+    """
+
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, directory=None, owner=None):
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="blogbuild-snapshots-")
+        self.directory = Path(directory)
+        self.owner = owner or os.getpid()
+
+    def _address(self, key):
+        # Socket paths are limited to about a hundred bytes.
+        return str(self.directory / key[:16])
+
+    def __contains__(self, key):
+        return os.path.exists(self._address(key))
+
+    def take(self, key):
+        """
+        Fork a snapshot of the current process.
+
+        Return None in the calling process.  In the snapshot, this returns
+        ``(connection, message)`` each time the snapshot is resumed: the
+        caller is then running in a fresh fork of the snapshot, and should
+        carry on with *message* and send its result through *connection*.
+        """
+        if key in self:
+            return None
+        # Listen before forking, so that the snapshot can be resumed as soon
+        # as this returns.
+        address = self._address(key)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(address)
+        except OSError:
+            # Taken meanwhile by a process resumed from the same snapshot.
+            server.close()
+            return None
+        server.listen()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if os.fork():
+            server.close()
+            return None
+        try:
+            return self._serve(server, address)
+        except BaseException:
+            os._exit(1)
+
+    def _serve(self, server, address):
+        while True:
+            readable, _, _ = select.select([server], [], [],
+                                           self.POLL_INTERVAL)
+            self._reap()
+            if not readable:
+                if not self._owner_alive():
+                    break
+                continue
+            client, _ = server.accept()
+            connection = Connection(client.detach())
+            message = connection.recv()
+            if message is None:
+                break
+            if os.fork() == 0:
+                server.close()
+                return connection, message
+            connection.close()
+        server.close()
+        os.unlink(address)
+        os._exit(0)
+
+    def _owner_alive(self):
+        try:
+            os.kill(self.owner, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    @staticmethod
+    def _reap():
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0]:
+                pass
+        except ChildProcessError:
+            pass
+
+    def resume(self, key, message):
+        """
+        Have the snapshot *key* carry on with *message* and return its result.
+        """
+        with Client(self._address(key), family="AF_UNIX") as connection:
+            connection.send(message)
+            return connection.recv()
+
+    def discard(self, keys):
+        """
+        Make the snapshots *keys* exit.
+        """
+        for key in keys:
+            try:
+                with Client(self._address(key), family="AF_UNIX") as connection:
+                    connection.send(None)
+            except OSError:
+                pass
+
+    def close(self):
+        for address in self.directory.iterdir():
+            try:
+                with Client(str(address), family="AF_UNIX") as connection:
+                    connection.send(None)
+            except OSError:
+                pass
@@ -0,0 +1,67 @@
+"""
+Locations used by the build.
+"""
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+POSTS_DIR = ROOT / "posts"
+
+# Maximum time, memory and output size of each post (committed).
+BUDGETS_FILE = ROOT / "budgets.json"
+
+# Reference images of the cell outputs, for the regression tests (committed).
+GOLDEN_DIR = ROOT / "tests" / "golden"
+
+# Everything the build produces (and may throw away) lives here.
+BUILD_DIR = ROOT / "_build"
+
+# Per-post execution results.
+OUTPUT_DIR = BUILD_DIR / "posts"
+
+# Content-addressed cache of cell results.
+CACHE_DIR = BUILD_DIR / "cache" / "cells"
+
+# Images of the stored cell outputs, keyed by their digest.
+BLOB_DIR = BUILD_DIR / "blobs"
+
+# Optimized images, keyed by the digest of the original.
+IMAGE_CACHE_DIR = BUILD_DIR / "cache" / "images"
+
+# Interpreter state saved between cells, for incremental re-execution.
+CHECKPOINT_DIR = BUILD_DIR / "checkpoints"
+
+# Stacks sampled while the cells run, for flame graphs.
+PROFILE_DIR = BUILD_DIR / "profiles"
+
+# Wall-clock time of each post from the previous builds, used for scheduling.
+RUNTIMES_FILE = BUILD_DIR / "runtimes.json"
+
+# Font-manager snapshots shared by the workers.
+FONT_CACHE_DIR = BUILD_DIR / "fonts"
+
+# Metadata of the posts read from their headers, keyed by file mtime.
+INDEX_FILE = BUILD_DIR / "index.json"
+
+# Thumbnails keyed by the digest of the headline cells and their assets.
+THUMBNAIL_CACHE_DIR = BUILD_DIR / "cache" / "thumbnails"
+
+
+# Thumbnails of the images that failed the regression tests.
+REGRESSION_DIR = BUILD_DIR / "regressions"
+
+# Headline figures exported to several formats.
+EXPORT_DIR = BUILD_DIR / "exports"
+
+# Digests of the files of the rendered site, keyed by file mtime.
+SITE_MANIFEST_FILE = BUILD_DIR / "site-manifest.json"
+
+# Digests of the site files whose compressed siblings are up to date.
+PRECOMPRESSED_FILE = BUILD_DIR / "precompressed.json"
+
+# Execution results of the posts, where Quarto reads them (committed).
+FREEZE_DIR = ROOT / "_freeze"
+
+# Quarto's output directory.
+SITE_DIR = ROOT / "_site"
@@ -0,0 +1,222 @@
+"""
+Def/use analysis of the code cells of a post.
+
+The analysis is deliberately conservative, as matplotlib objects are heavily
+aliased (``fig``, ``ax``, ``ax.patches`` and the artists drawn on them are
+all the same figure):
+
+- calling a method on a name, assigning to one of its attributes or items,
+  or passing it to a function counts as redefining (mutating) it;
+- names bound from an expression share a group with the names used in that
+  expression (``bars = ax.containers[0]`` makes ``bars`` an alias of
+  ``ax``), and a function is grouped with the globals its body uses;
+- modules that act on implicit global state (pyplot, seaborn, ...) are all
+  mapped to a single ``<pyplot>`` name.
+
+Names bound by other imports are defined by the cell that imports them and
+used by the cells that name them, so that these cells depend on their
+imports, but they are never aliased or mutated: ``np.sum(a)`` neither
+redefines ``np`` nor groups it with ``a``.
+"""
+
+import ast
+import builtins
+from dataclasses import dataclass, field
+
+PYPLOT = "<pyplot>"
+
+STATEFUL_MODULES = ("matplotlib.pyplot", "pylab", "seaborn", "mplcyberpunk")
+
+_BUILTINS = set(dir(builtins))
+
+
+def _is_stateful(module):
+    return any(module == m or module.startswith(m + ".")
+               for m in STATEFUL_MODULES)
+
+
+@dataclass
+class CellDeps:
+    defs: set = field(default_factory=set)
+    uses: set = field(default_factory=set)
+
+
+class _Groups:
+    """
+    Union-find of aliased names.
+    """
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, name):
+        parent = self.parent.setdefault(name, name)
+        if parent != name:
+            parent = self.parent[name] = self.find(parent)
+        return parent
+
+    def union(self, names):
+        names = [self.find(n) for n in names]
+        for n in names[1:]:
+            self.parent[n] = names[0]
+
+
+def _root_name(node):
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Starred)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _loaded_names(node):
+    return {n.id for n in ast.walk(node)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+
+
+def _walk_scope(node):
+    """
+    Like `ast.walk`, but without entering nested functions and classes.
+    """
+    todo = [node]
+    while todo:
+        node = todo.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                 ast.ClassDef, ast.Lambda)):
+            todo.extend(ast.iter_child_nodes(node))
+
+
+def _stored_roots(target):
+    roots = set()
+    for n in ast.walk(target):
+        if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store):
+            roots.add(n.id)
+        elif isinstance(n, (ast.Attribute, ast.Subscript)) and \
+                isinstance(n.ctx, ast.Store):
+            root = _root_name(n)
+            if root:
+                roots.add(root)
+    return roots
+
+
+class _CellAnalyzer:
+    def __init__(self, groups, constants, stateful):
+        self.groups = groups
+        self.constants = constants  # names bound by imports
+        self.stateful = stateful  # names bound to stateful modules
+
+    def _name(self, name):
+        return PYPLOT if name in self.stateful else name
+
+    def _variables(self, names):
+        return {self._name(n) for n in names
+                if n not in _BUILTINS
+                and (n not in self.constants or n in self.stateful)}
+
+    def _imported(self, names):
+        return {n for n in names
+                if n in self.constants and n not in self.stateful}
+
+    def _bind(self, targets, value_names):
+        self.groups.union(list(targets | self._variables(value_names)))
+
+    def analyze(self, tree):
+        deps = CellDeps()
+        for stmt in tree.body:
+            self._statement(stmt, deps)
+        return deps
+
+    def _statement(self, stmt, deps):
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            for alias in stmt.names:
+                name = alias.asname or alias.name.split(".")[0]
+                module = (alias.name if isinstance(stmt, ast.Import)
+                          else stmt.module or "")
+                self.constants.add(name)
+                if _is_stateful(module):
+                    self.stateful.add(name)
+                deps.defs.add(self._name(name))
+            return
+
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.ClassDef)):
+            loaded = _loaded_names(stmt)
+            used = self._variables(loaded)
+            deps.defs.add(stmt.name)
+            deps.uses |= used | self._imported(loaded)
+            self._bind({stmt.name}, used)
+            return
+
+        loaded = _loaded_names(stmt)
+        deps.uses |= self._variables(loaded) | self._imported(loaded)
+
+        for node in _walk_scope(stmt):
+            targets, value = set(), None
+            if isinstance(node, ast.Assign):
+                targets = set().union(*map(_stored_roots, node.targets))
+                value = node.value
+            elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+                targets, value = _stored_roots(node.target), node.value
+            elif isinstance(node, (ast.For, ast.AsyncFor, ast.comprehension)):
+                targets, value = _stored_roots(node.target), node.iter
+            elif isinstance(node, ast.withitem) and node.optional_vars:
+                targets = _stored_roots(node.optional_vars)
+                value = node.context_expr
+            elif isinstance(node, ast.NamedExpr):
+                targets, value = {node.target.id}, node.value
+            elif isinstance(node, ast.Call):
+                # The receiver and the arguments may be mutated by the call.
+                receiver = _root_name(node.func) \
+                    if isinstance(node.func, ast.Attribute) else None
+                args = [_root_name(a) for a in node.args]
+                args += [_root_name(k.value) for k in node.keywords]
+                mutated = self._variables(
+                    n for n in [receiver, *args] if n is not None)
+                if isinstance(node.func, ast.Name) and \
+                        node.func.id in self.stateful:
+                    mutated.add(PYPLOT)
+                deps.defs |= mutated
+                self.groups.union(list(mutated))
+                continue
+            else:
+                continue
+            targets = {self._name(n) for n in targets}
+            deps.defs |= targets
+            if value is not None:
+                self._bind(targets, _loaded_names(value))
+
+
+def analyze_cells(cells):
+    """
+    Return the `CellDeps` of each code cell, with the names replaced by the
+    representative of their alias group.
+    """
+    groups = _Groups()
+    analyzer = _CellAnalyzer(groups, set(), set())
+    raw = [analyzer.analyze(ast.parse(cell.source)) for cell in cells]
+    return [CellDeps({groups.find(n) for n in d.defs},
+                     {groups.find(n) for n in d.uses}) for d in raw]
+
+
+def dependency_graph(cells):
+    """
+    Return, for each code cell, the indices (into *cells*) of the earlier
+    cells it depends on: the last cell before it that defined each group it
+    uses or redefines.
+    """
+    graph = []
+    last_def = {}
+    for i, d in enumerate(analyze_cells(cells)):
+        graph.append({last_def[g] for g in d.defs | d.uses if g in last_def})
+        for g in d.defs:
+            last_def[g] = i
+    return graph
+
+
+def live_names(cells, namespace, index):
+    """
+    Return the names of *namespace* that the cells after *index* may need.
+    """
+    later = set()
+    for cell in cells[index + 1:]:
+        later |= _loaded_names(ast.parse(cell.source))
+    return {n for n in namespace if n in later}
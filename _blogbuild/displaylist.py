@@ -0,0 +1,414 @@
+"""
+Drawing a figure once and writing it in several formats.
+
+``savefig`` draws the whole artist tree for each format: exporting a figure
+to PNG, SVG and PDF runs the layout, the path effects and the image effects
+three times.  `DisplayList.record` draws the figure once, with a
+`RecordingRenderer`: an Agg renderer that also records the draw calls it
+receives (paths, markers, collections, meshes, images, text, with frozen
+copies of their graphics contexts and transforms).  `DisplayList.save` then
+writes
+
+- PNG at the recorded dpi from the Agg buffer itself, where the saved area
+  starts on its pixels, and otherwise by replaying the calls into a new Agg
+  renderer;
+- SVG and PDF by replaying the calls into the vector renderers, scaled from
+  pixels at the recorded dpi to points.
+
+The replay follows the calls matplotlib makes for these formats: rasterized
+artists (`start_rasterizing`) go through the same mixed-mode renderer, and
+images, including those of the image effects, are placed at the recorded
+dpi, as ``savefig(dpi=...)`` would rasterize them.  Text is replayed as
+text, so that each backend typesets it with its own font handling.  At
+the recorded dpi, the PNG is the one ``savefig`` writes; at other dpi, the
+hinting of the text and the tight bounding box, measured at the recorded
+dpi, may make it differ from ``savefig`` by a few pixels, in size too.
+``export --auto-rasterize`` records the figure with the artists that are too
+complex for the vector formats rasterized (see `.rasterize`).
+
+A display list refers to the paths and arrays of the artists; it should be
+saved before the figure is modified.
+"""
+
+import contextlib
+import io
+import time
+import types
+
+import numpy as np
+from matplotlib.backend_bases import GraphicsContextBase
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.transforms import (Affine2D, Transform, TransformedBbox,
+                                   TransformedPath)
+
+from .config import EXPORT_DIR
+
+FORMATS = ("png", "svg", "pdf")
+
+# Methods that RendererAgg binds to its C++ renderer on each instance.
+_BOUND_METHODS = ("draw_gouraud_triangles", "draw_image", "draw_markers",
+                  "draw_path_collection", "draw_quad_mesh")
+
+
+def _frozen_gc(gc):
+    frozen = GraphicsContextBase()
+    frozen.copy_properties(gc)
+    rect = gc.get_clip_rectangle()
+    frozen.set_clip_rectangle(None if rect is None else rect.frozen())
+    path, affine = gc.get_clip_path()
+    frozen.set_clip_path(None if path is None
+                         else TransformedPath(path, affine.frozen()))
+    return frozen
+
+
+def _frozen(arg):
+    return arg.frozen() if isinstance(arg, Transform) else arg
+
+
+class RecordingRenderer(RendererAgg):
+    """
+    An Agg renderer that records the draw calls in `calls`, as ``(method
+    name, frozen graphics context or None, arguments)``.
+    """
+
+    def __init__(self, width, height, dpi):
+        self.calls = []
+        super().__init__(width, height, dpi)
+
+    def _update_methods(self):
+        # Also called when Agg filters swap the underlying renderer.
+        super()._update_methods()
+        for name in _BOUND_METHODS:
+            setattr(self, name, self._recorder(name, getattr(self, name)))
+
+    def _recorder(self, name, method):
+        def draw(gc, *args):
+            if name == "draw_image":
+                args = (*args[:2], np.array(args[2]), *args[3:])
+            self.calls.append((name, _frozen_gc(gc),
+                               tuple(_frozen(a) for a in args)))
+            return method(gc, *args)
+        return draw
+
+    def draw_path(self, gc, path, transform, rgbFace=None):
+        self.calls.append(("draw_path", _frozen_gc(gc),
+                           (path, _frozen(transform), rgbFace)))
+        super().draw_path(gc, path, transform, rgbFace)
+
+    # Text is positioned from the top of the canvas; it is recorded from the
+    # bottom, like everything else.
+    def draw_text(self, gc, x, y, s, prop, angle, ismath=False, mtext=None):
+        self.calls.append(("draw_text", _frozen_gc(gc),
+                           (x, self.height - y, s, prop.copy(), angle,
+                            ismath)))
+        super().draw_text(gc, x, y, s, prop, angle, ismath, mtext)
+
+    def draw_tex(self, gc, x, y, s, prop, angle, *, mtext=None):
+        self.calls.append(("draw_tex", _frozen_gc(gc),
+                           (x, self.height - y, s, prop.copy(), angle)))
+        super().draw_tex(gc, x, y, s, prop, angle, mtext=mtext)
+
+    def open_group(self, s, gid=None):
+        self.calls.append(("open_group", None, (s, gid)))
+
+    def close_group(self, s):
+        self.calls.append(("close_group", None, (s,)))
+
+    def start_rasterizing(self):
+        self.calls.append(("start_rasterizing", None, ()))
+
+    def stop_rasterizing(self):
+        self.calls.append(("stop_rasterizing", None, ()))
+
+    def start_filter(self):
+        self.calls.append(("start_filter", None, ()))
+        super().start_filter()
+
+    def stop_filter(self, post_processing):
+        self.calls.append(("stop_filter", None, (post_processing,)))
+        super().stop_filter(post_processing)
+
+
+def _then(first, transform):
+    # Some path effects draw with no transform (the identity).
+    return transform if first is None else first + transform
+
+
+def _resampled(im, scale):
+    from PIL import Image
+
+    if scale == 1:
+        return im
+    h, w = im.shape[:2]
+    size = max(1, round(w * scale)), max(1, round(h * scale))
+    return np.asarray(Image.fromarray(im).resize(size, Image.LANCZOS))
+
+
+def _collection_transforms(master, offsets, offset_trans, transform, scale):
+    # The vertices are master(path) + offset_trans(offset), the offset being
+    # (0, 0) untransformed if there are none.
+    if len(offsets):
+        return (master + Affine2D().scale(scale), offset_trans + transform)
+    return master + transform, offset_trans
+
+
+def replay(calls, renderer, transform, scale, raster_transform=None,
+           image_scale=1):
+    """
+    Replay the recorded *calls* into *renderer*, mapping the recorded pixels
+    with *transform* (whose scale is *scale*), or with *raster_transform*
+    while rasterizing in a mixed-mode renderer.  Images are resampled by
+    *image_scale*.
+    """
+    current = transform, scale
+    for name, recorded, args in calls:
+        if name in ("open_group", "close_group", "start_filter",
+                    "stop_filter"):
+            getattr(renderer, name)(*args)
+            continue
+        if name in ("start_rasterizing", "stop_rasterizing"):
+            getattr(renderer, name)()
+            if raster_transform is not None:
+                current = ((raster_transform, 1) if name == "start_rasterizing"
+                           else (transform, scale))
+            continue
+        trans, s = current
+        gc = renderer.new_gc()
+        gc.copy_properties(recorded)
+        rect = recorded.get_clip_rectangle()
+        gc.set_clip_rectangle(None if rect is None
+                              else TransformedBbox(rect, trans))
+        path, affine = recorded.get_clip_path()
+        gc.set_clip_path(None if path is None
+                         else TransformedPath(path, affine + trans))
+        if name == "draw_path":
+            path, t, rgbFace = args
+            renderer.draw_path(gc, path, _then(t, trans), rgbFace)
+        elif name == "draw_markers":
+            marker_path, marker_trans, path, t, *rest = args
+            renderer.draw_markers(gc, marker_path,
+                                  marker_trans + Affine2D().scale(s),
+                                  path, _then(t, trans), *rest)
+        elif name == "draw_path_collection":
+            master, paths, all_transforms, offsets, offset_trans, *rest = args
+            master, offset_trans = _collection_transforms(
+                master, offsets, offset_trans, trans, s)
+            renderer.draw_path_collection(gc, master, paths, all_transforms,
+                                          offsets, offset_trans, *rest)
+        elif name == "draw_quad_mesh":
+            master, width, height, coords, offsets, offset_trans, *rest = args
+            master, offset_trans = _collection_transforms(
+                master, offsets, offset_trans, trans, s)
+            renderer.draw_quad_mesh(gc, master, width, height, coords,
+                                    offsets, offset_trans, *rest)
+        elif name == "draw_gouraud_triangles":
+            triangles, colors, t = args
+            renderer.draw_gouraud_triangles(gc, triangles, colors,
+                                            _then(t, trans))
+        elif name == "draw_image":
+            x, y, im, *_ = args
+            x, y = trans.transform((x, y))
+            renderer.draw_image(gc, x, y, _resampled(im, image_scale))
+        elif name in ("draw_text", "draw_tex"):
+            x, y, *rest = args
+            x, y = trans.transform((x, y))
+            if renderer.flipy():
+                y = renderer.get_canvas_width_height()[1] - y
+            getattr(renderer, name)(gc, x, y, *rest)
+        gc.restore()
+
+
+class DisplayList:
+    """
+    The draw calls of a figure, recorded once (see the module docstring).
+    """
+
+    def __init__(self, calls, rgba, dpi, bbox, figure_bbox, facecolor):
+        self.calls = calls
+        self.rgba = rgba  # the Agg rendering at *dpi*
+        self.dpi = dpi
+        self.bbox = bbox  # the saved area, in inches
+        self.figure_bbox = figure_bbox
+        self.facecolor = facecolor
+
+    @classmethod
+    def record(cls, fig, bbox_inches=None, pad_inches=None):
+        """
+        Draw *fig* once and return its display list.  With *bbox_inches*
+        ``"tight"``, the saved area is the tight bounding box of the
+        figure, padded by *pad_inches*, as with ``savefig``.
+        """
+        import matplotlib as mpl
+
+        width, height = fig.bbox.size
+        renderer = RecordingRenderer(width, height, fig.dpi)
+        fig.draw(renderer)
+        bbox = fig.bbox_inches
+        if bbox_inches == "tight":
+            if pad_inches is None:
+                pad_inches = mpl.rcParams["savefig.pad_inches"]
+            bbox = fig.get_tightbbox(renderer).padded(pad_inches)
+        return cls(renderer.calls, np.asarray(renderer.buffer_rgba()),
+                   fig.dpi, bbox.frozen(), fig.bbox_inches.frozen(),
+                   fig.get_facecolor())
+
+    def _inside(self):
+        (x0, y0), (x1, y1) = self.bbox.get_points()
+        (fx0, fy0), (fx1, fy1) = self.figure_bbox.get_points()
+        return x0 >= fx0 and y0 >= fy0 and x1 <= fx1 and y1 <= fy1
+
+    def _aligned(self):
+        # Whether the saved area starts on the pixels of the Agg buffer;
+        # savefig draws a tight bounding box from its fractional origin.
+        x0, y1 = self.bbox.x0 * self.dpi, self.bbox.y1 * self.dpi
+        return x0 == round(x0) and y1 == round(y1)
+
+    def _origin(self, dpi):
+        # Pixels at the recorded dpi -> *dpi* units of the saved area.
+        x0, y0 = self.bbox.p0 * self.dpi
+        scale = dpi / self.dpi
+        return (Affine2D().translate(-x0, -y0).scale(scale), scale)
+
+    def _replay(self, renderer, dpi, mixed=False):
+        if not self._inside():
+            # As with savefig, the figure background covers the saved area
+            # where it extends beyond the figure.
+            from matplotlib.path import Path
+
+            gc = renderer.new_gc()
+            gc.set_linewidth(0)
+            width, height = self.bbox.size * dpi
+            renderer.draw_path(gc, Path.unit_rectangle(),
+                               Affine2D().scale(width, height), self.facecolor)
+            gc.restore()
+        transform, scale = self._origin(dpi)
+        raster_transform = self._origin(self.dpi)[0] if mixed else None
+        replay(self.calls, renderer, transform, scale, raster_transform,
+               image_scale=1 if mixed else scale)
+
+    def to_rgba(self, dpi=None):
+        """
+        Return the RGBA image of the saved area at *dpi* (see the module
+        docstring for how it compares with ``savefig``).
+        """
+        dpi = dpi or self.dpi
+        width, height = (self.bbox.size * dpi).astype(int)
+        if dpi == self.dpi and self._inside() and self._aligned():
+            x0 = round(self.bbox.x0 * dpi)
+            top = self.rgba.shape[0] - round(self.bbox.y1 * dpi)
+            return np.ascontiguousarray(
+                self.rgba[top:top + height, x0:x0 + width])
+        # The fractional size, from which savefig places the text.
+        renderer = RendererAgg(*self.bbox.size * dpi, dpi)
+        self._replay(renderer, dpi)
+        return np.asarray(renderer.buffer_rgba())
+
+    def save(self, fname, format=None, dpi=None, metadata=None):
+        """
+        Write the figure to *fname* (a path or a file object) in *format*
+        (by default, the suffix of *fname*).  *dpi* only applies to PNG;
+        vector formats embed images at the recorded dpi.
+        """
+        import codecs
+
+        from matplotlib import cbook
+        from matplotlib.backends.backend_mixed import MixedModeRenderer
+        from matplotlib.image import imsave
+
+        if format is None:
+            format = str(fname).rpartition(".")[2].lower()
+        if format == "png":
+            imsave(fname, self.to_rgba(dpi), format="png",
+                   dpi=dpi or self.dpi, metadata=metadata)
+            return
+        width, height = self.bbox.size
+        # MixedModeRenderer sets the dpi of the figure while rasterizing.
+        figure = types.SimpleNamespace(dpi=72)
+        if format == "svg":
+            from matplotlib.backends.backend_svg import RendererSVG
+
+            with cbook.open_file_cm(fname, "w", encoding="utf-8") as fh:
+                if not cbook.file_requires_unicode(fh):
+                    fh = codecs.getwriter("utf-8")(fh)
+                renderer = MixedModeRenderer(
+                    figure, width, height, self.dpi,
+                    RendererSVG(width * 72, height * 72, fh,
+                                image_dpi=self.dpi, metadata=metadata))
+                self._replay(renderer, 72, mixed=True)
+                renderer.finalize()
+        elif format == "pdf":
+            from matplotlib.backends.backend_pdf import PdfFile, RendererPdf
+
+            file = PdfFile(fname, metadata=metadata)
+            try:
+                file.newPage(width, height)
+                renderer = MixedModeRenderer(
+                    figure, width, height, self.dpi,
+                    RendererPdf(file, self.dpi, height, width))
+                self._replay(renderer, 72, mixed=True)
+                renderer.finalize()
+                file.finalize()
+            finally:
+                file.close()
+        else:
+            raise ValueError(f"unsupported format: {format!r}")
+
+
+def export(fig, stem, formats=FORMATS, dpi=None, bbox_inches="tight",
+           budget=None, rasterized=None):
+    """
+    Write *fig* to ``<stem>.<format>`` for each of *formats*, drawing it
+    once, and return the time taken by each step, in seconds.  *stem* may
+    also be None, to only encode the figures (for timing them).
+
+    With a *budget*, ``(max vertices, max draw calls)``, the artists over
+    the budget are rasterized in the vector formats (see `.rasterize`); they
+    are appended to the list *rasterized*, if given.
+    """
+    if dpi is not None:
+        fig.set_dpi(dpi)
+    timings = {}
+    with contextlib.ExitStack() as stack:
+        if budget is not None:
+            from .rasterize import auto_rasterized
+
+            start = time.perf_counter()
+            selected = stack.enter_context(auto_rasterized(fig, *budget))
+            timings["measure"] = time.perf_counter() - start
+            if rasterized is not None:
+                rasterized.extend(selected)
+        start = time.perf_counter()
+        display_list = DisplayList.record(fig, bbox_inches=bbox_inches)
+        timings["record"] = time.perf_counter() - start
+    for fmt in formats:
+        start = time.perf_counter()
+        target = io.BytesIO() if stem is None else f"{stem}.{fmt}"
+        display_list.save(target, format=fmt)
+        timings[fmt] = time.perf_counter() - start
+    return timings
+
+
+def export_post(path, formats=FORMATS, dpi=None, directory=EXPORT_DIR,
+                budget=None):
+    """
+    Export the headline figure of the post at *path* (see `.bench`) to
+    ``<directory>/<post>/headline.<format>``, and return the post name, the
+    timings and, with a *budget*, the vertex and draw counts of the
+    rasterized artists.
+    """
+    from .bench import build_headline
+    from .fonts import use_snapshot
+    from .posts import Post
+    from .runner import use_agg
+
+    use_snapshot()
+    use_agg()
+    post = Post(path)
+    fig = build_headline(post)
+    target = directory / post.name
+    target.mkdir(parents=True, exist_ok=True)
+    rasterized = []
+    timings = export(fig, target / "headline", formats, dpi=dpi,
+                     budget=budget, rasterized=rasterized)
+    return post.name, timings, [(type(artist).__name__, vertices, draws)
+                                for artist, vertices, draws in rasterized]
@@ -0,0 +1,174 @@
+"""
+Draft-quality rendering, for checking the layout of a post quickly.
+
+`install` replaces, in the current process, the raster effects of
+mpl-visual-context with cheap vector stand-ins, and caps the number of
+segments that the prisms of mpl-poormans-3d draw:
+
+- an `ImageEffect` draws the path (through its own path effects) flat, with
+  the offset, fill color and alpha of its image effects, and without the
+  blurs, dilations, light sources, ...;
+- an `AlphaGradient` (or `Gradient`) fills the path flat;
+- the image clipboards record the draw calls instead of rasterizing them,
+  and pasting them (also with a `ReflectionArtist`) replays these calls, with
+  the stand-in of the image effect;
+- the segments of a `BarToCharPrism` (any prism with *segment_params*) are
+  subsampled to at most *max_segments*.
+
+Draft builds (``render --draft``) also render at `DRAFT_DPI`.  The patches
+are never undone; they are meant for build workers, which execute a single
+post.
+"""
+
+import math
+
+DRAFT_DPI = 50
+MAX_PRISM_SEGMENTS = 4
+
+_installed = False
+
+
+def _image_effects(image_effect):
+    if image_effect is None:
+        return []
+    return list(getattr(image_effect, "_ie_list", [image_effect]))
+
+
+def _draw_standin(renderer, gc, tpath, affine, rgbFace, path_effect,
+                  image_effect=None, alpha=None):
+    """
+    Draw *tpath* through *path_effect*, with the offset, fill color and
+    alpha of *image_effect* (and the given *alpha*), as a flat vector path.
+    """
+    import numpy as np
+    from matplotlib import colors as mcolors
+    from matplotlib.transforms import Affine2D
+    from mpl_visual_context import image_effect as ie
+
+    ox = oy = 0.
+    color = None
+    alpha_scale = 1. if alpha is None else alpha
+    for effect in _image_effects(image_effect):
+        if isinstance(effect, ie.Offset):
+            ox += effect.ox
+            oy += effect.oy
+        elif isinstance(effect, ie.Fill):
+            color = effect.c
+        elif isinstance(effect, ie.AlphaAxb):
+            a, b = effect.alpha_ab
+            alpha_scale = float(np.clip(a * alpha_scale + b, 0, 1))
+    gc0 = renderer.new_gc()
+    gc0.copy_properties(gc)
+    if color is not None:
+        rgbFace = mcolors.to_rgba(color)
+        gc0.set_foreground(color)
+    if alpha_scale != 1:
+        gc0.set_alpha((gc.get_alpha() if gc.get_forced_alpha() else 1.)
+                      * alpha_scale)
+    if ox or oy:
+        affine = affine + Affine2D().translate(renderer.points_to_pixels(ox),
+                                               renderer.points_to_pixels(oy))
+    if path_effect is not None:
+        path_effect.draw_path(renderer, gc0, tpath, affine, rgbFace)
+    else:
+        renderer.draw_path(gc0, tpath, affine, rgbFace)
+    gc0.restore()
+
+
+def _record(clipboard, renderer, gc, tpath, affine, rgbFace, path_effect):
+    gc0 = renderer.new_gc()
+    gc0.copy_properties(gc)
+    draws = clipboard.__dict__.setdefault("_draft_draws", [])
+    draws.append((gc0, tpath, affine.frozen(), rgbFace, path_effect))
+
+
+def _replay(clipboard, renderer, image_effect=None, alpha=None, clear=True):
+    for gc, tpath, affine, rgbFace, path_effect in \
+            clipboard.__dict__.get("_draft_draws", []):
+        _draw_standin(renderer, gc, tpath, affine, rgbFace, path_effect,
+                      image_effect, alpha)
+    if clear:
+        clipboard.__dict__.pop("_draft_draws", None)
+
+
+def _patch_visual_context():
+    from mpl_visual_context import patheffects_image_box as pib
+    from mpl_visual_context import patheffects_image_effect as pie
+
+    def image_effect_draw_path(self, renderer, gc, tpath, affine, rgbFace):
+        _draw_standin(renderer, gc, tpath, affine, rgbFace,
+                      self._path_effect, self._image_effect)
+
+    def gradient_draw_path(self, renderer, gc, tpath, affine, rgbFace):
+        renderer.draw_path(gc, tpath, affine, rgbFace)
+
+    def copy_draw_path(self, renderer, gc, tpath, affine, rgbFace):
+        _record(self.clipboard, renderer, gc, tpath, affine, rgbFace,
+                self._path_effect)
+        if not self.stop_drawing:
+            renderer.draw_path(gc, tpath, affine, rgbFace)
+
+    def paste_draw_path(self, renderer, gc, tpath, affine, rgbFace):
+        _replay(self.clipboard, renderer, self._image_effect,
+                clear=self.clear)
+
+    def paste_artist_draw(self, renderer):
+        if not self.get_visible():
+            return
+        alpha = getattr(self, "_alpha_default", None)
+        _replay(self._clipboard, renderer, self._image_effect, alpha,
+                clear=self._clear)
+        clipboard_alpha = getattr(self, "_clipboard_alpha", None)
+        if clipboard_alpha is not None and self._clear_alpha:
+            clipboard_alpha.__dict__.pop("_draft_draws", None)
+
+    pie.ImageEffect.draw_path = image_effect_draw_path
+    pib.GradientBase.draw_path = gradient_draw_path
+    pie.CopyToClipboard.draw_path = copy_draw_path
+    pie.PasteFromClipboard.draw_path = paste_draw_path
+    pie.ClipboardPasteArtist.draw = paste_artist_draw
+
+
+def _patch_poormans_3d(max_segments):
+    from mpl_poormans_3d import prism_3d
+
+    draw_path = prism_3d.PrismBase.draw_path
+
+    def capped_draw_path(self, renderer, gc, tpath, affine, rgbFace):
+        params = self.segment_params
+        if not params or len(params[2]) <= max_segments:
+            return draw_path(self, renderer, gc, tpath, affine, rgbFace)
+        step = math.ceil(len(params[2]) / max_segments)
+        capped = list(params)
+        capped[2] = list(params[2])[::step]
+        if len(params) == 5:
+            capped[4] = list(params[4])[::step]
+        self.segment_params = tuple(capped)
+        try:
+            return draw_path(self, renderer, gc, tpath, affine, rgbFace)
+        finally:
+            self.segment_params = params
+
+    prism_3d.PrismBase.draw_path = capped_draw_path
+
+
+def install(max_segments=MAX_PRISM_SEGMENTS):
+    """
+    Install the draft stand-ins for the libraries that are installed, and
+    return the names of the patched libraries.
+    """
+    global _installed
+
+    if _installed:
+        return []
+    patched = []
+    for name, patch, args in [("mpl_visual_context", _patch_visual_context, ()),
+                              ("mpl_poormans_3d", _patch_poormans_3d,
+                               (max_segments,))]:
+        try:
+            patch(*args)
+        except ImportError:
+            continue
+        patched.append(name)
+    _installed = True
+    return patched
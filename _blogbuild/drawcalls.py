@@ -0,0 +1,241 @@
+"""
+Accounting for the draw calls of a figure.
+
+A bar drawn with ``get_pe_face(0) | ImageEffect``, then ``bar_to_prism``,
+then ``get_pe_face(1)`` is one artist in the figure, but dozens of calls to
+the renderer.  `AccountingRenderer` is an Agg renderer that counts the
+calls it receives (``draw_path``, ``draw_markers``, ``draw_image``,
+``draw_text``, ...), the vertices submitted and the image pixels
+composited, and attributes them to
+
+- the artist being drawn: `attributed` makes the artists of the figure
+  push themselves on the renderer while they draw, so that the calls go to
+  the innermost one;
+- the chain of path effects the call came through, read from the stack of
+  the caller: ``Offset | ImageEffect > ImageEffect`` is a call made by an
+  ``ImageEffect`` that terminates a chain.
+
+The images that image effects draw offscreen only count once composited.
+`account` draws a figure with it and returns the totals per artist type and
+chain; ``python -m _blogbuild drawcalls`` prints them for the headline
+figures of the posts.
+"""
+
+import contextlib
+import sys
+
+from matplotlib.backend_bases import RendererBase
+from matplotlib.backends.backend_agg import RendererAgg
+
+from .displaylist import _BOUND_METHODS
+
+# Stack frames looked through for path effects.
+MAX_DEPTH = 40
+
+
+def _vertices(path):
+    return 0 if path is None else len(path.vertices)
+
+
+def _cost(name, args):
+    """
+    Return the vertices and the image pixels of a call to the bound method
+    *name* with *args* (without the graphics context).
+    """
+    if name == "draw_markers":
+        return _vertices(args[0]) * _vertices(args[2]), 0
+    if name == "draw_path_collection":
+        paths, all_transforms, offsets = args[1], args[2], args[3]
+        n = max(len(paths), len(offsets), len(all_transforms))
+        return round(sum(map(_vertices, paths)) / max(len(paths), 1) * n), 0
+    if name == "draw_quad_mesh":
+        return 4 * args[1] * args[2], 0
+    if name == "draw_gouraud_triangles":
+        return 3 * len(args[0]), 0
+    if name == "draw_image":
+        im = args[2]
+        return 0, im.shape[0] * im.shape[1]
+    return 0, 0
+
+
+def _describe(effect):
+    parts = list(getattr(effect, "_pe_list", []))
+    if hasattr(effect, "_pe_final"):
+        parts.append(effect._pe_final)
+    return " | ".join(type(p).__name__ for p in parts or [effect])
+
+
+def _path_effect_chain(frame, artist):
+    """
+    Return the path effects whose ``draw_path`` is on the stack from *frame*
+    up to the ``draw`` of *artist*, outermost first, described.
+    """
+    effects = []
+    for _ in range(MAX_DEPTH):
+        if frame is None:
+            break
+        owner = frame.f_locals.get("self")
+        if owner is artist and owner is not None:
+            break
+        # A draw_path calling that of its base class (like ``withStroke``)
+        # is the same path effect.
+        if (frame.f_code.co_name == "draw_path" and owner is not None
+                and not isinstance(owner, RendererBase)
+                and not (effects and effects[-1] is owner)):
+            effects.append(owner)
+        frame = frame.f_back
+    effects.reverse()
+    chain = []
+    for outer, effect in zip([None] + effects, effects):
+        # A terminated chain hands over to its last path effect.
+        if getattr(outer, "_pe_final", None) is not effect:
+            chain.append(_describe(effect))
+    return " > ".join(chain)
+
+
+class AccountingRenderer(RendererAgg):
+    """
+    An Agg renderer that counts the calls it receives, in `accounts`:
+    ``{(artist, path effect chain): {"calls": {method: count}, "vertices":
+    n, "pixels": n}}``.  With *draw* False, it only counts; without
+    *chains*, the calls are not attributed to path effects (which is
+    quicker).
+    """
+
+    def __init__(self, width, height, dpi, draw=True, chains=True):
+        self.accounts = {}
+        self.artists = []
+        self._draw = draw
+        self._chains = chains
+        super().__init__(width, height, dpi)
+
+    def _update_methods(self):
+        # Also called when Agg filters swap the underlying renderer.
+        super()._update_methods()
+        for name in _BOUND_METHODS:
+            setattr(self, name, self._counter(name, getattr(self, name)))
+
+    def _counter(self, name, method):
+        def draw(gc, *args):
+            self._account(name, *_cost(name, args))
+            if self._draw:
+                return method(gc, *args)
+        return draw
+
+    def _account(self, name, vertices=0, pixels=0):
+        artist = self.artists[-1] if self.artists else None
+        chain = ""
+        if self._chains:
+            chain = _path_effect_chain(sys._getframe(2), artist)
+        account = self.accounts.setdefault(
+            (artist, chain), {"calls": {}, "vertices": 0, "pixels": 0})
+        account["calls"][name] = account["calls"].get(name, 0) + 1
+        account["vertices"] += vertices
+        account["pixels"] += pixels
+
+    def draw_path(self, gc, path, transform, rgbFace=None):
+        self._account("draw_path", _vertices(path))
+        if self._draw:
+            super().draw_path(gc, path, transform, rgbFace)
+
+    def draw_text(self, gc, x, y, s, prop, angle, ismath=False, mtext=None):
+        self._account("draw_text")
+        if self._draw:
+            super().draw_text(gc, x, y, s, prop, angle, ismath, mtext)
+
+    def draw_tex(self, gc, x, y, s, prop, angle, *, mtext=None):
+        self._account("draw_tex")
+        if self._draw:
+            super().draw_tex(gc, x, y, s, prop, angle, mtext=mtext)
+
+
+@contextlib.contextmanager
+def attributed(fig, renderer):
+    """
+    Make the artists of *fig* push themselves on ``renderer.artists`` while
+    they draw, in the ``with`` block.
+    """
+    artists = fig.findobj(include_self=False)
+    for artist in artists:
+        def draw(r, *args, _artist=artist, _draw=artist.draw, **kwargs):
+            renderer.artists.append(_artist)
+            try:
+                return _draw(r, *args, **kwargs)
+            finally:
+                renderer.artists.pop()
+        artist.draw = draw
+    try:
+        yield
+    finally:
+        for artist in artists:
+            vars(artist).pop("draw", None)
+
+
+def _artist_label(artist):
+    if artist is None:
+        return "(figure)"
+    name = type(artist).__name__
+    label = artist.get_label()
+    if label and not label.startswith("_"):
+        name += f" {label!r}"
+    return name
+
+
+def account(fig, dpi=None):
+    """
+    Draw *fig* with an `AccountingRenderer` and return the totals per artist
+    type (with its label, if any) and path effect chain, as dicts with the
+    number of artists, the calls per method, the vertices and the pixels,
+    most calls first.
+    """
+    if dpi is not None:
+        fig.set_dpi(dpi)
+    width, height = fig.bbox.size
+    renderer = AccountingRenderer(width, height, fig.dpi)
+    with attributed(fig, renderer):
+        fig.draw(renderer)
+    rows = {}
+    for (artist, chain), account in renderer.accounts.items():
+        key = (_artist_label(artist), chain)
+        row = rows.setdefault(key, {"artist": key[0], "chain": chain,
+                                    "artists": set(), "calls": {},
+                                    "vertices": 0, "pixels": 0})
+        row["artists"].add(id(artist))
+        for name, n in account["calls"].items():
+            row["calls"][name] = row["calls"].get(name, 0) + n
+        row["vertices"] += account["vertices"]
+        row["pixels"] += account["pixels"]
+    rows = [dict(row, artists=len(row["artists"])) for row in rows.values()]
+    rows.sort(key=lambda row: sum(row["calls"].values()), reverse=True)
+    return rows
+
+
+def format_rows(rows, top=None):
+    lines = [f"{'calls':>7} {'vertices':>10} {'pixels':>10} {'artists':>7}  "
+             "artist [path effects]"]
+    for row in rows[:top]:
+        calls = sum(row["calls"].values())
+        chain = f" [{row['chain']}]" if row["chain"] else ""
+        lines.append(f"{calls:7d} {row['vertices']:10d} {row['pixels']:10d} "
+                     f"{row['artists']:7d}  {row['artist']}{chain}")
+        lines.append(" " * 39 + ", ".join(
+            f"{name} {n}" for name, n in sorted(row["calls"].items())))
+    total = sum(sum(row["calls"].values()) for row in rows)
+    lines.append(f"{total:7d} calls in total")
+    return "\n".join(lines)
+
+
+def account_post(path, dpi=None):
+    """
+    Account for the draw calls of the headline figure of the post at *path*
+    (see `.bench`), in a worker, and return the post name and the rows.
+    """
+    from .bench import build_headline
+    from .fonts import use_snapshot
+    from .posts import Post
+    from .runner import use_agg
+
+    use_snapshot()
+    use_agg()
+    post = Post(path)
+    return post.name, account(build_headline(post), dpi=dpi)
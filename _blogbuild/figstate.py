@@ -0,0 +1,165 @@
+"""
+Digests of the state of a figure, to avoid encoding the same picture twice.
+
+The tutorials re-display the figure after every small step with cells that
+only contain ``fig``; when the step did not change the figure (or the cell
+is displayed twice), the PNG encoded the last time can be reused.
+
+The digest walks everything reachable from the figure through instance
+attributes (artists, their properties, transforms, path effects and their
+configuration, ...), hashing numpy arrays by content.  The functions of
+the post (formatters, callbacks, ...), which run in ``__main__``, are
+walked through their code, their defaults, the contents of their closure
+and the globals they name, so that a formatter reading a variable that
+changed is seen as changed.  Library functions and the objects that cannot
+be walked (builtins, modules, classes, C extension objects, ...) are hashed
+by identity, which is stable within the process.  The canvas and renderer
+caches are left out.  The state after rendering is recorded as well, since
+drawing fills caches that are then part of the walked state.
+"""
+
+import functools
+import hashlib
+from collections import OrderedDict
+from types import (BuiltinFunctionType, CodeType, FunctionType, MethodType,
+                   ModuleType)
+import weakref
+
+import numpy as np
+
+SKIPPED_ATTRIBUTES = {"canvas", "_cachedRenderer", "_renderer", "stale",
+                      "_stale", "stale_callback", "_remove_method",
+                      "_canvas_callbacks", "_parents", "_invalid"}
+
+_PRIMITIVES = (str, bytes, int, float, complex, bool, type(None))
+_OPAQUE = (FunctionType, BuiltinFunctionType, ModuleType, type, weakref.ref)
+
+
+def _set_order(obj):
+    return (type(obj).__name__,
+            repr(obj) if isinstance(obj, _PRIMITIVES) else str(id(obj)))
+
+
+class _Walker:
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.seen = {}
+        # Keep the walked objects alive so that their ids are not reused.
+        self._alive = []
+
+    def feed(self, *tokens):
+        for token in tokens:
+            self.hasher.update(str(token).encode())
+            self.hasher.update(b"\0")
+
+    def walk(self, obj):
+        if isinstance(obj, _PRIMITIVES):
+            self.feed(type(obj).__name__, repr(obj))
+            return
+        if id(obj) in self.seen:
+            self.feed("ref", self.seen[id(obj)])
+            return
+        self.seen[id(obj)] = len(self.seen)
+        self._alive.append(obj)
+
+        if isinstance(obj, np.ndarray):
+            self.feed("ndarray", obj.dtype.str, obj.shape)
+            if obj.dtype.hasobject:
+                for item in obj.flat:
+                    self.walk(item)
+            else:
+                self.hasher.update(np.ascontiguousarray(obj).tobytes())
+            if isinstance(obj, np.ma.MaskedArray):
+                self.walk(np.ma.getmaskarray(obj))
+        elif (isinstance(obj, FunctionType)
+              and obj.__globals__.get("__name__") == "__main__"):
+            self.feed("function", obj.__module__, obj.__qualname__)
+            self.walk_code(obj.__code__, obj.__globals__)
+            self.walk(obj.__defaults__)
+            self.walk(obj.__kwdefaults__)
+            for cell in obj.__closure__ or ():
+                try:
+                    self.walk(cell.cell_contents)
+                except ValueError:  # Not assigned yet.
+                    self.feed("empty cell")
+        elif isinstance(obj, MethodType):
+            self.feed("method")
+            self.walk(obj.__func__)
+            self.walk(obj.__self__)
+        elif isinstance(obj, functools.partial):
+            self.feed("partial")
+            self.walk([obj.func, obj.args, obj.keywords])
+        elif isinstance(obj, _OPAQUE):
+            self.feed("opaque", getattr(obj, "__qualname__", type(obj)),
+                      id(obj))
+        elif isinstance(obj, (list, tuple)):
+            self.feed(type(obj).__name__, len(obj))
+            for item in obj:
+                self.walk(item)
+        elif isinstance(obj, (set, frozenset)):
+            self.feed(type(obj).__name__, len(obj))
+            for item in sorted(obj, key=_set_order):
+                self.walk(item)
+        elif isinstance(obj, dict):
+            self.feed("dict", len(obj))
+            for key in sorted(obj, key=repr):
+                if key in SKIPPED_ATTRIBUTES:
+                    continue
+                self.walk(key)
+                self.walk(obj[key])
+        elif hasattr(obj, "__dict__"):
+            self.feed("object", type(obj).__module__, type(obj).__qualname__)
+            self.walk(vars(obj))
+        else:
+            self.feed("opaque", type(obj).__qualname__, id(obj))
+
+    def walk_code(self, code, globals):
+        """
+        Walk the code object *code* and the values of the names it reads from
+        *globals* (which, for attributes, may be some that it does not).
+        """
+        self.hasher.update(code.co_code)
+        self.feed("code", code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, CodeType):
+                self.walk_code(const, globals)
+            else:
+                self.walk(const)
+        for name in code.co_names:
+            if name in globals:
+                self.walk(globals[name])
+
+
+def figure_digest(fig, *extra):
+    """
+    Return a digest of the state of *fig*, the rcParams and *extra*.
+    """
+    import matplotlib
+
+    walker = _Walker()
+    walker.walk(list(extra))
+    walker.walk(dict(matplotlib.rcParams))
+    walker.walk(fig)
+    return walker.hasher.hexdigest()
+
+
+class PNGMemo:
+    """
+    The PNGs most recently encoded, keyed by figure digest.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._pngs = OrderedDict()
+
+    def get(self, digest):
+        png = self._pngs.get(digest)
+        if png is not None:
+            self._pngs.move_to_end(digest)
+        return png
+
+    def put(self, digest, png):
+        self._pngs[digest] = png
+        self._pngs.move_to_end(digest)
+        while len(self._pngs) > self.maxsize:
+            self._pngs.popitem(last=False)
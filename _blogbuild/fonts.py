@@ -0,0 +1,124 @@
+"""
+A font-manager snapshot shared by the build workers.
+
+matplotlib finds the installed fonts once and caches the list in its cache
+directory, but every fresh process still loads it, and the fonts of extra
+font directories (the ones shipped with ``mplfonts``, or living in a post
+directory) are added with ``addfont`` again by every post that uses them.
+
+`share_snapshot` builds, in the parent process, a font list that includes
+the fonts of the extra directories and stores it under ``_build/fonts``,
+keyed by the matplotlib version and the extra font files.  Its location is
+passed to the workers (and to the fork server) in an environment variable;
+`use_snapshot` makes matplotlib load that list instead of its own, before
+``matplotlib.font_manager`` is first imported, so that no worker runs font
+discovery.
+"""
+
+import hashlib
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+from .config import FONT_CACHE_DIR, POSTS_DIR
+
+SNAPSHOT_ENV = "BLOGBUILD_FONT_SNAPSHOT"
+
+# Packages shipping fonts, and the directory of their fonts.
+FONT_PACKAGES = {"mplfonts": "fonts"}
+
+FONT_SUFFIXES = (".ttf", ".otf", ".ttc", ".afm")
+
+# The snapshot this process loaded its font list from.
+_installed = None
+
+
+def extra_font_dirs(posts_dir=POSTS_DIR):
+    """
+    Return the font directories of the `FONT_PACKAGES` that are installed
+    and the post directories that contain fonts.
+    """
+    dirs = []
+    for package, subdir in FONT_PACKAGES.items():
+        # find_spec does not import the package (mplfonts imports the font
+        # manager).
+        spec = importlib.util.find_spec(package)
+        if spec is not None and spec.origin is not None:
+            directory = Path(spec.origin).parent / subdir
+            if directory.is_dir():
+                dirs.append(directory)
+    for directory in sorted(Path(posts_dir).iterdir()):
+        if directory.is_dir() and any(p.suffix.lower() in FONT_SUFFIXES
+                                      for p in directory.iterdir()):
+            dirs.append(directory)
+    return dirs
+
+
+def _font_files(dirs):
+    return sorted(p for d in dirs for p in Path(d).iterdir()
+                  if p.suffix.lower() in FONT_SUFFIXES)
+
+
+def share_snapshot(directory=FONT_CACHE_DIR):
+    """
+    Build the font-manager snapshot if needed, point `SNAPSHOT_ENV` at it
+    for the processes started from now on, and return its directory.
+    """
+    import matplotlib
+    from matplotlib import font_manager
+
+    files = _font_files(extra_font_dirs())
+    h = hashlib.sha256()
+    h.update(f"{matplotlib.__version__} "
+             f"{font_manager.FontManager.__version__}\n".encode())
+    for path in files:
+        st = path.stat()
+        h.update(f"{path} {st.st_size} {st.st_mtime_ns}\n".encode())
+    snapshot_dir = directory / h.hexdigest()[:16]
+    fm_path = (snapshot_dir /
+               f"fontlist-v{font_manager.FontManager.__version__}.json")
+    if not fm_path.exists():
+        # A copy of matplotlib's font list, without touching the one this
+        # process uses.
+        fm = font_manager._load_fontmanager()
+        for path in files:
+            try:
+                fm.addfont(path)
+            except Exception:
+                pass  # not a font FreeType can read
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        tmp = fm_path.with_name(f"{fm_path.name}.{os.getpid()}.tmp")
+        font_manager.json_dump(fm, tmp)
+        os.replace(tmp, fm_path)
+    os.environ[SNAPSHOT_ENV] = str(snapshot_dir)
+    return snapshot_dir
+
+
+def use_snapshot(snapshot_dir=None):
+    """
+    Make matplotlib load its font list from *snapshot_dir* (default: the
+    `SNAPSHOT_ENV` environment variable).  Return whether the snapshot is
+    in use.
+
+    This only works before ``matplotlib.font_manager`` is imported, as
+    other modules bind ``findfont`` at import time.
+    """
+    global _installed
+
+    snapshot_dir = snapshot_dir or os.environ.get(SNAPSHOT_ENV)
+    if not snapshot_dir:
+        return False
+    if "matplotlib.font_manager" in sys.modules:
+        return _installed == str(snapshot_dir)
+    import matplotlib
+
+    # The font manager loads its list from get_cachedir() at import.
+    get_cachedir = matplotlib.get_cachedir
+    matplotlib.get_cachedir = lambda: str(snapshot_dir)
+    try:
+        from matplotlib import font_manager
+    finally:
+        matplotlib.get_cachedir = get_cachedir
+    _installed = str(snapshot_dir)
+    return True
@@ -0,0 +1,147 @@
+"""
+Writing the results of the posts where Quarto reads them.
+
+The posts are frozen (``freeze: true`` in ``posts/_metadata.yml``): Quarto
+does not execute a post that has execution results in ``_freeze``, it only
+converts the markdown stored there.  `write_freeze` writes these results
+from a render, in the layout of Quarto's own:
+
+- ``_freeze/posts/<post>/index/execute-results/html.json``, with the
+  markdown of the post: its YAML header, its markdown cells and, for each
+  code cell, a ``.cell`` div with the code and the outputs, as the Jupyter
+  engine of Quarto writes them;
+- ``_freeze/posts/<post>/index/figure-html/``, the images the markdown
+  links to (as ``index_files/figure-html/...``, where Quarto copies them),
+  hard links to the blob store (see `.blobs`).
+
+The ``echo``, ``output``, ``code-fold`` and ``code-line-numbers`` options
+of the cells are applied (``warning`` already is, by the runner).  Only the
+full renders without errors are written: previews, drafts and failed
+renders would otherwise end up on the site.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+
+from .blobs import BlobStore
+from .config import FREEZE_DIR, POSTS_DIR
+from .posts import HEADER_MARKER, Post, _uncomment
+
+# Cell options that Quarto puts on the code block.
+CODE_OPTIONS = ("code-fold", "code-line-numbers")
+
+
+def _fenced(text, attributes=""):
+    fence = "```"
+    while fence in text:
+        fence += "`"
+    return f"{fence}{attributes}\n{text.rstrip()}\n{fence}"
+
+
+def _option(value):
+    if isinstance(value, bool):
+        value = str(value).lower()
+    return json.dumps(str(value))
+
+
+def _header(post):
+    lines = post.read_lines()
+    if not lines or lines[0].rstrip() != HEADER_MARKER:
+        return ""
+    end = next((i for i, line in enumerate(lines[1:], start=1)
+                if line.rstrip() == HEADER_MARKER), None)
+    if end is None:
+        return ""
+    return "\n".join(["---"] + [_uncomment(l) for l in lines[1:end]]
+                     + ["---"])
+
+
+def _outputs(cell, result, figures, prefix):
+    """
+    Return the markdown of the outputs of a code cell, and add the images to
+    *figures* (``{file name: png bytes}``), linked to under *prefix*.
+    """
+    blocks = []
+    k = 0
+    for output in result["outputs"]:
+        kind = output["output_type"]
+        if kind == "stream":
+            blocks.append(f"::: {{.cell-output .cell-output-{output['name']}}}"
+                          f"\n{_fenced(output['text'])}\n:::")
+        elif "image/png" in output.get("data", {}):
+            k += 1
+            name = f"cell-{cell.index + 1}-output-{k}.png"
+            figures[name] = base64.b64decode(output["data"]["image/png"])
+            blocks.append("::: {.cell-output .cell-output-display}\n"
+                          f"![]({prefix}/{name})\n:::")
+        elif "text/plain" in output.get("data", {}):
+            blocks.append("::: {.cell-output .cell-output-display}\n"
+                          f"{_fenced(output['data']['text/plain'])}\n:::")
+    return blocks
+
+
+def frozen_markdown(post, results):
+    """
+    Return the markdown of *post* with the outputs of the cell *results*,
+    and the images it links to, ``{file name: png bytes}``.
+    """
+    results = {r["index"]: r for r in results}
+    prefix = f"{post.path.stem}_files/figure-html"
+    figures = {}
+    blocks = [_header(post)]
+    for cell in post.cells():
+        if not cell.is_code:
+            blocks.append(cell.source)
+            continue
+        result = results.get(cell.index)
+        parts = []
+        if cell.options.get("echo", True) is not False:
+            attributes = "".join(
+                f" {key}={_option(cell.options[key])}"
+                for key in CODE_OPTIONS if key in cell.options)
+            parts.append(_fenced(cell.source,
+                                 f" {{.python .cell-code{attributes}}}"))
+        if (result is not None
+                and cell.options.get("output", True) is not False):
+            parts += _outputs(cell, result, figures, prefix)
+        blocks.append("::: {.cell}\n" + "\n\n".join(parts) + "\n:::")
+    return "\n\n".join(block for block in blocks if block) + "\n", figures
+
+
+def write_freeze(result, freeze_dir=FREEZE_DIR, post=None, blobs=None):
+    """
+    Write the execution results of a full render of a post where Quarto
+    reads them, with the images in *blobs*, and return the directory, or
+    None if *result* is a preview, a draft or a failed render.
+    """
+    if (result.get("preview", False) or result.get("draft", False)
+            or result["status"] != "ok"):
+        return None
+    post = post or Post(POSTS_DIR / result["name"] / "index.py")
+    markdown, figures = frozen_markdown(post, result["cells"])
+    directory = freeze_dir / "posts" / result["name"] / post.path.stem
+    shutil.rmtree(directory / "figure-html", ignore_errors=True)
+    (directory / "figure-html").mkdir(parents=True)
+    blobs = blobs or BlobStore()
+    for name, png in figures.items():
+        blobs.link(png, "image/png", directory / "figure-html" / name)
+    frozen = {
+        "hash": hashlib.md5(post.path.read_bytes()).hexdigest(),
+        "result": {
+            "engine": "jupyter",
+            "markdown": markdown,
+            "supporting": [f"{post.path.stem}_files"],
+            "filters": [],
+            "includes": {},
+        },
+    }
+    target = directory / "execute-results" / "html.json"
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(frozen, f, indent=2)
+    os.replace(tmp, target)
+    return directory
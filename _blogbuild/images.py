@@ -0,0 +1,204 @@
+"""
+Recompressing the PNGs and GIFs of the site.
+
+After Quarto has rendered the site, `optimize` rewrites every PNG under the
+site directory with the best zlib settings Pillow offers, dropping the text
+chunks matplotlib writes ("Software", ...) and the ICC profile.  Images
+with at most 256 colors are stored as palette images, which is lossless.
+With *quantize*, the other images are quantized to a 256-color palette too
+(lossy, but flat bar charts usually look the same); the result is only
+kept if it is smaller.
+
+GIFs, like ``images/fig_waffle_anim.gif``, are re-encoded losslessly by
+`recompress_gif`: identical consecutive frames are merged into one shown
+for their summed duration, the comments and application extensions are
+dropped, and each frame only stores the area that changed.  The result is
+only kept if it is smaller and decodes to the same frames; GIFs with
+transparency are left as they are.
+
+The work is spread over a process pool.  Results are cached by the sha256
+of the input (and the options), so an unchanged image is never processed
+twice; images that are already optimal are remembered as such.
+"""
+
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .config import IMAGE_CACHE_DIR, SITE_DIR
+
+SUFFIXES = (".png", ".gif")
+
+
+def _encode(img):
+    buf = io.BytesIO()
+    img.save(buf, "PNG", optimize=True, dpi=img.info.get("dpi", (72, 72)))
+    return buf.getvalue()
+
+
+def recompress(data, quantize=False):
+    """
+    Return the smallest PNG encoding of the PNG *data* found (or *data*
+    itself).
+    """
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    dpi = img.info.get("dpi")
+    # Dropping info drops the text chunks and the ICC profile.
+    img.info = {"dpi": dpi} if dpi else {}
+    candidates = [_encode(img)]
+    if img.mode in ("RGB", "RGBA"):
+        colors = img.getcolors(256)
+        if colors is not None or quantize:
+            method = (Image.Quantize.FASTOCTREE if img.mode == "RGBA"
+                      else Image.Quantize.MEDIANCUT)
+            # With at most 256 colors, the palette holds all of them.
+            paletted = img.quantize(256, method=method,
+                                    dither=Image.Dither.NONE)
+            if quantize or _same_pixels(img, paletted):
+                paletted.info = img.info
+                candidates.append(_encode(paletted))
+    return min(candidates + [data], key=len)
+
+
+def _same_pixels(img, paletted):
+    return paletted.convert(img.mode).tobytes() == img.tobytes()
+
+
+def _gif_frames(data):
+    """
+    Return the frames of the GIF *data*, as RGBA images, with identical
+    consecutive frames merged, and their durations.
+    """
+    from PIL import Image, ImageSequence
+
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(Image.open(io.BytesIO(data))):
+        rgba = frame.convert("RGBA")
+        duration = frame.info.get("duration", 0)
+        if frames and rgba.tobytes() == frames[-1].tobytes():
+            durations[-1] += duration
+        else:
+            frames.append(rgba)
+            durations.append(duration)
+    return frames, durations
+
+
+def recompress_gif(data):
+    """
+    Return the smallest lossless GIF encoding of the GIF *data* found (or
+    *data* itself).
+    """
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    frames, durations = _gif_frames(data)
+    if any(frame.getextrema()[3][0] < 255 for frame in frames):
+        return data
+    # Opaque frames go through RGB: Pillow picks the palette of each one.
+    frames = [frame.convert("RGB") for frame in frames]
+    for frame in frames:
+        # Dropping info drops the comments and extensions.
+        frame.info = {}
+    options = {"loop": img.info["loop"]} if "loop" in img.info else {}
+    buf = io.BytesIO()
+    frames[0].save(buf, "GIF", save_all=True, append_images=frames[1:],
+                   duration=durations, optimize=True, **options)
+    encoded = buf.getvalue()
+    if len(encoded) >= len(data):
+        return data
+    decoded, decoded_durations = _gif_frames(encoded)
+    if (decoded_durations != durations
+            or [f.convert("RGB").tobytes() for f in decoded]
+            != [f.tobytes() for f in frames]):
+        return data
+    return encoded
+
+
+def _key(data, quantize):
+    return hashlib.sha256((b"q" if quantize else b"l") + data).hexdigest()
+
+
+class ImageCache:
+    """
+    The optimized images, keyed by the digest of their input.
+    """
+
+    def __init__(self, directory=IMAGE_CACHE_DIR):
+        self.directory = directory
+
+    def get(self, key, suffix=".png"):
+        try:
+            return (self.directory / f"{key}{suffix}").read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data, suffix=".png"):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{key}{suffix}"
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def is_optimal(self, key):
+        return (self.directory / f"{key}.optimal").exists()
+
+    def set_optimal(self, key):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{key}.optimal").touch()
+
+
+def _suffix(path):
+    return Path(path).suffix.lower()
+
+
+def _optimize_file(path, quantize):
+    with open(path, "rb") as f:
+        data = f.read()
+    if _suffix(path) == ".gif":
+        return path, recompress_gif(data)
+    return path, recompress(data, quantize)
+
+
+def optimize(paths=None, quantize=False, jobs=None, cache=None, log=print):
+    """
+    Recompress the PNG and GIF files *paths* (default: all those of the
+    site) in place, and return the total size before and after.
+    """
+    if paths is None:
+        paths = sorted(path for path in SITE_DIR.rglob("*")
+                       if _suffix(path) in SUFFIXES)
+    cache = cache or ImageCache()
+    before = after = 0
+    todo = {}
+    for path in paths:
+        data = path.read_bytes()
+        before += len(data)
+        key = _key(data, quantize)
+        if cache.is_optimal(key):
+            after += len(data)
+            continue
+        optimized = cache.get(key, _suffix(path))
+        if optimized is None:
+            todo[str(path)] = key
+            continue
+        path.write_bytes(optimized)
+        after += len(optimized)
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(todo) // (4 * (jobs or os.cpu_count())))
+            for path, optimized in pool.map(_optimize_file, todo,
+                                            [quantize] * len(todo),
+                                            chunksize=chunksize):
+                cache.put(todo[path], optimized, _suffix(path))
+                with open(path, "wb") as f:
+                    f.write(optimized)
+                after += len(optimized)
+                cache.set_optimal(_key(optimized, quantize))
+    log(f"optimized {len(todo)} of {len(paths)} images: "
+        f"{before / 1e6:.2f}MB -> {after / 1e6:.2f}MB")
+    return before, after
@@ -0,0 +1,108 @@
+"""
+Per-cell import-time report.
+
+The post is executed in a fresh interpreter started with ``-X importtime``,
+which logs every import to stderr.  A marker is written to stderr before
+each cell, so that the imports can be attributed to the cell that triggered
+them.  The cells are only executed (nothing is rendered), and the build
+helpers the child needs are imported before the first marker.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+from .config import OUTPUT_DIR, ROOT
+
+MARKER = "blogbuild-importtime-cell"
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse(stderr):
+    """
+    Return, for each cell index found in the markers of *stderr*, the
+    top-level imports of the cell as a list of ``(module, cumulative_us)``.
+    """
+    cells = {}
+    current = None
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            current = cells.setdefault(int(line.split()[1]), [])
+            continue
+        m = _LINE.match(line)
+        if m is None or current is None:
+            continue
+        if len(m.group(3)) == 1:  # nested imports are indented further
+            current.append((m.group(4), int(m.group(2))))
+    return cells
+
+
+def profile_post(post, lazy=False):
+    """
+    Run *post* under ``-X importtime`` and return the per-cell report.
+    """
+    cmd = [sys.executable, "-X", "importtime", "-m", f"{__package__}.importtime",
+           str(post.path)]
+    if lazy:
+        cmd.append("--lazy")
+    env = dict(os.environ, MPLBACKEND="Agg")
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True,
+                          text=True)
+    imports = parse(proc.stderr)
+    report = []
+    for cell in post.code_cells():
+        cell_imports = sorted(imports.get(cell.index, []),
+                              key=lambda t: -t[1])
+        report.append({"index": cell.index, "lineno": cell.lineno,
+                       "total_us": sum(us for _, us in cell_imports),
+                       "imports": cell_imports})
+    return {"name": post.name, "lazy": lazy,
+            "returncode": proc.returncode, "cells": report}
+
+
+def write_report(report, output_dir=OUTPUT_DIR):
+    directory = output_dir / report["name"]
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "importtime.json", "w") as f:
+        json.dump(report, f, indent=1)
+
+
+def format_report(report, top=3):
+    lines = [f"{report['name']}" + (" (lazy)" if report["lazy"] else "")]
+    for cell in report["cells"]:
+        if not cell["imports"]:
+            continue
+        heaviest = ", ".join(f"{m} {us / 1e3:.0f}ms"
+                             for m, us in cell["imports"][:top])
+        lines.append(f"  cell {cell['index']:3d} (line {cell['lineno']:4d}): "
+                     f"{cell['total_us'] / 1e3:8.1f}ms  {heaviest}")
+    if report["returncode"]:
+        lines.append(f"  (the post failed with exit code "
+                     f"{report['returncode']})")
+    return "\n".join(lines)
+
+
+def _child(path, lazy):
+    from .posts import Post
+
+    post = Post(path)
+    if lazy:
+        from .lazy import install
+        install()
+    namespace = {"__name__": "__main__", "__file__": str(post.path)}
+    os.chdir(post.directory)
+    sys.path.insert(0, str(post.directory))
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        for cell in post.code_cells():
+            os.write(2, f"{MARKER} {cell.index}\n".encode())
+            code = compile("\n" * (cell.lineno - 1) + cell.source,
+                           str(post.path), "exec")
+            exec(code, namespace)
+
+
+if __name__ == "__main__":
+    _child(sys.argv[1], "--lazy" in sys.argv[2:])
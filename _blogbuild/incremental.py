@@ -0,0 +1,85 @@
+"""
+Planning the incremental re-execution of a post.
+
+Each code cell gets three keys:
+
+- its *own* key, which hashes the cell itself (source, options, referenced
+  assets and library versions, see `.cache.cell_key`);
+- its *graph* key, which hashes its own key and the graph keys of the cells
+  it depends on (see `.deps.dependency_graph`).  A cell whose graph key is
+  unchanged since the previous run is not affected by the edits, and its
+  previous result is still valid;
+- its *prefix* key, which hashes the own keys of all the cells up to it.
+  Checkpoints are stored under the prefix key of the cell they follow.
+
+A rebuild restores the last checkpoint before the first affected cell, then
+executes the affected cells and the unaffected cells they depend on.  The
+other cells are served from the previous results.
+"""
+
+import hashlib
+
+from .cache import asset_files, cell_key
+from .deps import dependency_graph
+
+SERVE, REPLAY, RUN = "serve", "replay", "run"
+
+
+def _hash(*parts):
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def cell_keys(post, cells):
+    """
+    Return the graph keys and the prefix keys of *cells*.
+    """
+    assets = asset_files(post)
+    own = [cell_key(cell, None, None, assets) for cell in cells]
+    graph = dependency_graph(cells)
+    graph_keys, prefix_keys = [], []
+    prefix = post.name
+    for j, key in enumerate(own):
+        graph_keys.append(_hash(key, *sorted(graph_keys[i] for i in graph[j])))
+        prefix = _hash(prefix, key)
+        prefix_keys.append(prefix)
+    return graph_keys, prefix_keys, graph
+
+
+def _ancestors(graph, cells):
+    todo, seen = list(cells), set()
+    while todo:
+        j = todo.pop()
+        for i in graph[j]:
+            if i not in seen:
+                seen.add(i)
+                todo.append(i)
+    return seen
+
+
+def plan(graph_keys, prefix_keys, graph, previous, checkpoints):
+    """
+    Return the index of the checkpoint to restore (-1 for none) and the
+    action for each cell.
+
+    *previous* maps the graph keys of the previous run to their results;
+    *checkpoints* is anything supporting ``in`` with a prefix key.
+    """
+    n = len(graph_keys)
+    dirty = [k not in previous for k in graph_keys]
+    if not any(dirty):
+        return -1, [SERVE] * n
+
+    first = dirty.index(True)
+    restore = next((j for j in range(first - 1, -1, -1)
+                    if prefix_keys[j] in checkpoints), -1)
+    affected = {j for j in range(restore + 1, n) if dirty[j]}
+    needed = {j for j in _ancestors(graph, affected) if j > restore}
+    actions = []
+    for j in range(n):
+        if j in affected:
+            actions.append(RUN)
+        elif j in needed:
+            actions.append(REPLAY)
+        else:
+            actions.append(SERVE)
+    return restore, actions
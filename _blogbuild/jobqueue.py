@@ -0,0 +1,383 @@
+"""
+Building on several machines through a shared job queue.
+
+A coordinator puts one job per post on a queue (``queue submit``), slowest
+first; any number of workers, on this host or on others that see the same
+queue, claim jobs (``queue work``) and execute them like `.build` does.  The
+result of a job is stored in the queue, and ``queue collect`` writes the
+results to ``_build/posts`` as a local build would.  The cells executed by
+a worker go into the cell cache given with ``--cache-dir``, which can be a
+shared directory, so that later builds anywhere are served from it.
+
+Jobs are posts rather than cells: the cells of a post share the state of
+the namespace and cannot run on different machines (unless a checkpoint is
+restored, which `.incremental` only does within one process).
+
+A claimed job is leased for *lease* seconds, and the worker renews the
+lease while the post runs.  The job of a worker that died goes back to the
+queue when its lease expires, and fails after *max_attempts* claims.
+
+Two backends are provided: a SQLite database (a path ending in ``.sqlite``
+or ``.db``), and a directory where jobs are files moved between state
+directories with atomic renames, for filesystems where SQLite locking is
+unreliable (NFS, ...).
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+
+from .config import BUILD_DIR
+
+QUEUE_FILE = BUILD_DIR / "queue.sqlite"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class SQLiteQueue:
+    """
+    A job queue in a SQLite database.
+    """
+
+    def __init__(self, path=QUEUE_FILE, max_attempts=3):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    name TEXT PRIMARY KEY, priority INTEGER, spec TEXT,
+                    state TEXT, worker TEXT, expires REAL,
+                    attempts INTEGER DEFAULT 0, result TEXT, error TEXT)""")
+
+    def _connect(self):
+        # One connection per call, so that worker threads do not share them.
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        db.execute("PRAGMA busy_timeout = 60000")
+        return _Transaction(db)
+
+    def submit(self, jobs):
+        """
+        Queue the ``(name, spec)`` *jobs*, in priority order, replacing
+        earlier jobs of the same names.
+        """
+        with self._connect() as db:
+            for priority, (name, spec) in enumerate(jobs):
+                db.execute(
+                    "INSERT OR REPLACE INTO jobs (name, priority, spec, state)"
+                    " VALUES (?, ?, ?, ?)",
+                    (name, priority, json.dumps(spec), PENDING))
+
+    def claim(self, worker, lease):
+        """
+        Lease the next job to *worker* and return ``(name, spec)``, or None
+        if no job is available.
+        """
+        now = time.time()
+        with self._connect() as db:
+            # Expired leases of jobs that were claimed too often fail.
+            db.execute(
+                "UPDATE jobs SET state = ?, error = ? WHERE state = ? AND "
+                "expires < ? AND attempts >= ?",
+                (FAILED, "the lease expired too many times", RUNNING, now,
+                 self.max_attempts))
+            row = db.execute(
+                "SELECT name, spec FROM jobs WHERE state = ? OR "
+                "(state = ? AND expires < ?) ORDER BY priority LIMIT 1",
+                (PENDING, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET state = ?, worker = ?, expires = ?, "
+                "attempts = attempts + 1 WHERE name = ?",
+                (RUNNING, worker, now + lease, row[0]))
+        return row[0], json.loads(row[1])
+
+    def renew(self, name, worker, lease):
+        """
+        Extend the lease of *worker* on *name*; return False if it lost it.
+        """
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET expires = ? WHERE name = ? AND worker = ? "
+                "AND state = ?", (time.time() + lease, name, worker, RUNNING))
+            return cursor.rowcount == 1
+
+    def finish(self, name, worker, result=None, error=None):
+        """
+        Store the *result* (or *error*) of the job *name*, unless *worker*
+        lost its lease; return whether it was stored.
+        """
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ? "
+                "WHERE name = ? AND worker = ? AND state = ?",
+                (FAILED if error else DONE, json.dumps(result), error, name,
+                 worker, RUNNING))
+            return cursor.rowcount == 1
+
+    def counts(self):
+        with self._connect() as db:
+            return dict(db.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def results(self):
+        """
+        Return the ``(name, state, result, error)`` of the finished jobs.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT name, state, result, error FROM jobs "
+                "WHERE state IN (?, ?) ORDER BY priority",
+                (DONE, FAILED)).fetchall()
+        return [(name, state, json.loads(result) if result else None, error)
+                for name, state, result, error in rows]
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, *exc_info):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        self.db.close()
+        return False
+
+
+class DirectoryQueue:
+    """
+    A job queue in a directory, ``<state>/<priority>-<name>.json``.  The
+    lease of a running job is the mtime of its file, set in the future.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        for state in (PENDING, RUNNING, DONE, FAILED):
+            (self.path / state).mkdir(parents=True, exist_ok=True)
+
+    def _files(self, state):
+        return sorted((self.path / state).glob("*.json"))
+
+    def _find(self, state, name):
+        for path in self._files(state):
+            if path.stem.split("-", 1)[1] == name:
+                return path
+        return None
+
+    @staticmethod
+    def _write(path, job):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}."
+                             f"{threading.get_ident()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    def submit(self, jobs):
+        for priority, (name, spec) in enumerate(jobs):
+            for state in (PENDING, RUNNING, DONE, FAILED):
+                old = self._find(state, name)
+                if old is not None:
+                    old.unlink(missing_ok=True)
+            self._write(self.path / PENDING / f"{priority:06d}-{name}.json",
+                        {"name": name, "spec": spec, "attempts": 0})
+
+    def _requeue_expired(self):
+        now = time.time()
+        for path in self._files(RUNNING):
+            try:
+                if path.stat().st_mtime >= now:
+                    continue
+                # Only one of the workers noticing wins the rename.
+                os.rename(path, self.path / PENDING / path.name)
+            except FileNotFoundError:
+                pass
+
+    def claim(self, worker, lease):
+        self._requeue_expired()
+        for path in self._files(PENDING):
+            # The worker is recorded in the file name, so that the rename
+            # claims the job atomically.
+            running = self.path / RUNNING / path.name
+            mine = running.with_name(f"{path.stem}.{worker}.claim")
+            try:
+                os.rename(path, mine)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            with open(mine) as f:
+                job = json.load(f)
+            job["attempts"] += 1
+            job["worker"] = worker
+            if job["attempts"] > self.max_attempts:
+                job["error"] = "the lease expired too many times"
+                self._write(self.path / FAILED / path.name, job)
+                mine.unlink()
+                continue
+            self._write(mine, job)
+            expires = time.time() + lease
+            os.utime(mine, (expires, expires))
+            os.rename(mine, running)
+            return job["name"], job["spec"]
+        return None
+
+    def _owned(self, name, worker):
+        path = self._find(RUNNING, name)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                owner = json.load(f).get("worker")
+        except (FileNotFoundError, ValueError):
+            return None
+        return path if owner == worker else None
+
+    def renew(self, name, worker, lease):
+        path = self._owned(name, worker)
+        if path is None:
+            return False
+        expires = time.time() + lease
+        os.utime(path, (expires, expires))
+        return True
+
+    def finish(self, name, worker, result=None, error=None):
+        path = self._owned(name, worker)
+        if path is None:
+            return False
+        with open(path) as f:
+            job = json.load(f)
+        job.update(result=result, error=error)
+        self._write(self.path / (FAILED if error else DONE) / path.name, job)
+        path.unlink(missing_ok=True)
+        return True
+
+    def counts(self):
+        return {state: n for state in (PENDING, RUNNING, DONE, FAILED)
+                if (n := len(self._files(state)))}
+
+    def results(self):
+        results = []
+        for state in (DONE, FAILED):
+            for path in self._files(state):
+                with open(path) as f:
+                    job = json.load(f)
+                results.append((job["name"], state, job.get("result"),
+                                job.get("error")))
+        return results
+
+
+def open_queue(path=QUEUE_FILE, max_attempts=3):
+    """
+    Return the queue at *path*: SQLite for ``.sqlite``/``.db`` files, a
+    directory queue otherwise.
+    """
+    path = Path(path)
+    if path.suffix in (".sqlite", ".db"):
+        return SQLiteQueue(path, max_attempts)
+    return DirectoryQueue(path, max_attempts)
+
+
+def submit(queue, posts, dpi=None, use_cache=True):
+    """
+    Queue a job for each of *posts*, slowest first.
+    """
+    from .schedule import load_runtimes, longest_first
+
+    ordered = longest_first(posts, load_runtimes())
+    queue.submit([(post.name, {"dpi": dpi, "use_cache": use_cache})
+                  for post in ordered])
+
+
+def _run_job(queue, name, spec, worker, lease, cache_dir, warm, log):
+    from .build import _run_in_worker, pool_context
+    from .posts import find_posts
+
+    try:
+        (post,) = find_posts([name])
+    except ValueError as e:
+        queue.finish(name, worker, error=str(e))
+        return
+    # A pool per job, as a crashed worker breaks its pool.
+    with ProcessPoolExecutor(max_workers=1,
+                             mp_context=pool_context(warm)) as pool:
+        future = pool.submit(_run_in_worker, str(post.path), spec["dpi"],
+                             spec["use_cache"], False, False, False,
+                             cache_dir=cache_dir)
+        while True:
+            try:
+                result = future.result(timeout=lease / 3)
+                error = None
+                break
+            except FutureTimeoutError:
+                if not queue.renew(name, worker, lease):
+                    log(f"{worker}: lost the lease of {name}")
+            except Exception as e:
+                result, error = None, repr(e)
+                break
+    if queue.finish(name, worker, result=result, error=error):
+        status = error or result["status"]
+        log(f"{worker}: {name}: {status}")
+
+
+def work(queue, worker=None, lease=600, cache_dir=None, warm=True,
+         poll=5, exit_when_empty=True, log=print):
+    """
+    Claim and execute jobs of *queue* until it is empty (or forever, polling
+    every *poll* seconds, if not *exit_when_empty*).
+    """
+    worker = worker or f"{socket.gethostname()}.{os.getpid()}"
+    while True:
+        job = queue.claim(worker, lease)
+        if job is None:
+            # Jobs running elsewhere come back if their worker dies.
+            if exit_when_empty and not queue.counts().get(RUNNING):
+                return
+            time.sleep(poll)
+            continue
+        _run_job(queue, *job, worker, lease, cache_dir, warm, log)
+
+
+def work_locally(queue, jobs, **kwargs):
+    """
+    Run *jobs* `work` loops in threads of this process.
+    """
+    base = f"{socket.gethostname()}.{os.getpid()}"
+    threads = [threading.Thread(target=work, args=(queue, f"{base}.{i}"),
+                                kwargs=kwargs)
+               for i in range(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def collect(queue, log=print):
+    """
+    Write the results of the finished jobs like a local build would, and
+    return them.
+    """
+    from .build import write_result
+    from .schedule import update_runtimes
+
+    results = []
+    for name, state, result, error in queue.results():
+        if result is None:
+            log(f"{name}: {state}: {error}")
+            continue
+        write_result(result)
+        results.append(result)
+        log(f"{name}: {result['status']} ({result['elapsed']:.1f}s)")
+    update_runtimes(results)
+    return results
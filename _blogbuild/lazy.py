@@ -0,0 +1,58 @@
+"""
+Lazy imports for the mpl-* packages.
+
+`install` puts a finder in front of `sys.meta_path` that wraps the loader of
+the matching modules in `importlib.util.LazyLoader`: ``import mplfonts`` or
+``import mpl_visual_context.patheffects as pe`` then binds a module that is
+only executed when one of its attributes is first used.  ``from X import
+name`` needs the attribute right away and still loads the module eagerly.
+
+Packages whose import has side effects the posts rely on must not be made
+lazy: ``import mplcyberpunk`` registers the "cyberpunk" style, for example.
+"""
+
+import importlib.abc
+import importlib.util
+import sys
+
+LAZY_PACKAGES = ("mpl_*", "mplfonts", "SecretColors")
+
+
+def _matches(name, patterns):
+    top = name.split(".")[0]
+    return any(top.startswith(p[:-1]) if p.endswith("*") else top == p
+               for p in patterns)
+
+
+class LazyFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, patterns=LAZY_PACKAGES):
+        self.patterns = patterns
+
+    def find_spec(self, name, path, target=None):
+        if not _matches(name, self.patterns):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = importlib.util.LazyLoader(spec.loader)
+        return spec
+
+
+def install(patterns=LAZY_PACKAGES):
+    """
+    Make the imports of the packages matching *patterns* lazy, and return
+    the finder (to pass to `uninstall`).
+    """
+    finder = LazyFinder(patterns)
+    sys.meta_path.insert(0, finder)
+    return finder
+
+
+def uninstall(finder):
+    sys.meta_path.remove(finder)
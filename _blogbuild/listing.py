@@ -0,0 +1,151 @@
+"""
+Index of the post metadata, for listings, drafts and category pages.
+
+The title, date, categories and draft status of a post are read from the
+commented YAML header of its ``index.py`` only; no Python is executed.  The
+index is stored in ``_build/index.json`` with the mtime and size of each
+file, so that updating it only reads the headers of the posts that changed.
+
+Quarto ignores the post directories starting with an underscore; they are
+listed like drafts.
+
+The listed posts that do not set an ``image`` get the path of the thumbnail
+of their headline figure in the site, as ``thumbnail``, once it was made
+(see `.thumbnails`).
+"""
+
+import datetime
+import json
+import os
+
+from .config import INDEX_FILE, POSTS_DIR
+from .posts import read_header
+from .thumbnails import thumbnail_path
+
+FIELDS = ("title", "author", "date", "date-modified", "categories", "draft",
+          "image", "description")
+
+DATE_FORMATS = ("%m/%d/%Y", "%Y-%m-%d", "%B %d, %Y")
+
+
+def _isodate(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(str(value), fmt).strftime(
+                "%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
+
+
+def post_metadata(name, path):
+    """
+    Return the metadata of the post *name* from the header of *path*.
+    """
+    try:
+        header = read_header(path)
+    except Exception as e:
+        header = {"error": repr(e)}
+    if not isinstance(header, dict):
+        header = {}
+    meta = {key: header[key] for key in FIELDS if key in header}
+    categories = meta.get("categories") or []
+    if isinstance(categories, str):
+        categories = [categories]
+    meta["categories"] = [str(c) for c in categories]
+    meta["draft"] = bool(meta.get("draft", False))
+    meta["ignored"] = name.startswith("_")
+    for key in ("date", "date-modified"):
+        if key in meta:
+            meta[key] = str(meta[key])
+    meta["isodate"] = _isodate(header.get("date"))
+    if "error" in header:
+        meta["error"] = header["error"]
+    return meta
+
+
+class PostIndex:
+    """
+    The metadata of the posts under *posts_dir*, cached in *path*.
+    """
+
+    def __init__(self, path=INDEX_FILE, posts_dir=POSTS_DIR):
+        self.path = path
+        self.posts_dir = posts_dir
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def update(self):
+        """
+        Re-read the headers of the posts that changed, drop the removed
+        ones, save the index if anything changed and return the names of
+        the posts that were re-read.
+        """
+        entries = {}
+        changed = []
+        with os.scandir(self.posts_dir) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                path = os.path.join(entry.path, "index.py")
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                stamp = [st.st_mtime_ns, st.st_size]
+                old = self.entries.get(entry.name)
+                if old is not None and old["stamp"] == stamp:
+                    entries[entry.name] = old
+                    continue
+                entries[entry.name] = {
+                    "stamp": stamp, "meta": post_metadata(entry.name, path)}
+                changed.append(entry.name)
+        if changed or entries.keys() != self.entries.keys():
+            self.entries = entries
+            self.save()
+        return changed
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def listing(self, drafts=False, category=None):
+        """
+        Return ``(name, metadata)`` of the posts, newest first, without the
+        drafts unless *drafts* is True, restricted to *category* if given.
+        """
+        posts = [(name, e["meta"]) for name, e in self.entries.items()]
+        if not drafts:
+            posts = [(n, m) for n, m in posts
+                     if not (m["draft"] or m["ignored"])]
+        if category is not None:
+            posts = [(n, m) for n, m in posts if category in m["categories"]]
+        # Undated posts last; the date in the name breaks ties.
+        posts.sort(key=lambda t: (t[1]["isodate"] or "", t[0]), reverse=True)
+        return [(name, self._with_thumbnail(name, meta))
+                for name, meta in posts]
+
+    def _with_thumbnail(self, name, meta):
+        thumbnail = thumbnail_path(name, self.posts_dir)
+        if "image" in meta or not thumbnail.exists():
+            return meta
+        site_path = thumbnail.relative_to(self.posts_dir.parent).as_posix()
+        return dict(meta, thumbnail=site_path)
+
+    def categories(self, drafts=False):
+        """
+        Return the names of the listed posts of each category.
+        """
+        categories = {}
+        for name, meta in self.listing(drafts=drafts):
+            for category in meta["categories"]:
+                categories.setdefault(category, []).append(name)
+        return dict(sorted(categories.items()))
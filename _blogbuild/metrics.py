@@ -0,0 +1,149 @@
+"""
+Resource usage of the cells.
+
+Each executed cell records its wall time, the CPU time of the process and of
+the subprocesses it waited for (e.g. inkscape), the resident set size before
+and after and the peak resident set size of the process so far, the number
+of figures it created and the number of PNGs reused from an earlier display
+of the unchanged figure.  The peak of the memory allocated by Python is
+recorded when tracemalloc is tracing (``render --trace-memory``), as tracing
+slows the execution down noticeably.  ``metrics.json`` also has the size of
+the outputs of each cell.
+
+The metrics of a post are written to ``_build/posts/<post>/metrics.json``,
+next to the ``cells.json`` of the same render, rather than next to its
+frozen output in ``_freeze``: that one is committed, and the metrics, which
+differ from one run and one machine to the next, would make every build a
+change to commit.
+"""
+
+import json
+import os
+import resource
+import time
+import tracemalloc
+
+from .config import OUTPUT_DIR
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss():
+    """
+    Return the current resident set size in bytes (the peak one where the
+    current one is not available).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return peak_rss()
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of the process in bytes.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere.
+    return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class CellMeter:
+    """
+    Context manager measuring the resources used in its block; the
+    measurements are in `metrics` once the block exits.
+    """
+
+    def __init__(self):
+        self.metrics = None
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self._traced = tracemalloc.get_traced_memory()[0]
+        self._rss = rss()
+        self._cpu = time.process_time()
+        self._children_cpu = _children_cpu()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self._wall
+        current = rss()
+        self.metrics = {
+            "wall": wall,
+            "cpu": time.process_time() - self._cpu,
+            "cpu_children": _children_cpu() - self._children_cpu,
+            "rss": current,
+            "rss_delta": current - self._rss,
+            "rss_peak": peak_rss(),
+            "peak_traced": None,
+        }
+        if tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            self.metrics["peak_traced"] = peak - self._traced
+        return False
+
+
+# Output types stored base64-encoded.
+_BINARY_MIMES = ("image/png", "image/jpeg", "image/gif", "application/pdf")
+
+
+def output_bytes(outputs):
+    """
+    Return the size of the data of *outputs* in bytes, base64 decoded.
+    """
+    size = 0
+    for output in outputs:
+        items = output.get("data", {}).items()
+        if "text" in output:
+            items = [("text/plain", output["text"])]
+        for mime, value in items:
+            if isinstance(value, list):
+                value = "".join(value)
+            elif not isinstance(value, str):
+                value = json.dumps(value)
+            if mime in _BINARY_MIMES:
+                size += len(value.replace("\n", "")) * 3 // 4
+            else:
+                size += len(value.encode())
+    return size
+
+
+def post_metrics(result):
+    """
+    Return the metrics of a post result, without the cell outputs.
+    """
+    return {
+        "name": result["name"],
+        "status": result["status"],
+        "elapsed": result["elapsed"],
+        "cells": [{"index": c["index"], "lineno": c["lineno"],
+                   "cached": c.get("cached", False),
+                   "output_bytes": output_bytes(c.get("outputs", [])),
+                   **c.get("metrics", {})}
+                  for c in result["cells"]],
+    }
+
+
+def write_metrics(result, output_dir=OUTPUT_DIR):
+    """
+    Write the metrics of a post *result* to
+    ``<output_dir>/<post>/metrics.json``, and return the path, or None if
+    *result* is a draft or a preview, whose metrics are not those of the
+    post (and would be checked against its budgets, see `.budgets`).
+    """
+    if result.get("preview", False) or result.get("draft", False):
+        return None
+    directory = output_dir / result["name"]
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / "metrics.json"
+    with open(path, "w") as f:
+        json.dump(post_metrics(result), f, indent=1)
+    return path
@@ -0,0 +1,159 @@
+"""
+Reading the posts, which are jupytext percent scripts.
+
+A post starts with a commented YAML header (between two ``# ---`` lines),
+followed by cells that are separated by ``# %%`` lines.  Quarto cell options
+are given as ``#| key: value`` lines at the top of a cell.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import yaml
+
+from .config import POSTS_DIR
+
+CELL_MARKER = "# %%"
+HEADER_MARKER = "# ---"
+OPTION_PREFIX = "#|"
+
+
+@dataclass
+class Cell:
+    index: int
+    kind: str  # "code" or "markdown"
+    source: str
+    lineno: int  # 1-based line number of the first source line
+    title: str = ""
+    options: dict = field(default_factory=dict)
+
+    @property
+    def is_code(self):
+        return self.kind == "code"
+
+
+def _uncomment(line):
+    if line.startswith("# "):
+        return line[2:]
+    return line[1:] if line.startswith("#") else line
+
+
+def parse_header(lines):
+    """
+    Return the YAML header as a dict and the number of lines it spans.
+    """
+    if not lines or lines[0].rstrip() != HEADER_MARKER:
+        return {}, 0
+    for i, line in enumerate(lines[1:], start=1):
+        if line.rstrip() == HEADER_MARKER:
+            text = "\n".join(_uncomment(l) for l in lines[1:i])
+            return (yaml.safe_load(text) or {}), i + 1
+    return {}, 0
+
+
+def read_header(path):
+    """
+    Return the YAML header of the file at *path*, reading only its lines.
+    """
+    lines = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            lines.append(line.rstrip("\n"))
+            if lines[0].rstrip() != HEADER_MARKER:
+                break
+            if len(lines) > 1 and line.rstrip() == HEADER_MARKER:
+                break
+    header, _ = parse_header(lines)
+    return header
+
+
+def parse_options(lines):
+    """
+    Return the ``#|`` options at the top of the cell and the remaining lines.
+    """
+    n = 0
+    for line in lines:
+        if not line.startswith(OPTION_PREFIX):
+            break
+        n += 1
+    text = "\n".join(l[len(OPTION_PREFIX):] for l in lines[:n])
+    options = (yaml.safe_load(text) or {}) if n else {}
+    return options, lines[n:]
+
+
+def split_cells(lines, start=0):
+    cells = []
+    current = None  # (title, kind, lineno, lines)
+
+    def flush():
+        if current is None:
+            return
+        title, kind, lineno, body = current
+        if kind == "code":
+            options, body = parse_options(body)
+            lineno += len(current[3]) - len(body)
+        else:
+            options = {}
+            body = [_uncomment(l) for l in body]
+        source = "\n".join(body).strip("\n")
+        if source or options:
+            cells.append(Cell(len(cells), kind, source, lineno, title, options))
+
+    for i, line in enumerate(lines[start:], start=start):
+        if line.startswith(CELL_MARKER):
+            flush()
+            title = line[len(CELL_MARKER):].strip()
+            kind = "code"
+            if title.startswith("[markdown]"):
+                kind = "markdown"
+                title = title[len("[markdown]"):].strip()
+            current = (title, kind, i + 2, [])
+        elif current is not None:
+            current[3].append(line)
+    flush()
+
+    return cells
+
+
+class Post:
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def __repr__(self):
+        return f"Post({self.name!r})"
+
+    @property
+    def directory(self):
+        return self.path.parent
+
+    @property
+    def name(self):
+        return self.directory.name
+
+    def read_lines(self):
+        return self.path.read_text(encoding="utf-8").splitlines()
+
+    def header(self):
+        return read_header(self.path)
+
+    def cells(self):
+        lines = self.read_lines()
+        _, n = parse_header(lines)
+        return split_cells(lines, n)
+
+    def code_cells(self):
+        return [c for c in self.cells() if c.is_code]
+
+
+def find_posts(names=None, posts_dir=POSTS_DIR):
+    """
+    Return the posts under *posts_dir*, optionally restricted to *names*.
+    """
+    posts = [Post(p) for p in sorted(Path(posts_dir).glob("*/index.py"))]
+    if names:
+        by_name = {p.name: p for p in posts}
+        unknown = [n for n in names if n not in by_name]
+        if unknown:
+            raise ValueError(f"unknown post(s): {', '.join(unknown)}")
+        posts = [by_name[n] for n in names]
+    return posts
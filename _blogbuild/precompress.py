@@ -0,0 +1,138 @@
+"""
+Precompressing the text files of the site for static hosting.
+
+`precompress` writes ``.gz`` and ``.br`` siblings next to the HTML, CSS,
+SVG, JSON, JavaScript and XML files of the rendered site, at the highest
+compression levels, so that a server configured for precompressed files
+(``gzip_static``, ``brotli_static``, ...) sends them without compressing
+anything per request.  Brotli needs the ``brotli`` (or ``brotlicffi``)
+package; without it only ``.gz`` files are written.
+
+The files are compressed in a process pool.  The digests of the sources
+(see `.publish.SiteManifest`) are recorded in
+``_build/precompressed.json`` with the siblings written, and a file whose
+digest did not change since it was compressed is skipped, unless one of its
+siblings is missing (the site was rendered again, say).  Siblings are only
+written where they are smaller than the file; they get the mtime of the
+file, and gzip members carry no timestamp, so that unchanged content
+compresses to identical bytes.
+"""
+
+import gzip
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .config import PRECOMPRESSED_FILE, SITE_DIR, SITE_MANIFEST_FILE
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+SUFFIXES = (".html", ".css", ".svg", ".json", ".js", ".xml")
+
+# Smaller files fit in a packet either way.
+MIN_SIZE = 256
+
+
+def available_encodings():
+    return ("gz", "br") if brotli is not None else ("gz",)
+
+
+def compress(data, encoding):
+    if encoding == "gz":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def _write_sibling(path, encoding, data):
+    target = Path(f"{path}.{encoding}")
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    st = os.stat(path)
+    os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp, target)
+
+
+def _compress_file(path, encodings):
+    with open(path, "rb") as f:
+        data = f.read()
+    sizes = {}
+    for encoding in encodings:
+        compressed = compress(data, encoding)
+        if len(compressed) < len(data):
+            _write_sibling(path, encoding, compressed)
+            sizes[encoding] = len(compressed)
+        else:
+            Path(f"{path}.{encoding}").unlink(missing_ok=True)
+    return path, len(data), sizes
+
+
+def _remove_siblings(path, encodings):
+    for encoding in encodings:
+        Path(f"{path}.{encoding}").unlink(missing_ok=True)
+
+
+def _up_to_date(path, entry, done):
+    # *entry* is ``[digest, encodings tried, encodings written]``.
+    return (entry is not None and entry[:2] == done
+            and all(os.path.exists(f"{path}.{encoding}")
+                    for encoding in entry[2]))
+
+
+def precompress(site_dir=SITE_DIR, jobs=None, state_file=PRECOMPRESSED_FILE,
+                manifest_file=SITE_MANIFEST_FILE, log=print):
+    """
+    Write the compressed siblings of the files of *site_dir* that changed
+    since the last call, and return the number of files compressed.
+    """
+    from .publish import SiteManifest
+
+    site_dir = Path(site_dir)
+    encodings = list(available_encodings())
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+    manifest = SiteManifest(site_dir, manifest_file).update()
+    todo = {}
+    done = {}
+    for rel, (digest, size) in manifest.items():
+        if not rel.endswith(SUFFIXES) or size < MIN_SIZE:
+            continue
+        entry = state.get(rel)
+        if _up_to_date(site_dir / rel, entry, [digest, encodings]):
+            done[rel] = entry
+        else:
+            done[rel] = [digest, encodings, []]
+            todo[str(site_dir / rel)] = rel
+    # The siblings of the files that were removed from the site go too.
+    for rel in state.keys() - done.keys():
+        _remove_siblings(site_dir / rel, state[rel][1])
+    before = after = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(todo) // (4 * (jobs or os.cpu_count())))
+            for path, size, sizes in pool.map(
+                    _compress_file, todo, [encodings] * len(todo),
+                    chunksize=chunksize):
+                before += size
+                after += sizes.get("br", sizes.get("gz", size))
+                done[todo[path]][2] = sorted(sizes)
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = state_file.with_name(f"{state_file.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(done, f, indent=1, sort_keys=True)
+    os.replace(tmp, state_file)
+    if brotli is None:
+        log("brotli is not installed; only .gz files were written")
+    log(f"compressed {len(todo)} of {len(done)} files "
+        f"({before / 1e6:.2f}MB -> {after / 1e6:.2f}MB)")
+    return len(todo)
@@ -0,0 +1,71 @@
+"""
+Modules preloaded by the fork server that the build workers are forked from.
+
+Importing this module selects the Agg backend, imports every module the posts
+import (matplotlib, seaborn, pandas, the mpl-* packages, ...) and loads the
+font list (from the shared snapshot, see `.fonts`), so that a worker forked
+from the server starts with all of this already done.  Modules that fail to
+import are skipped; the post that needs them will report the error.
+"""
+
+import ast
+import importlib
+
+import matplotlib
+
+from .config import POSTS_DIR
+from .fonts import use_snapshot
+from .posts import find_posts
+
+
+def post_imports(posts):
+    """
+    Return the names of the modules imported by the code cells of *posts*,
+    leaving out the helper modules that live in the post directories.
+    """
+    modules = set()
+    for post in posts:
+        local = {p.stem for p in post.directory.glob("*.py")}
+        for cell in post.code_cells():
+            try:
+                tree = ast.parse(cell.source)
+            except SyntaxError:
+                continue
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    names = [a.name for a in node.names]
+                elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                    names = [node.module]
+                else:
+                    continue
+                modules.update(n for n in names
+                               if n.split(".")[0] not in local)
+    return sorted(modules)
+
+
+def warm_up(modules):
+    """
+    Import *modules* and load matplotlib's font cache; return the modules
+    that could not be imported.
+    """
+    from .runner import use_agg
+
+    use_agg()
+    import matplotlib.pyplot  # noqa: F401
+    from matplotlib import font_manager
+
+    font_manager.findfont(font_manager.FontProperties())
+    failed = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            failed.append(name)
+    return failed
+
+
+use_snapshot()
+FAILED = warm_up(post_imports(find_posts(posts_dir=POSTS_DIR)))
+
+# The rcParams once everything is imported, which workers are reset to.
+RC_PARAMS = dict(matplotlib.rcParams)
@@ -0,0 +1,128 @@
+"""
+Sampling the Python stack of the cells, for flame graphs.
+
+``render --profile`` samples the stack of each worker while its cells run:
+a ``SIGPROF`` timer interrupts the process every `INTERVAL` seconds of CPU
+time, and the handler records the stack it interrupted.  Samples are taken
+within `phase` blocks only, which the runner opens around each cell and
+around the drawing of each figure; the stack above the innermost block is
+replaced by the labels of the blocks, so that the flame graph of a post has
+a root for each cell (``cell 3 (line 45)``), with the drawing of its figures
+under ``draw``.
+
+The samples of a post are written to ``_build/profiles/<post>.collapsed``,
+one ``frame;frame;... count`` line per stack (the "collapsed" format of
+flamegraph.pl, which speedscope also opens).  Code running in C is counted
+for the Python frame that called it, as the handler only runs between
+bytecodes.  Sampling needs `signal.setitimer`, which Windows does not have.
+"""
+
+import contextlib
+import os
+import signal
+import sys
+
+from .config import PROFILE_DIR, ROOT
+
+INTERVAL = 0.005
+
+_sampler = None
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    if "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(str(ROOT)):
+        filename = os.path.relpath(filename, ROOT)
+    else:
+        filename = os.path.basename(filename)
+    # ";" separates the frames in the collapsed format.
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Sampler:
+    """
+    Count the stacks sampled within `phase` blocks, in `stacks`.
+    """
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+        self._phases = []
+
+    def _sample(self, signum, frame):
+        if not self._phases:
+            return
+        root = self._phases[-1][1]
+        frames = []
+        while frame is not None and frame is not root:
+            frames.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        labels = [label for label, _ in self._phases]
+        stack = ";".join(labels + frames[::-1])
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        return self.stacks
+
+
+def start(interval=INTERVAL):
+    """
+    Start sampling the stack of this process, and return the `Sampler`.
+    """
+    global _sampler
+
+    _sampler = Sampler(interval)
+    _sampler.start()
+    return _sampler
+
+
+def stop():
+    """
+    Stop sampling, and return the stack counts.
+    """
+    global _sampler
+
+    sampler, _sampler = _sampler, None
+    return sampler.stop() if sampler is not None else {}
+
+
+@contextlib.contextmanager
+def phase(label):
+    """
+    Sample the block under *label*, if sampling; the frames of the caller
+    and above are left out.
+    """
+    if _sampler is None:
+        yield
+        return
+    # The frames of the block are below the caller of this generator.
+    _sampler._phases.append((label, sys._getframe(2)))
+    try:
+        yield
+    finally:
+        _sampler._phases.pop()
+
+
+def write_collapsed(name, stacks, directory=PROFILE_DIR):
+    """
+    Write the stack counts of the post *name* to
+    ``<directory>/<name>.collapsed``, and return the path.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.collapsed"
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp, path)
+    return path
+
@@ -0,0 +1,148 @@
+"""
+Publishing the rendered site incrementally.
+
+Quarto rewrites every file of ``_site`` on each render, so their mtimes say
+nothing about what changed.  Publishing hashes the files of the site into a
+manifest, ``{path: [sha256, size]}``, and compares it with the manifest of
+the previous publication, kept at the destination as ``.manifest.json``.
+Only the files that were added or changed are copied; the files that
+disappeared from the site are deleted; the others are not touched, so that
+their mtimes (and whatever caches rely on them) stay stable.
+
+The digests are stored in ``_build/site-manifest.json`` with the mtime and
+size of each file, so that only the files written since the last publication
+are hashed again.
+
+``publish --list`` prints the changed paths, for uploading them with other
+tools.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from .config import SITE_DIR, SITE_MANIFEST_FILE
+
+MANIFEST_NAME = ".manifest.json"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SiteManifest:
+    """
+    The digests of the files under *site_dir*, stored in *path* with the
+    mtime and size of each file.
+    """
+
+    def __init__(self, site_dir=SITE_DIR, path=SITE_MANIFEST_FILE):
+        self.site_dir = Path(site_dir)
+        self.path = Path(path)
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def update(self):
+        """
+        Hash the files that changed, save the stamps if anything changed and
+        return the manifest, ``{relative path: [sha256, size]}``.
+        """
+        entries = {}
+        changed = False
+        for root, dirs, files in os.walk(self.site_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name == MANIFEST_NAME:
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.site_dir).replace(os.sep, "/")
+                st = os.stat(path)
+                stamp = [st.st_mtime_ns, st.st_size]
+                old = self.entries.get(rel)
+                if old is not None and old["stamp"] == stamp:
+                    entries[rel] = old
+                    continue
+                entries[rel] = {"stamp": stamp, "sha256": file_sha256(path)}
+                changed = True
+        if changed or entries.keys() != self.entries.keys():
+            self.entries = entries
+            self.save()
+        return {rel: [e["sha256"], e["stamp"][1]]
+                for rel, e in self.entries.items()}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def diff(current, previous, dest=None):
+    """
+    Return the paths of *current* that are new or changed since *previous*
+    (or missing from *dest*, if given), and those of *previous* that are
+    gone.
+    """
+    changed = [rel for rel, entry in current.items()
+               if previous.get(rel) != entry
+               or (dest is not None and not (dest / rel).exists())]
+    removed = [rel for rel in previous if rel not in current]
+    return changed, removed
+
+
+def _copy(source, target):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    shutil.copy2(source, tmp)
+    os.replace(tmp, target)
+
+
+def publish(dest, site_dir=SITE_DIR, delete=True, dry_run=False,
+            manifest_file=SITE_MANIFEST_FILE, log=print):
+    """
+    Copy the files of *site_dir* that changed since the last publication to
+    *dest*, delete the ones that were removed (if *delete*), and return the
+    changed and removed paths.  With *dry_run*, only return them.  The
+    digests of the site are kept in *manifest_file*.
+    """
+    dest = Path(dest)
+    site_dir = Path(site_dir)
+    current = SiteManifest(site_dir, manifest_file).update()
+    previous = load_manifest(dest / MANIFEST_NAME)
+    changed, removed = diff(current, previous, dest)
+    if not delete:
+        # The files left in place stay in the manifest.
+        current = {**{rel: previous[rel] for rel in removed}, **current}
+        removed = []
+    if dry_run:
+        return changed, removed
+    for rel in changed:
+        _copy(site_dir / rel, dest / rel)
+    for rel in removed:
+        (dest / rel).unlink(missing_ok=True)
+    dest.mkdir(parents=True, exist_ok=True)
+    tmp = dest / f"{MANIFEST_NAME}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(current, f, indent=1, sort_keys=True)
+    os.replace(tmp, dest / MANIFEST_NAME)
+    log(f"published to {dest}: {len(changed)} files copied, {len(removed)} "
+        f"removed, {len(current) - len(changed)} unchanged")
+    return changed, removed
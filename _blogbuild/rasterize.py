@@ -0,0 +1,98 @@
+"""
+Rasterizing the artists that are too complex for vector outputs.
+
+Some figures make huge SVG and PDF files, slow to open: the prisms of
+mpl-poormans-3d draw every face of every bar, pattern fills and traced SVG
+drawings have paths with tens of thousands of vertices.  `measure` draws
+the figure once without rasterizing anything, with a counting
+`.drawcalls.AccountingRenderer` that attributes the vertices and the number
+of draw calls (the fan-out of the path effects) to the artist being drawn.
+`auto_rasterized` then rasterizes, for the duration of an export, the
+artists whose counts exceed the budget; axes, axis, ticks and text always
+stay vector, and the artists within the budget, like simple bars, are not
+touched.
+"""
+
+import contextlib
+
+from .drawcalls import AccountingRenderer, attributed
+
+# Budget of an artist for staying vector.
+MAX_VERTICES = 5000
+MAX_DRAWS = 50
+
+
+def measure(fig):
+    """
+    Draw *fig* without rasterizing it, and return ``{artist: [vertices,
+    draw calls]}`` for the artists that drew anything themselves (the
+    children of an artist count for the children).
+    """
+    width, height = fig.bbox.size
+    renderer = AccountingRenderer(width, height, fig.dpi, draw=False,
+                                  chains=False)
+    with attributed(fig, renderer):
+        fig.draw(renderer)
+    counts = {}
+    for (artist, _), account in renderer.accounts.items():
+        if artist is not None:
+            counts[artist] = [account["vertices"],
+                              sum(account["calls"].values())]
+    return counts
+
+
+def _fix_poormans_3d():
+    # The side collections of the prisms are drawn with a stand-in figure,
+    # which Matplotlib asks for ``suppressComposite`` within a rasterized
+    # parent.
+    try:
+        from mpl_poormans_3d.poormans_3d_helper import FigureDpi72
+    except ImportError:
+        return
+    if not hasattr(FigureDpi72, "suppressComposite"):
+        FigureDpi72.suppressComposite = None
+
+
+def _always_vector(artist):
+    from matplotlib.axes import Axes
+    from matplotlib.axis import Axis, Tick
+    from matplotlib.spines import Spine
+    from matplotlib.text import Text
+
+    return isinstance(artist, (Axes, Axis, Tick, Spine, Text))
+
+
+def over_budget(fig, max_vertices=MAX_VERTICES, max_draws=MAX_DRAWS):
+    """
+    Return ``(artist, vertices, draw calls)`` for the artists of *fig* over
+    the budget that can be rasterized, most complex first.
+    """
+    selected = []
+    for artist, (vertices, draws) in measure(fig).items():
+        if vertices <= max_vertices and draws <= max_draws:
+            continue
+        if (_always_vector(artist) or artist.get_rasterized()
+                or not getattr(type(artist).draw, "_supports_rasterization",
+                               False)):
+            continue
+        selected.append((artist, vertices, draws))
+    selected.sort(key=lambda item: item[1], reverse=True)
+    return selected
+
+
+@contextlib.contextmanager
+def auto_rasterized(fig, max_vertices=MAX_VERTICES, max_draws=MAX_DRAWS):
+    """
+    Rasterize the artists of *fig* over the budget (see `over_budget`) in
+    the ``with`` block, which gets them.
+    """
+    selected = over_budget(fig, max_vertices, max_draws)
+    if selected:
+        _fix_poormans_3d()
+    for artist, _, _ in selected:
+        artist.set_rasterized(True)
+    try:
+        yield selected
+    finally:
+        for artist, _, _ in selected:
+            artist.set_rasterized(False)
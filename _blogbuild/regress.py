@@ -0,0 +1,236 @@
+"""
+Image regression tests of the posts.
+
+``python -m _blogbuild regress`` renders the posts (in parallel, without the
+cell cache unless ``--cache`` is given, see `.build`) and compares every
+image of their outputs with a golden copy in ``tests/golden/<post>/``,
+named after the cell and the position of the image in its outputs.  The
+golden copies are committed, so that changes to them are reviewed with the
+changes that caused them.  The comparisons also run in a process pool.  An
+image fails when
+
+- its size differs from the golden one,
+- more than `MAX_BAD_FRACTION` of its pixels differ by more than
+  `TOLERANCE` (out of 255) in some channel, or
+- the structural similarity (SSIM, over 7x7 windows of the luminance) of
+  the two images is below `MIN_SSIM`, which catches blurred or shifted
+  details that the tolerance lets through.
+
+Only the failures are written, to ``_build/regressions/<post>/``, as a
+thumbnail of the golden image, the new one and their differences side by
+side.  ``regress --update`` stores the images of the render as the new
+golden copies instead; ``--no-render`` compares the last build.
+"""
+
+import io
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .config import GOLDEN_DIR, REGRESSION_DIR
+
+TOLERANCE = 8
+MAX_BAD_FRACTION = 1e-3
+MIN_SSIM = 0.98
+
+# Height of each image in the thumbnails of the failures.
+THUMBNAIL_HEIGHT = 240
+
+
+def output_images(result):
+    """
+    Return ``{name: png bytes}`` for the PNG images of the outputs of a post
+    *result*.
+    """
+    import base64
+
+    images = {}
+    for cell in result["cells"]:
+        k = 0
+        for output in cell["outputs"]:
+            data = output.get("data", {}).get("image/png")
+            if data is None:
+                continue
+            name = f"cell{cell['index']:03d}-{k}.png"
+            images[name] = base64.b64decode(data)
+            k += 1
+    return images
+
+
+def _decode(png):
+    from PIL import Image
+
+    return np.asarray(Image.open(io.BytesIO(png)).convert("RGBA"))
+
+
+def _luminance(rgba):
+    # Composited over white, as the page shows it.
+    rgba = rgba.astype(np.float64) / 255
+    rgb = rgba[..., :3] * rgba[..., 3:] + (1 - rgba[..., 3:])
+    return rgb @ np.array([0.299, 0.587, 0.114])
+
+
+def _box_mean(a, size):
+    c = np.pad(a, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[size:, size:] - c[:-size, size:] - c[size:, :-size]
+            + c[:-size, :-size]) / (size * size)
+
+
+def ssim(a, b, size=7):
+    """
+    Return the mean structural similarity of the luminance images *a* and
+    *b* (in [0, 1]), over windows of *size* pixels.
+    """
+    if min(a.shape) < size:
+        return 1. if np.array_equal(a, b) else 0.
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+    mu_a, mu_b = _box_mean(a, size), _box_mean(b, size)
+    var_a = _box_mean(a * a, size) - mu_a ** 2
+    var_b = _box_mean(b * b, size) - mu_b ** 2
+    cov = _box_mean(a * b, size) - mu_a * mu_b
+    index = (((2 * mu_a * mu_b + c1) * (2 * cov + c2))
+             / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2)))
+    return float(index.mean())
+
+
+def compare(expected, actual, tolerance=TOLERANCE):
+    """
+    Compare the RGBA arrays *expected* and *actual* and return the fraction
+    of the pixels that differ by more than *tolerance*, the SSIM and the
+    mask of these pixels (None if the sizes differ).
+    """
+    if expected.shape != actual.shape:
+        return 1., 0., None
+    diff = np.abs(expected.astype(np.int16) - actual.astype(np.int16))
+    bad = diff.max(axis=-1) > tolerance
+    return (float(bad.mean()),
+            ssim(_luminance(expected), _luminance(actual)), bad)
+
+
+def _thumbnail(expected, actual, bad):
+    from PIL import Image
+
+    panels = [expected, actual]
+    if bad is not None:
+        # The new image faded, with the differing pixels in red.
+        diff = np.full(actual.shape, 255, np.uint8)
+        diff[..., :3] = (191 + 64 * _luminance(actual)[..., None]).astype(
+            np.uint8)
+        diff[bad] = (255, 0, 0, 255)
+        panels.append(diff)
+    images = []
+    for panel in panels:
+        img = Image.fromarray(np.ascontiguousarray(panel))
+        scale = THUMBNAIL_HEIGHT / img.height
+        images.append(img.resize((max(1, round(img.width * scale)),
+                                  THUMBNAIL_HEIGHT), Image.LANCZOS))
+    sheet = Image.new("RGBA", (sum(img.width for img in images) + 8 *
+                               (len(images) - 1), THUMBNAIL_HEIGHT),
+                      (255, 255, 255, 255))
+    x = 0
+    for img in images:
+        sheet.paste(img, (x, 0))
+        x += img.width + 8
+    return sheet
+
+
+def _check(post, name, png, golden, target, tolerance, max_bad, min_ssim):
+    """
+    Compare an image with its golden copy, in a worker, and return
+    ``(post, name, status, bad fraction, ssim)``; write the thumbnail of a
+    failure to *target*.
+    """
+    try:
+        with open(golden, "rb") as f:
+            expected = f.read()
+    except FileNotFoundError:
+        return post, name, "new", None, None
+    if expected == png:
+        return post, name, "ok", 0., 1.
+    expected, actual = _decode(expected), _decode(png)
+    bad_fraction, similarity, bad = compare(expected, actual, tolerance)
+    if bad is None:
+        status = "size"
+    elif bad_fraction > max_bad or similarity < min_ssim:
+        status = "failed"
+    else:
+        return post, name, "ok", bad_fraction, similarity
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    _thumbnail(expected, actual, bad).save(target)
+    return post, name, status, bad_fraction, similarity
+
+
+def update_golden(results, golden_dir=GOLDEN_DIR):
+    """
+    Store the images of the post *results* as their golden copies, and
+    return the number of images and the names of the posts left out: those
+    whose render failed, whose images may be missing or wrong.
+    """
+    n = 0
+    refused = []
+    for result in results:
+        if result["status"] != "ok":
+            refused.append(result["name"])
+            continue
+        directory = golden_dir / result["name"]
+        shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True)
+        for name, png in output_images(result).items():
+            (directory / name).write_bytes(png)
+            n += 1
+    return n, refused
+
+
+def check_results(results, names=(), jobs=None, tolerance=TOLERANCE,
+                  max_bad=MAX_BAD_FRACTION, min_ssim=MIN_SSIM,
+                  golden_dir=GOLDEN_DIR, output_dir=REGRESSION_DIR,
+                  log=print):
+    """
+    Compare the images of the post *results* with their golden copies in a
+    process pool, and return the ``(post, image, status, bad fraction,
+    ssim)`` of those that are not ``"ok"``: ``"failed"``, ``"size"``,
+    ``"new"`` (no golden copy) or ``"missing"`` (a golden copy but no image).
+    The posts of *names* that have golden copies but no result (their worker
+    died) are returned as ``(post, None, "no result", None, None)``.
+    """
+    shutil.rmtree(output_dir, ignore_errors=True)
+    tasks = []
+    rendered = {result["name"] for result in results}
+    problems = [(name, None, "no result", None, None) for name in names
+                if name not in rendered and (golden_dir / name).is_dir()]
+    for result in results:
+        images = output_images(result)
+        directory = golden_dir / result["name"]
+        if directory.is_dir():
+            for path in sorted(directory.glob("*.png")):
+                if path.name not in images:
+                    problems.append((result["name"], path.name, "missing",
+                                     None, None))
+        for name, png in images.items():
+            tasks.append((result["name"], name, png, str(directory / name),
+                          str(output_dir / result["name"] / name)))
+    n_ok = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(tasks) // (4 * (jobs or os.cpu_count())))
+            n = len(tasks)
+            for check in pool.map(_check, *zip(*tasks), [tolerance] * n,
+                                  [max_bad] * n, [min_ssim] * n,
+                                  chunksize=chunksize):
+                if check[2] == "ok":
+                    n_ok += 1
+                else:
+                    problems.append(check)
+    for post, name, status, bad_fraction, similarity in problems:
+        detail = ""
+        if status == "failed":
+            detail = (f": {bad_fraction:.2%} of the pixels differ, "
+                      f"SSIM {similarity:.4f}")
+        log(f"{post}/{name}: {status}{detail}" if name is not None
+            else f"{post}: {status}")
+    log(f"{n_ok} of {len(tasks)} images match their golden copies"
+        + (f"; thumbnails of the failures in {output_dir}"
+           if output_dir.exists() else ""))
+    return problems
@@ -0,0 +1,436 @@
+"""
+Executing a post cell by cell, the way Quarto's Jupyter engine would.
+
+The outputs of each cell are collected in the nbformat layout (``stream``,
+``display_data``, ``execute_result`` and ``error`` dicts).  Figures are
+handled like the inline backend does: the value of the last expression is
+displayed, and figures still open in pyplot at the end of a cell (or when
+``plt.show`` is called) are displayed and closed.
+"""
+
+import ast
+import base64
+import contextlib
+import io
+import os
+import sys
+import time
+import traceback
+import tracemalloc
+import warnings
+
+from .cache import CellKeys, cached_prefix
+from .checkpoint import ForkSnapshots, PickleCheckpoints
+from .figstate import PNGMemo, figure_digest
+from .incremental import REPLAY, RUN, SERVE, cell_keys, plan
+from .metrics import CellMeter
+from .profiler import phase
+
+BACKEND = "Agg"
+
+
+def use_agg():
+    """
+    Select the Agg backend before anything imports pyplot.
+    """
+    os.environ["MPLBACKEND"] = BACKEND
+    import matplotlib
+    matplotlib.use(BACKEND)
+
+
+def reset_matplotlib(rc=None):
+    """
+    Close all figures and reset rcParams to *rc* (by default, to their values
+    right after matplotlib was imported).
+    """
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    plt.close("all")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        matplotlib.rcParams.update(rc or matplotlib.rcParamsOrig)
+    plt.switch_backend(BACKEND)
+
+
+def figure_to_png(fig, dpi=None):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    return buf.getvalue()
+
+
+def _compile_cell(cell, filename):
+    """
+    Compile *cell* into a code object for its body and, if the cell ends with
+    an expression, another one for that expression.
+    """
+    tree = ast.parse(cell.source, filename=filename)
+    ast.increment_lineno(tree, cell.lineno - 1)
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+        last = compile(last, filename, "eval")
+    body = compile(tree, filename, "exec")
+    return body, last
+
+
+def _is_redisplay(cell):
+    """
+    Return whether *cell* only displays a variable, like ``fig``.
+    """
+    try:
+        tree = ast.parse(cell.source)
+    except SyntaxError:
+        return False
+    return (len(tree.body) == 1 and isinstance(tree.body[0], ast.Expr)
+            and isinstance(tree.body[0].value, ast.Name))
+
+
+@contextlib.contextmanager
+def post_context(post):
+    """
+    Run with the post directory as the working directory and on sys.path, as
+    the posts open their assets (and helper modules) by relative path.
+    """
+    cwd = os.getcwd()
+    directory = str(post.directory)
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        with contextlib.suppress(ValueError):
+            sys.path.remove(directory)
+
+
+class PostRunner:
+    """
+    Execute the code cells of *post* in a fresh namespace.
+    """
+
+    def __init__(self, post, dpi=None, cache=None, checkpoints=None):
+        self.post = post
+        self.dpi = dpi
+        self.cache = cache
+        self.checkpoints = checkpoints
+        self.namespace = {"__name__": "__main__",
+                          "__file__": str(post.path)}
+        self._outputs = None
+        self._displayed = set()
+        self._display = True
+        self._figures = set()
+        self._pngs = PNGMemo()
+        self._reused = 0
+        self._redisplay = False
+        self._redisplay_next = False
+
+    def display_figure(self, fig, output_type="display_data"):
+        if not self._display:
+            return
+        # Re-displaying an unchanged figure reuses the PNG encoded before.
+        # A digest costs about as much as drawing a simple figure: digests
+        # are only taken in and before the cells that only display a
+        # variable (the tutorials show the figure again after each step),
+        # and not of the figures changed since they were drawn (stale).
+        png = None
+        if self._redisplay and not fig.stale:
+            png = self._pngs.get(figure_digest(fig, self.dpi))
+        if png is None:
+            with phase("draw"):
+                png = figure_to_png(fig, dpi=self.dpi)
+            # Saving restores the settings it changed, which marks the
+            # figure stale; any change from now on marks it again.
+            fig.stale = False
+        else:
+            self._reused += 1
+        text = repr(fig)
+        if self._redisplay_next:
+            # Drawing (and repr) fill caches of the figure; the next display
+            # of the unchanged figure sees the state after this one.
+            self._pngs.put(figure_digest(fig, self.dpi), png)
+        self._outputs.append({
+            "output_type": output_type,
+            "data": {"image/png": base64.b64encode(png).decode("ascii"),
+                     "text/plain": text},
+        })
+        self._displayed.add(id(fig))
+
+    def flush_figures(self):
+        import matplotlib.pyplot as plt
+        from matplotlib._pylab_helpers import Gcf
+
+        for manager in Gcf.get_all_fig_managers():
+            fig = manager.canvas.figure
+            self._figures.add(id(fig))
+            if id(fig) not in self._displayed:
+                self.display_figure(fig)
+        plt.close("all")
+
+    def display_value(self, value):
+        from matplotlib.figure import Figure
+
+        if value is None or not self._display:
+            return
+        if isinstance(value, Figure):
+            self.display_figure(value, "execute_result")
+        else:
+            self._outputs.append({"output_type": "execute_result",
+                                  "data": {"text/plain": repr(value)}})
+
+    def run_cell(self, cell, display=True, next_cell=None):
+        """
+        Execute *cell* and return its result dict.  Exceptions raised by the
+        cell are recorded as an ``error`` output and re-raised.
+
+        With *display* False, the cell is only executed for its side effects
+        and its figures are not rendered.  *next_cell*, if known, tells
+        whether the figures drawn may be displayed again right after.
+        """
+        self._outputs = outputs = []
+        self._displayed = set()
+        self._display = display
+        self._redisplay = _is_redisplay(cell)
+        self._redisplay_next = next_cell is not None and _is_redisplay(
+            next_cell)
+        self._figures = set()
+        self._reused = 0
+        stdout, stderr = io.StringIO(), io.StringIO()
+        filename = str(self.post.path)
+        meter = CellMeter()
+        error = None
+        try:
+            with (meter,
+                  phase(f"cell {cell.index} (line {cell.lineno})"),
+                  contextlib.redirect_stdout(stdout),
+                  contextlib.redirect_stderr(stderr),
+                  warnings.catch_warnings(record=True) as caught):
+                warnings.simplefilter("default")
+                body, last = _compile_cell(cell, filename)
+                exec(body, self.namespace)
+                if last is not None:
+                    self.display_value(eval(last, self.namespace))
+                self.flush_figures()
+        except Exception as e:
+            error = e
+        metrics = dict(meter.metrics, figures=len(self._figures),
+                       reused_pngs=self._reused)
+
+        if cell.options.get("warning", True) is not False:
+            for w in caught:
+                stderr.write(warnings.formatwarning(
+                    w.message, w.category, w.filename, w.lineno))
+        streams = [{"output_type": "stream", "name": name, "text": s.getvalue()}
+                   for name, s in [("stdout", stdout), ("stderr", stderr)]
+                   if s.getvalue()]
+        outputs[:0] = streams
+        if cell.options.get("output", True) is False:
+            outputs.clear()
+        if error is not None:
+            outputs.append({
+                "output_type": "error",
+                "ename": type(error).__name__,
+                "evalue": str(error),
+                "traceback": traceback.format_exception(error),
+            })
+
+        result = {"index": cell.index, "lineno": cell.lineno,
+                  "elapsed": metrics["wall"], "metrics": metrics,
+                  "outputs": outputs}
+        if error is not None and not cell.options.get("error", False):
+            raise CellError(result) from error
+        return result
+
+    def _result(self, status, results, start):
+        return {"name": self.post.name, "status": status,
+                "elapsed": time.perf_counter() - start, "cells": results}
+
+    @contextlib.contextmanager
+    def _inline_pyplot(self):
+        import matplotlib.pyplot as plt
+
+        # Resolve the backend now; pyplot would otherwise overwrite our show
+        # when it lazily loads the backend on the first figure.
+        plt.switch_backend(BACKEND)
+        show = plt.show
+
+        def inline_show(*args, **kwargs):
+            self.flush_figures()
+
+        plt.show = inline_show
+        try:
+            with post_context(self.post):
+                yield
+        finally:
+            plt.show = show
+            plt.close("all")
+
+    def _plan(self, cells, previous=None):
+        """
+        Return the plan for executing *cells*: the index of the checkpoint to
+        restore (-1 for none), the action for each cell (see `.incremental`),
+        the results to use for the cells that are not run, and the prefix and
+        graph keys (None without checkpoints).
+        """
+        n = len(cells)
+        restore, actions, given = -1, [RUN] * n, [None] * n
+        prefix_keys = graph_keys = None
+        if self.checkpoints is not None:
+            graph_keys, prefix_keys, graph = cell_keys(self.post, cells)
+            previous = {r["graph_key"]: r for r in previous or []
+                        if "graph_key" in r}
+            restore, actions = plan(graph_keys, prefix_keys, graph, previous,
+                                    self.checkpoints)
+            given = [previous.get(k) for k in graph_keys]
+        if self.cache is not None:
+            for j, result in enumerate(cached_prefix(self.post, cells,
+                                                     self.cache, self.dpi)):
+                if actions[j] == RUN:
+                    actions[j], given[j] = REPLAY, result
+        return restore, actions, given, prefix_keys, graph_keys
+
+    def run(self, cells=None, previous=None):
+        """
+        Execute all code cells (or the given *cells*) and return the post
+        result dict.
+
+        If a cache is given, the leading cells found in it are served from
+        it.  They still need to be executed (without rendering) for the state
+        they leave behind when a later cell is not cached.
+
+        With checkpoints (see `.checkpoint`), only the cells affected by the
+        changes since the run that produced the cell results *previous* are
+        executed, starting from the last checkpoint before them.
+        """
+        if cells is None:
+            cells = self.post.code_cells()
+        start = time.perf_counter()
+        restore, actions, given, prefix_keys, graph_keys = \
+            self._plan(cells, previous)
+        if RUN not in actions:
+            results = [self._served(cell, r, graph_keys, j)
+                       for j, (cell, r) in enumerate(zip(cells, given))]
+            return self._result("ok", results, start)
+
+        if isinstance(self.checkpoints, ForkSnapshots):
+            with self._inline_pyplot():
+                resumed = self.checkpoints.take(self._root_key)
+                if resumed is not None:
+                    self._serve_resumed(*resumed)
+            key = prefix_keys[restore] if restore >= 0 else self._root_key
+            # The snapshot may have been taken by another runner (the preview
+            # of `.watch`): it renders with the settings of this one.
+            settings = {"dpi": self.dpi, "cache": self.cache}
+            return self.checkpoints.resume(
+                key, (settings, cells, actions, given, prefix_keys, graph_keys,
+                      restore))
+
+        with self._inline_pyplot():
+            if restore >= 0:
+                self.checkpoints.load(prefix_keys[restore], self.namespace)
+            status, results = self._execute(cells, actions, given,
+                                            prefix_keys, graph_keys, restore)
+        if isinstance(self.checkpoints, PickleCheckpoints):
+            self.checkpoints.prune(prefix_keys)
+        return self._result(status, results, start)
+
+    @property
+    def _root_key(self):
+        return f"root-{self.post.name}"
+
+    @staticmethod
+    def _served(cell, result, graph_keys, j):
+        result = dict(result, index=cell.index, lineno=cell.lineno,
+                      cached=True)
+        if graph_keys is not None:
+            result["graph_key"] = graph_keys[j]
+        return result
+
+    def _serve_resumed(self, connection, message):
+        """
+        Carry on from a fork snapshot with *message*, send the post result
+        through *connection*, and exit.
+        """
+        start = time.perf_counter()
+        try:
+            settings, *work = message
+            self.dpi, self.cache = settings["dpi"], settings["cache"]
+            status, results = self._execute(*work)
+            connection.send(self._result(status, results, start))
+        finally:
+            os._exit(0)
+
+    def _checkpoint(self, key, cells, j):
+        if isinstance(self.checkpoints, ForkSnapshots):
+            resumed = self.checkpoints.take(key)
+            if resumed is not None:
+                self._serve_resumed(*resumed)
+        else:
+            self.checkpoints.save(key, self.namespace, cells, j)
+
+    def _execute(self, cells, actions, given, prefix_keys, graph_keys,
+                 restore=-1):
+        """
+        Carry out *actions* on *cells*, the state after cell *restore* having
+        been restored, and return the status and the cell results.
+        """
+        results = []
+        status = "ok"
+        keys = None
+        if self.cache is not None:
+            keys = CellKeys(self.post, self.dpi)
+        # Checkpoints are only taken while all the cells before are executed,
+        # so that they hold the same state as a full run would.
+        contiguous = True
+        for j, (cell, action) in enumerate(zip(cells, actions)):
+            next_cell = cells[j + 1] if j + 1 < len(cells) else None
+            if keys is not None:
+                key = keys.next(cell)
+            if action == SERVE:
+                result = self._served(cell, given[j], graph_keys, j)
+                contiguous = contiguous and j <= restore
+            else:
+                try:
+                    if action == REPLAY:
+                        self.run_cell(cell, display=False)
+                        result = self._served(cell, given[j], graph_keys, j)
+                    else:
+                        result = self.run_cell(cell, next_cell=next_cell)
+                        if keys is not None:
+                            self.cache.put(key, result)
+                except CellError as e:
+                    results.append(e.result)
+                    status = "error"
+                    break
+                if graph_keys is not None:
+                    result["graph_key"] = graph_keys[j]
+                if self.checkpoints is not None and contiguous:
+                    self._checkpoint(prefix_keys[j], cells, j)
+            results.append(result)
+            if keys is not None:
+                keys.record(result["outputs"])
+        return status, results
+
+
+class CellError(Exception):
+    def __init__(self, result):
+        super().__init__(f"cell {result['index']} (line {result['lineno']}) failed")
+        self.result = result
+
+
+def run_post(post, dpi=None, cache=None, checkpoints=None, previous=None,
+             trace_memory=False, profile=False):
+    use_agg()
+    if trace_memory:
+        tracemalloc.start()
+    runner = PostRunner(post, dpi=dpi, cache=cache, checkpoints=checkpoints)
+    if not profile:
+        return runner.run(previous=previous)
+    from . import profiler
+    profiler.start()
+    try:
+        result = runner.run(previous=previous)
+    finally:
+        stacks = profiler.stop()
+    result["profile"] = stacks
+    return result
@@ -0,0 +1,55 @@
+"""
+Longest-first scheduling of posts from the runtimes of earlier builds.
+
+Handing the slowest jobs to the pool first (the LPT rule) keeps a long post
+from starting last and leaving the other workers idle, so that a full
+rebuild takes about as long as the slowest post.
+"""
+
+import json
+
+from .config import RUNTIMES_FILE
+
+
+def load_runtimes(path=RUNTIMES_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_runtimes(runtimes, path=RUNTIMES_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(runtimes, f, indent=1, sort_keys=True)
+
+
+def update_runtimes(results, path=RUNTIMES_FILE):
+    """
+    Record the elapsed time of each post result, keeping the entries of posts
+    that were not part of this build.
+
+    For posts with cached cells, the original execution time of those cells
+    is counted, so that the record stays that of a full execution.
+    """
+    runtimes = load_runtimes(path)
+    for r in results:
+        elapsed = r["elapsed"]
+        if any(c.get("cached") for c in r["cells"]):
+            elapsed = sum(c["elapsed"] for c in r["cells"])
+        runtimes[r["name"]] = round(elapsed, 3)
+    save_runtimes(runtimes, path)
+    return runtimes
+
+
+def longest_first(posts, runtimes):
+    """
+    Sort *posts* by decreasing recorded runtime.  Posts that were never timed
+    go first, as nothing is known about how long they take.
+    """
+    def key(post):
+        t = runtimes.get(post.name)
+        return (t is not None, -(t or 0.), post.name)
+
+    return sorted(posts, key=key)
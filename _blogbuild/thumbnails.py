@@ -0,0 +1,161 @@
+"""
+Thumbnails of the headline figures, for the post listing.
+
+The listing only shows an image for the posts that set ``image:`` in their
+header, to a remote URL.  `make_thumbnails` renders the headline figure of
+each post (see `.bench.headline_cells`) at a low dpi, which is quick even
+for figures with image effects, and scales it down to `WIDTH` pixels.  Only
+the headline cells are executed, in a fresh worker per post, and the posts
+run in parallel, longest first.
+
+A thumbnail is cached in ``_build/cache/thumbnails`` under a key that hashes
+the headline cells, the files of the post they refer to and the installed
+library versions (see `.cache.cell_key`), with the dpi and width; a post
+whose key did not change is not executed.
+
+The thumbnails are published with the posts, as
+``posts/<post>/thumbnail.png``, next to a ``_metadata.yml`` that sets
+``image: thumbnail.png``: Quarto merges it into the metadata of the post,
+and the listing of ``index.qmd`` shows the image.  The posts that set an
+image in their header keep it, and get no thumbnail.  The post index (see
+`.listing`) also refers to the thumbnails.  Both files are build outputs:
+git and the watch mode ignore them.
+"""
+
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .config import POSTS_DIR, THUMBNAIL_CACHE_DIR
+
+THUMBNAIL_DPI = 40
+WIDTH = 400
+
+THUMBNAIL_NAME = "thumbnail.png"
+
+# Directory metadata of a post with a thumbnail.
+METADATA_NAME = "_metadata.yml"
+METADATA = f"""\
+# Written by `python -m _blogbuild thumbnails`: the image of the post in the
+# listing.
+image: {THUMBNAIL_NAME}
+"""
+
+
+def thumbnail_key(post, dpi=THUMBNAIL_DPI, width=WIDTH):
+    """
+    Return the cache key of the thumbnail of *post*, or None if it has no
+    code cell.
+    """
+    from .bench import headline_cells
+    from .cache import asset_files, cell_key
+
+    cells = headline_cells(post)
+    if not cells:
+        return None
+    key = f"thumbnail dpi={dpi:g} width={width}"
+    assets = asset_files(post)
+    for cell in cells:
+        key = cell_key(cell, key, None, assets)
+    return key
+
+
+def thumbnail_path(name, posts_dir=POSTS_DIR):
+    return posts_dir / name / THUMBNAIL_NAME
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _publish(path, data):
+    """
+    Write the thumbnail *data* to *path*, and the metadata that makes it the
+    image of the post next to it, unless written by hand.
+    """
+    _write(path, data)
+    metadata = path.with_name(METADATA_NAME)
+    try:
+        text = metadata.read_text()
+    except FileNotFoundError:
+        text = ""
+    if text != METADATA and (not text
+                             or text.startswith(METADATA.splitlines()[0])):
+        _write(metadata, METADATA.encode())
+
+
+def _render(path, dpi, width):
+    """
+    Render the headline figure of the post at *path*, in a worker, and
+    return the PNG of its thumbnail.
+    """
+    from PIL import Image
+
+    from .bench import build_headline
+    from .fonts import use_snapshot
+    from .images import _encode
+    from .posts import Post
+    from .runner import use_agg
+
+    use_snapshot()
+    use_agg()
+    fig = build_headline(Post(path))
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    img = Image.open(buf)
+    if img.width > width:
+        img = img.resize((width, round(img.height * width / img.width)),
+                         Image.LANCZOS)
+    return _encode(img)
+
+
+def make_thumbnails(posts, jobs=None, dpi=THUMBNAIL_DPI, width=WIDTH,
+                    cache_dir=THUMBNAIL_CACHE_DIR, posts_dir=POSTS_DIR,
+                    log=print):
+    """
+    Publish the thumbnails of *posts* (under *posts_dir*, see the module
+    docstring), rendering those that are not cached, and return ``{post
+    name: path}`` for those that could be made.
+    """
+    from .build import pool_context
+    from .schedule import load_runtimes, longest_first
+
+    made = {}
+    todo = {}
+    for post in posts:
+        key = thumbnail_key(post, dpi, width)
+        if key is None:
+            continue
+        cached = cache_dir / key[:2] / f"{key}.png"
+        if cached.exists():
+            target = thumbnail_path(post.name, posts_dir)
+            _publish(target, cached.read_bytes())
+            made[post.name] = target
+        else:
+            todo[post] = cached
+    served = len(made)
+    if todo:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=pool_context(),
+                                 max_tasks_per_child=1) as pool:
+            futures = {post: pool.submit(_render, str(post.path), dpi, width)
+                       for post in longest_first(todo, load_runtimes())}
+            for post, future in futures.items():
+                try:
+                    data = future.result()
+                except Exception as e:
+                    log(f"{post.name}: no thumbnail ({e!r})")
+                    continue
+                _write(todo[post], data)
+                target = thumbnail_path(post.name, posts_dir)
+                _publish(target, data)
+                made[post.name] = target
+        log(f"rendered {len(made) - served} of {len(todo)} thumbnails in "
+            f"{time.perf_counter() - start:.1f}s")
+    log(f"{len(made)} of {len(posts)} thumbnails up to date")
+    return made
@@ -0,0 +1,302 @@
+"""
+Watching the posts and re-rendering the edited ones.
+
+The watcher is a long-lived process that has imported everything the posts
+use (see `.preload`).  Posts run incrementally from fork snapshots of it
+(see `.checkpoint.ForkSnapshots`): an edit re-executes the affected cells,
+from a warm copy of the interpreter as it was before the first of them.
+
+Each edit is first rendered at a low dpi, which is quick even for figures
+with image effects (their cost grows with the number of pixels), and the
+preview is written to ``_build/posts/<post>/cells.json``.  The full render
+then runs in the background and replaces it, unless the post was edited
+again meanwhile.
+
+The renders run one at a time, on a single worker thread: the runner
+changes the working directory, patches pyplot and forks, which are all
+process-wide.  The worker takes the pending previews before the full
+renders, and drops the renders outdated by a newer edit.
+
+Changes are detected with inotify on Linux, by polling the post directories
+elsewhere (or with ``--poll``).
+"""
+
+import ctypes
+import ctypes.util
+import itertools
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .config import POSTS_DIR
+from .thumbnails import METADATA_NAME, THUMBNAIL_NAME
+
+# Names of files that editors write next to the ones being edited.
+_IGNORED_PREFIXES = (".", "#")
+_IGNORED_SUFFIXES = ("~", ".swp", ".swx", ".tmp")
+# Files that the build publishes in the post directories.
+_IGNORED_NAMES = ("__pycache__", THUMBNAIL_NAME, METADATA_NAME)
+
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_ISDIR = 0x40000000
+_IN_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+            _IN_DELETE)
+_EVENT = struct.Struct("iIII")
+
+
+def _ignored(name):
+    return (not name or name.startswith(_IGNORED_PREFIXES)
+            or name.endswith(_IGNORED_SUFFIXES) or name in _IGNORED_NAMES)
+
+
+class PollingWatcher:
+    """
+    Detect changes by comparing the mtimes and sizes of the files of the
+    post directories every *interval* seconds.
+    """
+
+    def __init__(self, posts_dir=POSTS_DIR, interval=0.5):
+        self.posts_dir = Path(posts_dir)
+        self.interval = interval
+        self._stamps = self._scan()
+
+    def _scan(self):
+        stamps = {}
+        for directory in self.posts_dir.iterdir():
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                if _ignored(path.name) or not path.is_file():
+                    continue
+                st = path.stat()
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def changes(self, timeout=None):
+        """
+        Wait up to *timeout* seconds (forever if None) for changes and
+        return the names of the changed posts.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stamps = self._scan()
+            changed = {p.parent.name for p in stamps.keys() | self._stamps
+                       if stamps.get(p) != self._stamps.get(p)}
+            self._stamps = stamps
+            if changed or (deadline is not None
+                           and time.monotonic() >= deadline):
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Detect changes with inotify (Linux only).
+    """
+
+    def __init__(self, posts_dir=POSTS_DIR, debounce=0.2):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._libc = libc
+        self.posts_dir = Path(posts_dir)
+        self.debounce = debounce
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}  # watch descriptor -> post name (None: posts_dir)
+        self._add(self.posts_dir, None)
+        for directory in self.posts_dir.iterdir():
+            if directory.is_dir():
+                self._add(directory, directory.name)
+
+    def _add(self, directory, name):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory),
+                                          _IN_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(),
+                          f"inotify_add_watch failed for {directory}")
+        self._dirs[wd] = name
+
+    def _read(self):
+        changed = set()
+        data = os.read(self._fd, 1 << 16)
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0").decode(
+                errors="replace")
+            pos += length
+            post = self._dirs.get(wd)
+            if post is None:
+                # A post directory was created or renamed into place.
+                directory = self.posts_dir / name
+                if mask & _IN_ISDIR and directory.is_dir():
+                    self._add(directory, name)
+                    changed.add(name)
+            elif not _ignored(name):
+                changed.add(post)
+        return changed
+
+    def changes(self, timeout=None):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = self._read()
+        # Editors save in several steps; wait for them to be done.
+        while select.select([self._fd], [], [], self.debounce)[0]:
+            changed |= self._read()
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def make_watcher(posts_dir=POSTS_DIR, polling=False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(posts_dir)
+        except OSError:
+            pass
+    return PollingWatcher(posts_dir)
+
+
+class PostWatcher:
+    """
+    Render edited posts: a preview at *preview_dpi* right away, then the
+    full render at *dpi* in the background.
+    """
+
+    # Priorities of the queued renders.
+    _STOP, _PREVIEW, _FULL = range(3)
+
+    def __init__(self, preview_dpi=40, dpi=None, use_cache=True, log=print):
+        from .cache import CellCache
+        from .checkpoint import ForkSnapshots
+
+        self.preview_dpi = preview_dpi
+        self.dpi = dpi
+        self.cache = CellCache() if use_cache else None
+        self.snapshots = ForkSnapshots()
+        self.log = log
+        self._previous = {}  # (post name, preview) -> cell results
+        self._snapshot_keys = {}  # post name -> prefix keys of its snapshots
+        self._generation = {}  # post name -> number of renders started
+        self._lock = threading.Lock()
+        # (priority, order, post, generation), served by a single thread.
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def render(self, post):
+        with self._lock:
+            generation = self._generation[post.name] = \
+                self._generation.get(post.name, 0) + 1
+        self._queue.put((self._PREVIEW, next(self._order), post, generation))
+
+    def _outdated(self, post, generation):
+        with self._lock:
+            return self._generation[post.name] != generation
+
+    def _work(self):
+        while True:
+            priority, _, post, generation = self._queue.get()
+            if priority == self._STOP:
+                return
+            if self._outdated(post, generation):
+                continue
+            preview = priority == self._PREVIEW
+            if self._run(post, preview, generation) is not None and preview:
+                self._queue.put((self._FULL, next(self._order), post,
+                                 generation))
+
+    def _run(self, post, preview, generation):
+        from .build import write_result
+        from .incremental import cell_keys
+        from .runner import PostRunner
+
+        label = "preview" if preview else "full render"
+        runner = PostRunner(post, dpi=self.preview_dpi if preview else self.dpi,
+                            cache=None if preview else self.cache,
+                            checkpoints=self.snapshots)
+        cells = post.code_cells()
+        try:
+            result = runner.run(
+                cells, previous=self._previous.get((post.name, preview)))
+        except Exception as e:
+            self.log(f"{post.name}: {label} failed: {e!r}")
+            return None
+        result["preview"] = preview
+        with self._lock:
+            self._previous[post.name, preview] = result["cells"]
+            current = self._generation[post.name] == generation
+            if current:
+                write_result(result)
+        if not current:
+            self.log(f"{post.name}: {label} outdated by a newer edit")
+            return None
+        if not preview:
+            # Only the snapshots of the current version of the post can be
+            # resumed by the next edit.
+            _, prefix_keys, _ = cell_keys(post, cells)
+            old = self._snapshot_keys.get(post.name, set())
+            self.snapshots.discard(old - set(prefix_keys))
+            self._snapshot_keys[post.name] = set(prefix_keys)
+        n_run = sum(not c.get("cached", False) for c in result["cells"])
+        self.log(f"{post.name}: {label} {result['status']} "
+                 f"({result['elapsed']:.1f}s, {n_run} cells executed)")
+        return result
+
+    def close(self):
+        # The render in progress, if any, is finished first.
+        self._queue.put((self._STOP, next(self._order), None, None))
+        self._worker.join()
+        self.snapshots.close()
+
+
+def watch(names=None, preview_dpi=40, dpi=None, use_cache=True,
+          polling=False, log=print):
+    """
+    Render the posts *names* (default: all) whenever they are edited, until
+    interrupted.  The posts named explicitly are rendered once at start, so
+    that their snapshots are ready for the first edit.
+    """
+    import importlib
+
+    from .fonts import share_snapshot
+    from .posts import find_posts
+    from .runner import use_agg
+
+    share_snapshot()
+    use_agg()
+    importlib.import_module(f"{__package__}.preload")
+    watcher = make_watcher(polling=polling)
+    renderer = PostWatcher(preview_dpi=preview_dpi, dpi=dpi,
+                           use_cache=use_cache, log=log)
+    try:
+        for post in find_posts(names) if names else []:
+            renderer.render(post)
+        log(f"watching {POSTS_DIR} ({type(watcher).__name__})")
+        while True:
+            changed = watcher.changes()
+            posts = {p.name: p for p in find_posts()}
+            for name in sorted(changed):
+                if name in posts and (not names or name in names):
+                    renderer.render(posts[name])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        renderer.close()
+        watcher.close()
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+from _blogbuild.posts import Post
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+@pytest.fixture
+def make_post(tmp_path):
+    """
+    Return a function writing a post made of the given cell sources, and
+    returning it.
+    """
+    def make_post(*cells, name="post"):
+        directory = tmp_path / name
+        directory.mkdir()
+        text = "".join(f"# %%\n{source.strip()}\n\n" for source in cells)
+        (directory / "index.py").write_text(text)
+        return Post(directory / "index.py")
+    return make_post
@@ -0,0 +1,32 @@
+import pytest
+
+from _blogbuild.animation import write_animation
+
+FRAMES = """\
+from matplotlib.figure import Figure
+
+
+def frame(i):
+    fig = Figure(figsize=(1, 1), dpi=50)
+    fig.add_subplot().plot([0, 1], [0, i // 2])
+    return fig
+"""
+
+
+@pytest.mark.parametrize("suffix", [".gif", ".apng"])
+def test_identical_frames_are_shown_longer(tmp_path, suffix):
+    from PIL import Image
+
+    module = tmp_path / "frames.py"
+    module.write_text(FRAMES)
+    path = tmp_path / f"animation{suffix}"
+    # Frames 0 and 1, then 2 and 3, are identical.
+    assert write_animation(f"{module}:frame", 5, path, fps=10, jobs=1,
+                           log=lambda *args: None) == 3
+    with Image.open(path) as image:
+        assert image.n_frames == 3
+        durations = []
+        for k in range(image.n_frames):
+            image.seek(k)
+            durations.append(image.info["duration"])
+    assert durations == [200, 200, 100]
@@ -0,0 +1,24 @@
+import matplotlib.pyplot as plt
+
+from _blogbuild.bench import build_headline, headline_cells
+from _blogbuild.runner import use_agg
+
+
+def test_headline_is_the_first_code_fold_cell(make_post):
+    post = make_post("x = 1",
+                     "#| code-fold: true\nfig = 1",
+                     "#| code-fold: true\nfig = 2")
+    assert [cell.source for cell in headline_cells(post)] == ["fig = 1"]
+
+
+def test_headline_falls_back_to_the_first_figure_left_open(make_post):
+    use_agg()
+    post = make_post("import matplotlib.pyplot as plt\nwidth = 3",
+                     "x = 1",
+                     "fig = plt.figure(figsize=(width, 2))",
+                     "raise AssertionError('not executed')")
+    try:
+        fig = build_headline(post)
+        assert tuple(fig.get_size_inches()) == (3, 2)
+    finally:
+        plt.close("all")
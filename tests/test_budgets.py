@@ -0,0 +1,25 @@
+from _blogbuild.budgets import check, measure
+
+
+def _metrics(*cells):
+    return {"name": "post", "status": "ok", "elapsed": 0., "cells": [
+        dict(cell, index=i, lineno=10 * i) for i, cell in enumerate(cells)]}
+
+
+def test_only_executed_cells_count_for_time_and_memory():
+    metrics = _metrics(
+        {"cached": True, "wall": 9., "cpu": 9., "rss_peak": 900e6,
+         "output_bytes": 2000},
+        {"wall": 5., "cpu": 1., "cpu_children": 0.5, "rss_peak": 200e6,
+         "output_bytes": 1000})
+    assert measure(metrics) == {"cpu_seconds": 1.5, "memory_mb": 200.,
+                                "output_kb": 3.}
+
+
+def test_overruns_name_the_responsible_cell():
+    metrics = _metrics({"cpu": 0.5, "rss_peak": 100e6},
+                       {"cpu": 2., "rss_peak": 300e6},
+                       {"cpu": 1., "rss_peak": 300e6})
+    overruns = check(metrics, {"cpu_seconds": 3., "memory_mb": 250.})
+    assert [(o["key"], o["cell"], o["lineno"]) for o in overruns] == [
+        ("cpu_seconds", 1, 10), ("memory_mb", 1, 10)]
@@ -0,0 +1,30 @@
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from _blogbuild import build
+
+
+def _preloaded():
+    return "_blogbuild.preload" in sys.modules
+
+
+@pytest.fixture(autouse=True)
+def no_snapshot(monkeypatch):
+    monkeypatch.setattr(build, "share_snapshot", lambda: None)
+
+
+@pytest.mark.skipif(
+    "forkserver" not in multiprocessing.get_all_start_methods(),
+    reason="no fork server on this platform")
+def test_warm_workers_fork_from_the_preloading_server():
+    context = build.pool_context(warm=True)
+    assert context.get_start_method() == "forkserver"
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        assert pool.submit(_preloaded).result()
+
+
+def test_cold_workers_are_spawned():
+    assert build.pool_context(warm=False).get_start_method() == "spawn"
@@ -0,0 +1,27 @@
+from _blogbuild.blobs import BlobStore
+from _blogbuild.cache import CellCache, CellKeys
+from _blogbuild.runner import PostRunner, use_agg
+
+
+def test_keys_depend_on_the_dpi(make_post):
+    post = make_post("x = 1", "y = 2")
+    chains = []
+    for dpi in (None, 40, 40, 200):
+        keys = CellKeys(post, dpi)
+        chain = []
+        for cell in post.code_cells():
+            chain.append(keys.next(cell))
+            keys.record([])
+        chains.append(chain)
+    assert chains[1] == chains[2]
+    assert len({tuple(chain) for chain in chains}) == 3
+
+
+def test_renders_at_other_dpi_are_not_served(make_post, tmp_path):
+    use_agg()
+    post = make_post("import matplotlib.pyplot as plt\n"
+                     "fig = plt.figure(figsize=(1, 1))")
+    cache = CellCache(tmp_path / "cache", BlobStore(tmp_path / "blobs"))
+    for dpi, cached in [(40, False), (40, True), (80, False)]:
+        result = PostRunner(post, dpi=dpi, cache=cache).run()
+        assert result["cells"][0].get("cached", False) == cached
@@ -0,0 +1,42 @@
+from _blogbuild.deps import dependency_graph
+
+
+def _graph(make_post, *cells):
+    return dependency_graph(make_post(*cells).code_cells())
+
+
+def test_cells_depend_on_the_last_definitions_they_use(make_post):
+    assert _graph(make_post,
+                  "import numpy as np",
+                  "a = np.arange(3)",
+                  "b = 2",
+                  "c = a + 1",
+                  "b = b * 2",
+                  "d = c") == [set(), {0}, set(), {1}, {2}, {3}]
+
+
+def test_aliases_of_a_figure_and_pyplot_are_one_group(make_post):
+    assert _graph(make_post,
+                  "import matplotlib.pyplot as plt",
+                  "fig, ax = plt.subplots()",
+                  "bars = ax.bar([1, 2], 1)",
+                  "bars[0].set_color('r')",
+                  "plt.title('t')",
+                  "m = 3") == [set(), {0}, {1}, {2}, {3}, set()]
+
+
+def test_functions_depend_on_the_globals_they_use(make_post):
+    assert _graph(make_post,
+                  "k = 2",
+                  "def f(x):\n    return k * x",
+                  "k = 3",
+                  "y = f(1)") == [set(), {0}, {1}, {2}]
+
+
+def test_cells_depend_on_their_imports(make_post):
+    assert _graph(make_post,
+                  "import numpy as np",
+                  "x = np.zeros(2)",
+                  "from numpy import ones as np",
+                  "y = np(2)",
+                  "def f():\n    return np.pi") == [set(), {0}, {0}, {2}, {2}]
@@ -0,0 +1,36 @@
+import io
+
+import numpy as np
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from _blogbuild.displaylist import DisplayList
+
+
+def _figure(rect):
+    fig = Figure(figsize=(3, 2), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes(rect) if rect else fig.add_subplot()
+    ax.plot([0, 1, 3], [0, 2, 1])
+    ax.bar([1, 2], [1, 2], alpha=0.5)
+    ax.set_title("title")
+    return fig
+
+
+def _savefig(fig, bbox_inches):
+    from PIL import Image
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches=bbox_inches)
+    return np.asarray(Image.open(buf).convert("RGBA"))
+
+
+# The tight bounding box extends beyond the figure with the default axes,
+# and is within it, at a fractional pixel, with the small ones.
+@pytest.mark.parametrize("rect", [None, [0.3, 0.3, 0.4, 0.4]])
+@pytest.mark.parametrize("bbox_inches", [None, "tight"])
+def test_png_is_the_one_of_savefig(rect, bbox_inches):
+    display_list = DisplayList.record(_figure(rect), bbox_inches=bbox_inches)
+    np.testing.assert_array_equal(display_list.to_rgba(),
+                                  _savefig(_figure(rect), bbox_inches))
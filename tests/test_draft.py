@@ -0,0 +1,42 @@
+import subprocess
+import sys
+
+import pytest
+
+from _blogbuild.config import ROOT
+
+# Run in a fresh interpreter, as the patches of `install` are never undone.
+CHECK = """\
+import io
+import sys
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import mpl_visual_context.image_effect as ie
+import mpl_visual_context.patheffects as pe
+from _blogbuild import draft
+
+if sys.argv[1] == "draft":
+    assert draft.install() == ["mpl_visual_context", "mpl_poormans_3d"]
+    assert draft.install() == []
+fig, ax = plt.subplots()
+ax.plot([0, 1], [0, 1], path_effects=[
+    pe.ImageEffect(ie.Fill("k") | ie.Dilation(3) | ie.AlphaAxb((0.5, 0)))])
+buf = io.BytesIO()
+fig.savefig(buf, format="svg")
+print(buf.getvalue().count(b"<image"))
+"""
+
+
+def _images(mode):
+    output = subprocess.run(
+        [sys.executable, "-c", CHECK, mode],
+        cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return int(output)
+
+
+def test_image_effects_are_drawn_as_vector_paths():
+    pytest.importorskip("mpl_visual_context")
+    pytest.importorskip("mpl_poormans_3d")
+    assert _images("full") > 0
+    assert _images("draft") == 0
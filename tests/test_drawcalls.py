@@ -0,0 +1,37 @@
+import matplotlib.patheffects as pe
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+
+from _blogbuild.drawcalls import _cost, account
+
+
+def test_cost():
+    marker = Path([(0, 0), (1, 0), (1, 1), (0, 0)])
+    line = Path([(0, 0), (1, 1)])
+    assert _cost("draw_markers", (marker, None, line, None)) == (8, 0)
+    assert _cost("draw_quad_mesh", (None, 3, 2, None)) == (24, 0)
+    image = np.zeros((20, 30, 4), np.uint8)
+    assert _cost("draw_image", (0, 0, image)) == (0, 600)
+    assert _cost("draw_text", ()) == (0, 0)
+
+
+def test_calls_are_attributed_to_artists_and_path_effects():
+    fig = Figure()
+    ax = fig.add_subplot()
+    ax.plot([0, 1, 2], [0, 1, 0], label="data",
+            path_effects=[pe.withStroke(linewidth=4, foreground="w")])
+    ax.imshow([[0, 1], [1, 0]], extent=(0, 2, 0, 1))
+    rows = {(row["artist"], row["chain"]): row
+            for row in account(fig, dpi=50)}
+    # The stroke, then the line itself.
+    line = rows["Line2D 'data'", "withStroke"]
+    assert line["calls"] == {"draw_path": 2}
+    assert line["vertices"] == 6
+    assert not any(artist == "Line2D 'data'" and chain != "withStroke"
+                   for artist, chain in rows)
+    image = rows["AxesImage", ""]
+    assert image["calls"] == {"draw_image": 1}
+    assert image["pixels"] > 0
+    spines = rows["Spine", ""]
+    assert spines["artists"] == 4
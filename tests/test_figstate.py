@@ -0,0 +1,50 @@
+import matplotlib.pyplot as plt
+
+from _blogbuild.figstate import figure_digest
+
+
+def _figure(namespace, source):
+    # The posts run as __main__.
+    namespace.setdefault("__name__", "__main__")
+    exec("import matplotlib.pyplot as plt\n"
+         "fig, ax = plt.subplots()\n" + source, namespace)
+    return namespace["fig"]
+
+
+def test_digest_is_stable():
+    fig = _figure({}, "ax.plot([1, 2, 3])")
+    try:
+        assert figure_digest(fig, 100) == figure_digest(fig, 100)
+        assert figure_digest(fig, 100) != figure_digest(fig, 200)
+    finally:
+        plt.close(fig)
+
+
+def test_digest_sees_the_globals_of_a_formatter():
+    namespace = {"unit": "m"}
+    fig = _figure(namespace, "ax.xaxis.set_major_formatter("
+                             "lambda x, pos: f'{x} {unit}')")
+    try:
+        digest = figure_digest(fig)
+        namespace["unit"] = "km"
+        assert figure_digest(fig) != digest
+    finally:
+        plt.close(fig)
+
+
+def test_digest_sees_the_closure_of_a_formatter():
+    namespace = {}
+    fig = _figure(namespace, """
+def formatter(unit):
+    def format(x, pos):
+        return f'{x} {unit[0]}'
+    return format
+unit = ['m']
+ax.xaxis.set_major_formatter(formatter(unit))
+""")
+    try:
+        digest = figure_digest(fig)
+        namespace["unit"][0] = "km"
+        assert figure_digest(fig) != digest
+    finally:
+        plt.close(fig)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from _blogbuild.config import ROOT
+from _blogbuild.fonts import SNAPSHOT_ENV, share_snapshot
+
+# Run in a fresh interpreter, as the font manager is loaded at import.
+CHECK = """\
+import sys
+from _blogbuild.fonts import use_snapshot
+assert use_snapshot(sys.argv[1])
+from matplotlib import font_manager
+print(sum(f.fname.startswith(sys.argv[2]) for f in font_manager.fontManager.ttflist))
+"""
+
+
+def test_snapshot_is_built_once(tmp_path, monkeypatch):
+    monkeypatch.delenv(SNAPSHOT_ENV, raising=False)
+    snapshot = share_snapshot(tmp_path)
+    assert os.environ[SNAPSHOT_ENV] == str(snapshot)
+    (fontlist,) = snapshot.iterdir()
+    stamp = fontlist.stat().st_mtime_ns
+    assert share_snapshot(tmp_path) == snapshot
+    assert fontlist.stat().st_mtime_ns == stamp
+
+
+def test_workers_load_the_extra_fonts_from_the_snapshot(tmp_path,
+                                                         monkeypatch):
+    mplfonts = pytest.importorskip("mplfonts")
+    monkeypatch.delenv(SNAPSHOT_ENV, raising=False)
+    snapshot = share_snapshot(tmp_path)
+    fonts_dir = os.path.join(os.path.dirname(mplfonts.__file__), "fonts")
+    output = subprocess.run(
+        [sys.executable, "-c", CHECK, str(snapshot), fonts_dir],
+        cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert int(output) > 0
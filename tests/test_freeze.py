@@ -0,0 +1,53 @@
+import json
+import os
+
+from _blogbuild.blobs import BlobStore
+from _blogbuild.freeze import write_freeze
+from _blogbuild.runner import PostRunner, use_agg
+
+
+def test_frozen_results_of_a_post(make_post, tmp_path):
+    use_agg()
+    post = make_post("import matplotlib.pyplot as plt\n"
+                     "print('hello')",
+                     "#| echo: false\n"
+                     "fig, ax = plt.subplots(figsize=(2, 2))")
+    post.path.write_text('# ---\n# title: "A post"\n# ---\n\n'
+                         "# %% [markdown]\n# Some *text*.\n\n"
+                         + post.path.read_text())
+    result = PostRunner(post, dpi=40).run()
+    blobs = BlobStore(tmp_path / "blobs")
+    directory = write_freeze(result, tmp_path / "_freeze", post=post,
+                             blobs=blobs)
+    assert directory == tmp_path / "_freeze" / "posts" / "post" / "index"
+    with open(directory / "execute-results" / "html.json") as f:
+        frozen = json.load(f)
+    markdown = frozen["result"]["markdown"]
+    assert markdown.startswith('---\ntitle: "A post"\n---\n\nSome *text*.\n')
+    assert "``` {.python .cell-code}\nimport matplotlib" in markdown
+    assert "::: {.cell-output .cell-output-stdout}\n```\nhello\n```" in markdown
+    # The code of the second cell is not shown, its figure is.
+    assert "plt.subplots" not in markdown
+    assert "![](index_files/figure-html/cell-3-output-1.png)" in markdown
+    # The figure is the blob of the image.
+    [blob] = blobs.files()
+    assert os.path.samefile(directory / "figure-html" / "cell-3-output-1.png",
+                            blob)
+
+
+def test_previews_are_not_frozen(make_post, tmp_path):
+    post = make_post("x = 1")
+    result = PostRunner(post).run()
+    result["preview"] = True
+    assert write_freeze(result, tmp_path / "_freeze", post=post,
+                        blobs=BlobStore(tmp_path / "blobs")) is None
+
+
+def test_test_renders_are_not_frozen(make_post, tmp_path):
+    from _blogbuild.build import write_result
+
+    result = PostRunner(make_post("x = 1")).run()
+    directory = write_result(result, tmp_path / "posts",
+                             BlobStore(tmp_path / "blobs"), freeze_dir=None,
+                             metrics=False)
+    assert sorted(os.listdir(directory)) == ["cells.json"]
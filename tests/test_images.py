@@ -0,0 +1,49 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from _blogbuild.images import ImageCache, optimize, recompress
+
+
+def _frames(rgb_arrays):
+    return [Image.fromarray(a.astype(np.uint8)) for a in rgb_arrays]
+
+
+def _decoded(data):
+    img = Image.open(io.BytesIO(data))
+    return [(np.asarray(frame.convert("RGB")), frame.info["duration"])
+            for frame in ImageSequence.Iterator(img)]
+
+
+def test_pngs_are_recompressed_losslessly():
+    img = Image.fromarray(np.repeat(np.arange(64, dtype=np.uint8), 64)
+                          .reshape(64, 64))
+    buf = io.BytesIO()
+    img.convert("RGBA").save(buf, "PNG", compress_level=0)
+    png = recompress(buf.getvalue())
+    assert len(png) < len(buf.getvalue())
+    assert Image.open(io.BytesIO(png)).convert("RGBA").tobytes() == \
+        img.convert("RGBA").tobytes()
+
+
+def test_gifs_are_recompressed_losslessly(tmp_path):
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, 4, (40, 60, 3)) * 64
+    b = a.copy()
+    b[:10, :10] = 255
+    frames = _frames([a, b])
+    buf = io.BytesIO()
+    frames[0].save(buf, "GIF", save_all=True, append_images=frames[1:],
+                   duration=[100, 300], loop=0, comment=b"x" * 1000)
+    path = tmp_path / "anim.gif"
+    path.write_bytes(buf.getvalue())
+    before, after = optimize([path], jobs=1,
+                             cache=ImageCache(tmp_path / "cache"),
+                             log=lambda *args: None)
+    assert after < before - 1000
+    assert "comment" not in Image.open(path).info
+    decoded = _decoded(path.read_bytes())
+    assert [d for _, d in decoded] == [100, 300]
+    np.testing.assert_array_equal(decoded[0][0], a)
+    np.testing.assert_array_equal(decoded[1][0], b)
@@ -0,0 +1,44 @@
+from _blogbuild.incremental import REPLAY, RUN, SERVE, cell_keys, plan
+
+# Cell 1 depends on cell 0 and cell 3 on cell 1; cell 2 is independent.
+GRAPH = [set(), {0}, set(), {1}]
+GRAPH_KEYS = ["a", "b", "c", "d"]
+PREFIX_KEYS = ["p0", "p1", "p2", "p3"]
+
+
+def _plan(previous, checkpoints=()):
+    return plan(GRAPH_KEYS, PREFIX_KEYS, GRAPH, dict.fromkeys(previous),
+                set(checkpoints))
+
+
+def test_unaffected_cells_are_served():
+    assert _plan("abcd") == (-1, [SERVE] * 4)
+
+
+def test_affected_cells_run_after_the_last_checkpoint():
+    assert _plan("abc", ["p1"]) == (1, [SERVE, SERVE, SERVE, RUN])
+    # A checkpoint after the first affected cell is of no use.
+    assert _plan("acd", ["p2"]) == (-1, [REPLAY, RUN, SERVE, SERVE])
+
+
+def test_ancestors_after_the_checkpoint_are_replayed():
+    assert _plan("abc") == (-1, [REPLAY, REPLAY, SERVE, RUN])
+    assert _plan("abc", ["p0"]) == (0, [SERVE, REPLAY, SERVE, RUN])
+
+
+def test_edits_change_the_graph_keys_of_the_dependent_cells(make_post):
+    before = make_post("k = 2", "x = k + 1", "y = 3", name="before")
+    after = make_post("k = 5", "x = k + 1", "y = 3", name="after")
+    keys = [cell_keys(post, post.code_cells())[0] for post in (before, after)]
+    assert [a != b for a, b in zip(*keys)] == [True, True, False]
+
+
+def test_import_cells_are_replayed_without_a_checkpoint(make_post):
+    before = make_post("import numpy as np", "a = np.arange(3)", "b = 2",
+                       name="before")
+    after = make_post("import numpy as np", "a = np.arange(4)", "b = 2",
+                      name="after")
+    previous, _, _ = cell_keys(before, before.code_cells())
+    graph_keys, prefix_keys, graph = cell_keys(after, after.code_cells())
+    assert plan(graph_keys, prefix_keys, graph, dict.fromkeys(previous),
+                set()) == (-1, [REPLAY, RUN, SERVE])
@@ -0,0 +1,37 @@
+import pytest
+
+from _blogbuild.jobqueue import DONE, FAILED, DirectoryQueue, SQLiteQueue
+
+
+@pytest.fixture(params=["sqlite", "directory"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteQueue(tmp_path / "queue.sqlite", max_attempts=2)
+    return DirectoryQueue(tmp_path / "queue", max_attempts=2)
+
+
+def test_jobs_are_claimed_in_order(queue):
+    queue.submit([("slow", {"n": 1}), ("quick", {"n": 2})])
+    assert queue.claim("w1", 60) == ("slow", {"n": 1})
+    assert queue.claim("w2", 60) == ("quick", {"n": 2})
+    assert queue.claim("w3", 60) is None
+
+
+def test_expired_leases_go_back_to_the_queue(queue):
+    queue.submit([("post", {})])
+    # A negative lease has expired already.
+    assert queue.claim("w1", -1) == ("post", {})
+    assert queue.claim("w2", 60) == ("post", {})
+    assert not queue.renew("post", "w1", 60)
+    assert not queue.finish("post", "w1", result={"by": "w1"})
+    assert queue.renew("post", "w2", 60)
+    assert queue.finish("post", "w2", result={"by": "w2"})
+    assert queue.results() == [("post", DONE, {"by": "w2"}, None)]
+
+
+def test_jobs_fail_after_too_many_expired_leases(queue):
+    queue.submit([("post", {})])
+    assert queue.claim("w1", -1) is not None
+    assert queue.claim("w2", -1) is not None
+    assert queue.claim("w3", 60) is None
+    assert queue.counts() == {FAILED: 1}
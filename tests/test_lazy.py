@@ -0,0 +1,35 @@
+import sys
+
+import pytest
+
+from _blogbuild.lazy import _matches, install, uninstall
+
+
+@pytest.fixture
+def lazy_package(tmp_path, monkeypatch):
+    (tmp_path / "mpl_lazy_test.py").write_text(
+        "import sys\n"
+        "sys.lazy_test_executed = True\n"
+        "value = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    finder = install(("mpl_*",))
+    yield
+    uninstall(finder)
+    sys.modules.pop("mpl_lazy_test", None)
+    vars(sys).pop("lazy_test_executed", None)
+
+
+def test_modules_run_when_first_used(lazy_package):
+    import mpl_lazy_test
+
+    assert not hasattr(sys, "lazy_test_executed")
+    assert mpl_lazy_test.value == 42
+    assert sys.lazy_test_executed
+
+
+def test_patterns_match_the_top_level_package():
+    patterns = ("mpl_*", "mplfonts")
+    assert _matches("mpl_visual_context.patheffects", patterns)
+    assert _matches("mplfonts", patterns)
+    assert not _matches("mplcyberpunk", patterns)
+    assert not _matches("matplotlib.mpl_x", patterns)
@@ -0,0 +1,53 @@
+from _blogbuild.listing import PostIndex
+from _blogbuild.thumbnails import METADATA, _publish, thumbnail_path
+
+
+def _write_post(posts_dir, name, header):
+    directory = posts_dir / name
+    directory.mkdir(parents=True)
+    (directory / "index.py").write_text(
+        "# ---\n" + "".join(f"# {line}\n" for line in header) + "# ---\n\n"
+        "# %%\nx = 1\n")
+
+
+def test_listing_refers_to_the_published_thumbnails(tmp_path):
+    posts_dir = tmp_path / "posts"
+    _write_post(posts_dir, "a", ['title: "A"', "date: 2024-01-02"])
+    _write_post(posts_dir, "b", ['title: "B"', "date: 2024-01-01",
+                                 "image: https://example.com/b.png"])
+    _write_post(posts_dir, "c", ['title: "C"', "date: 2023-12-31"])
+    _publish(thumbnail_path("a", posts_dir), b"png")
+    assert (posts_dir / "a" / "_metadata.yml").read_text() == METADATA
+    index = PostIndex(tmp_path / "index.json", posts_dir)
+    index.update()
+    listing = dict(index.listing())
+    assert listing["a"]["thumbnail"] == "posts/a/thumbnail.png"
+    assert "thumbnail" not in listing["b"]
+    assert "thumbnail" not in listing["c"]
+
+
+def test_hand_written_metadata_is_kept(tmp_path):
+    path = thumbnail_path("a", tmp_path)
+    path.parent.mkdir()
+    (tmp_path / "a" / "_metadata.yml").write_text("image: mine.png\n")
+    _publish(path, b"png")
+    assert (tmp_path / "a" / "_metadata.yml").read_text() == "image: mine.png\n"
+
+
+def test_only_changed_headers_are_read_again(tmp_path):
+    import shutil
+
+    posts_dir = tmp_path / "posts"
+    _write_post(posts_dir, "a", ['title: "A"', "date: 2024-01-02"])
+    _write_post(posts_dir, "b", ['title: "B"', "date: 2024-01-01"])
+    index = PostIndex(tmp_path / "index.json", posts_dir)
+    assert sorted(index.update()) == ["a", "b"]
+    assert PostIndex(tmp_path / "index.json", posts_dir).update() == []
+    (posts_dir / "a" / "index.py").write_text(
+        '# ---\n# title: "A, again"\n# draft: true\n# ---\n')
+    shutil.rmtree(posts_dir / "b")
+    index = PostIndex(tmp_path / "index.json", posts_dir)
+    assert index.update() == ["a"]
+    assert list(index.entries) == ["a"]
+    assert index.listing() == []
+    assert index.listing(drafts=True)[0][1]["title"] == "A, again"
@@ -0,0 +1,12 @@
+from _blogbuild.metrics import write_metrics
+from _blogbuild.runner import PostRunner
+
+
+def test_drafts_and_previews_have_no_metrics(make_post, tmp_path):
+    result = PostRunner(make_post("x = 1")).run()
+    output_dir = tmp_path / "output"
+    for key in ("draft", "preview"):
+        assert write_metrics(dict(result, **{key: True}), output_dir) is None
+    assert not output_dir.exists()
+    assert write_metrics(result, output_dir) == \
+        output_dir / "post" / "metrics.json"
@@ -0,0 +1,20 @@
+import os
+
+from _blogbuild.precompress import precompress
+
+
+def test_missing_siblings_are_written_again(tmp_path):
+    site = tmp_path / "site"
+    site.mkdir()
+    (site / "index.html").write_text("<p>compressible</p>\n" * 100)
+    (site / "small.css").write_text("p {}\n")
+    kwargs = dict(site_dir=site, jobs=1, state_file=tmp_path / "state.json",
+                  manifest_file=tmp_path / "manifest.json",
+                  log=lambda *args: None)
+    assert precompress(**kwargs) == 1
+    assert (site / "index.html.gz").exists()
+    assert not (site / "small.css.gz").exists()
+    assert precompress(**kwargs) == 0
+    os.remove(site / "index.html.gz")
+    assert precompress(**kwargs) == 1
+    assert (site / "index.html.gz").exists()
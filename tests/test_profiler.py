@@ -0,0 +1,54 @@
+import signal
+import sys
+
+import pytest
+
+from _blogbuild import profiler
+
+
+def _leaf():
+    profiler._sampler._sample(signal.SIGPROF, sys._getframe())
+
+
+def _busy(seconds):
+    import time
+
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def test_stacks_are_rooted_at_the_phases(monkeypatch):
+    sampler = profiler.Sampler()
+    monkeypatch.setattr(profiler, "_sampler", sampler)
+    _leaf()
+    with profiler.phase("cell 1 (line 3)"):
+        _leaf()
+        with profiler.phase("draw"):
+            _leaf()
+            _leaf()
+    assert sampler.stacks == {
+        "cell 1 (line 3);_leaf (tests/test_profiler.py:9)": 1,
+        "cell 1 (line 3);draw;_leaf (tests/test_profiler.py:9)": 2,
+    }
+
+
+@pytest.mark.skipif(not hasattr(signal, "setitimer"),
+                    reason="needs signal.setitimer")
+def test_cells_are_sampled():
+    profiler.start(0.001)
+    try:
+        _busy(0.05)
+        with profiler.phase("cell 1 (line 3)"):
+            _busy(0.2)
+    finally:
+        stacks = profiler.stop()
+    assert stacks
+    assert all(stack.startswith("cell 1 (line 3);_busy ") for stack in stacks)
+
+
+def test_write_collapsed(tmp_path):
+    path = profiler.write_collapsed(
+        "post", {"cell 2;f": 3, "cell 1;g;h": 1, "cell 1;g": 2}, tmp_path)
+    assert path == tmp_path / "post.collapsed"
+    assert path.read_text() == "cell 1;g 2\ncell 1;g;h 1\ncell 2;f 3\n"
@@ -0,0 +1,53 @@
+from _blogbuild.publish import diff, publish
+
+
+def test_diff():
+    previous = {"a.html": ["1", 1], "b.html": ["2", 2], "c.html": ["3", 3]}
+    current = {"a.html": ["1", 1], "b.html": ["4", 4], "d.html": ["5", 5]}
+    assert diff(current, previous) == (["b.html", "d.html"], ["c.html"])
+
+
+def test_diff_copies_the_files_missing_from_the_destination(tmp_path):
+    (tmp_path / "a.html").write_text("a")
+    current = {"a.html": ["1", 1], "b.html": ["2", 2]}
+    assert diff(current, current, tmp_path) == (["b.html"], [])
+
+
+def _publish(tmp_path, **kwargs):
+    return publish(tmp_path / "dest", site_dir=tmp_path / "site",
+                   manifest_file=tmp_path / "manifest.json",
+                   log=lambda *args: None, **kwargs)
+
+
+def test_only_the_changes_are_published(tmp_path):
+    site = tmp_path / "site"
+    site.mkdir()
+    for name in ["a.html", "b.html", "c.html"]:
+        (site / name).write_text(name)
+    assert _publish(tmp_path) == (["a.html", "b.html", "c.html"], [])
+    dest = tmp_path / "dest"
+    stamp = (dest / "a.html").stat().st_mtime_ns
+    (site / "b.html").write_text("changed")
+    (site / "c.html").unlink()
+    assert _publish(tmp_path, dry_run=True) == (["b.html"], ["c.html"])
+    assert (dest / "c.html").exists()
+    assert _publish(tmp_path) == (["b.html"], ["c.html"])
+    assert (dest / "a.html").stat().st_mtime_ns == stamp
+    assert (dest / "b.html").read_text() == "changed"
+    assert not (dest / "c.html").exists()
+    assert _publish(tmp_path) == ([], [])
+
+
+def test_removed_files_are_kept_without_delete(tmp_path):
+    site = tmp_path / "site"
+    site.mkdir()
+    for name in ["a.html", "b.html"]:
+        (site / name).write_text(name)
+    _publish(tmp_path)
+    (site / "b.html").unlink()
+    assert _publish(tmp_path, delete=False) == ([], [])
+    assert (tmp_path / "dest" / "b.html").exists()
+    # The file left in place is still in the manifest, so deleting it later
+    # removes it.
+    assert _publish(tmp_path) == ([], ["b.html"])
+    assert not (tmp_path / "dest" / "b.html").exists()
@@ -0,0 +1,35 @@
+import io
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from _blogbuild.rasterize import auto_rasterized, over_budget
+
+
+def _figure():
+    fig = Figure()
+    ax = fig.add_subplot()
+    x = np.linspace(0, 1, 20000)
+    (line,) = ax.plot(x, np.sin(50 * x))
+    bars = ax.bar([0, 1, 2], [1, 2, 3])
+    ax.set_title("a title")
+    return fig, line, bars
+
+
+def test_only_the_complex_artists_are_over_budget():
+    fig, line, bars = _figure()
+    selected = over_budget(fig)
+    assert [artist for artist, _, _ in selected] == [line]
+    assert selected[0][1] >= 20000
+    assert not any(patch in bars.patches for patch, _, _ in selected)
+
+
+def test_artists_are_rasterized_for_the_export_only():
+    fig, line, _ = _figure()
+    with auto_rasterized(fig) as selected:
+        assert line.get_rasterized()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="svg")
+    assert [artist for artist, _, _ in selected] == [line]
+    assert not line.get_rasterized()
+    assert b"<image" in buf.getvalue()
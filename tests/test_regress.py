@@ -0,0 +1,64 @@
+import base64
+import io
+
+import numpy as np
+
+from _blogbuild.regress import (MIN_SSIM, check_results, compare, ssim,
+                                update_golden)
+
+
+def _png(value, size=(16, 16)):
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.fromarray(np.full(size + (4,), value, np.uint8)).save(buf, "png")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def _result(name, *values, status="ok"):
+    outputs = [{"output_type": "display_data", "data": {"image/png": _png(v)}}
+               for v in values]
+    return {"name": name, "status": status,
+            "cells": [{"index": 0, "outputs": outputs}]}
+
+
+def test_failed_renders_are_not_stored(tmp_path):
+    results = [_result("a", 0, 255), _result("b", 0, status="error")]
+    assert update_golden(results, tmp_path) == (2, ["b"])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a"]
+
+
+def test_posts_without_results_fail(tmp_path):
+    golden, output = tmp_path / "golden", tmp_path / "regressions"
+    update_golden([_result("a", 0), _result("b", 0)], golden)
+    problems = check_results([_result("a", 0)], ["a", "b"], jobs=1,
+                             golden_dir=golden, output_dir=output,
+                             log=lambda *args: None)
+    assert problems == [("b", None, "no result", None, None)]
+
+
+def _stripes(offset=0):
+    rgba = np.full((40, 60, 4), 255, np.uint8)
+    for x in range(5 + offset, 60, 12):
+        rgba[:, x:x + 3, :3] = 0
+    return rgba
+
+
+def test_compare():
+    image = _stripes()
+    assert compare(image, image.copy())[:2] == (0., 1.)
+    lighter = image.copy()
+    lighter[..., :3] = np.maximum(lighter[..., :3], 5)
+    bad_fraction, similarity, bad = compare(image, lighter)
+    assert bad_fraction == 0 and not bad.any()
+    assert similarity > MIN_SSIM
+    bad_fraction, similarity, bad = compare(image, _stripes(offset=2))
+    assert bad_fraction == bad.mean() > 0.1
+    assert similarity < MIN_SSIM
+    assert compare(image, image[:-1]) == (1., 0., None)
+
+
+def test_ssim_of_small_images():
+    a = np.zeros((4, 4))
+    assert ssim(a, a) == 1.
+    assert ssim(a, a + 1) == 0.
@@ -0,0 +1,52 @@
+import base64
+import io
+
+from PIL import Image
+
+from _blogbuild.checkpoint import ForkSnapshots
+from _blogbuild.runner import PostRunner, use_agg
+
+
+def _image_sizes(result):
+    return [Image.open(io.BytesIO(base64.b64decode(output["data"]["image/png"])))
+            .size
+            for cell in result["cells"] for output in cell["outputs"]
+            if "image/png" in output.get("data", {})]
+
+
+def test_resumed_snapshot_renders_with_the_settings_of_the_resuming_runner(
+        make_post):
+    use_agg()
+    post = make_post("import matplotlib.pyplot as plt",
+                     "fig, ax = plt.subplots(figsize=(2, 2))")
+    snapshots = ForkSnapshots()
+    try:
+        # The preview takes the snapshots that the full render resumes.
+        preview = PostRunner(post, dpi=40, checkpoints=snapshots).run()
+        full = PostRunner(post, dpi=200, checkpoints=snapshots).run()
+    finally:
+        snapshots.close()
+    # The images are cropped to the figure contents: 5 times the dpi, about
+    # 5 times the size.
+    [(width, height)], [(full_width, full_height)] = (
+        _image_sizes(preview), _image_sizes(full))
+    assert abs(full_width / width - 5) < 0.25
+    assert abs(full_height / height - 5) < 0.25
+
+
+def test_redisplayed_figure_reuses_its_png_unless_changed(make_post):
+    use_agg()
+    post = make_post(
+        "import matplotlib.pyplot as plt\n"
+        "unit = 'm'\n"
+        "fig, ax = plt.subplots(figsize=(2, 2))\n"
+        "ax.xaxis.set_major_formatter(lambda x, pos: f'{x:g} {unit}')",
+        "fig",
+        "unit = 'km'",
+        "fig",
+        "ax.set_title('title')",
+        "fig")
+    result = PostRunner(post, dpi=40).run()
+    assert [cell["metrics"]["reused_pngs"] for cell in result["cells"]] == [
+        0, 1, 0, 0, 0, 0]
+    assert len(_image_sizes(result)) == 4
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from _blogbuild.watch import PostWatcher
+
+
+class _Post:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_renders_run_one_at_a_time_previews_first(monkeypatch):
+    runs = []
+    running = threading.Lock()
+
+    def run(self, post, preview, generation):
+        assert running.acquire(blocking=False), "concurrent renders"
+        try:
+            time.sleep(0.05)
+            runs.append((post.name, preview, generation))
+        finally:
+            running.release()
+        return {}
+
+    monkeypatch.setattr(PostWatcher, "_run", run)
+    watcher = PostWatcher(use_cache=False, log=lambda *args: None)
+    try:
+        a, b = _Post("a"), _Post("b")
+        watcher.render(a)
+        watcher.render(b)
+        watcher.render(b)  # Outdates the first edit of b.
+        deadline = time.monotonic() + 10
+        while len(runs) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        watcher.close()
+    assert runs == [("a", True, 1), ("b", True, 2),
+                    ("a", False, 1), ("b", False, 2)]
+
+
+def test_published_thumbnails_are_not_changes(tmp_path):
+    from _blogbuild.thumbnails import _publish, thumbnail_path
+    from _blogbuild.watch import PollingWatcher
+
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "index.py").write_text("x = 1\n")
+    watcher = PollingWatcher(tmp_path, interval=0.01)
+    _publish(thumbnail_path("a", tmp_path), b"png")
+    assert watcher.changes(timeout=0) == set()
+    (tmp_path / "a" / "index.py").write_text("x = 2\n")
+    assert watcher.changes(timeout=0) == {"a"}